@@ -7,38 +7,96 @@ __version__ = "1.0.0"
 __author__ = "Your Name"
 __description__ = "YouTube视频下载与百度网盘同步工具"
 
-# 导入下载模块功能
-from .download import (
-    VideoDownloader,
-    download_video,
-    get_video_info,
-    DownloadError,
-    get_downloader
-)
-
-# 导入百度网盘模块功能
-from .baidupan import (
-    BaiduPanUploader,
-    handle_upload
-)
-
-# 定义公开的API接口
-__all__ = [
+# 公开的API接口及其所在模块
+# 子模块按需导入：import core 不会加载 yt_dlp、requests、tqdm 等重量级依赖，
+# 本地消息主机可以在这些模块加载之前就响应 ping
+_EXPORTS = {
     # 下载相关
-    'VideoDownloader',
-    'download_video',
-    'get_video_info',
-    'DownloadError',
-    'get_downloader',
+    'VideoDownloader': 'download',
+    'VideoInfoCache': 'download',
+    'download_video': 'download',
+    'get_video_info': 'download',
+    'get_video_info_batch': 'download',
+    'DownloadError': 'download',
+    'get_downloader': 'download',
 
     # 百度网盘相关
-    'BaiduPanUploader',
-    'handle_upload',
-]
+    'BaiduPanUploader': 'baidupan',
+    'handle_upload': 'baidupan',
+    'handle_upload_batch': 'baidupan',
+    'choose_chunk_size': 'baidupan',
+    'AsyncBaiduPanUploader': 'async_uploader',
+
+    # 接口重试相关
+    'BaiduApiError': 'retry',
+    'RetryPolicy': 'retry',
+
+    # 文件指纹相关
+    'ContentDigest': 'fingerprint',
+    'FileFingerprint': 'fingerprint',
+    'FingerprintCache': 'fingerprint',
+    'StreamingFingerprinter': 'fingerprint',
+    'compute_content_digest': 'fingerprint',
+    'compute_fingerprint': 'fingerprint',
+    'get_fingerprint_cache': 'fingerprint',
+
+    # 断点续传相关
+    'UploadJournal': 'journal',
+    'get_upload_journal': 'journal',
+
+    # 远程索引相关
+    'RemoteIndex': 'remote_index',
+    'get_remote_index': 'remote_index',
+    'sync_remote_index': 'baidupan',
+    'ensure_remote_index': 'baidupan',
+
+    # 下载暂存区相关
+    'StagingArea': 'staging',
+    'StagingError': 'staging',
+    'get_staging_area': 'staging',
+
+    # 带宽调度相关
+    'BandwidthScheduler': 'bandwidth',
+    'TokenBucket': 'bandwidth',
+    'get_bandwidth_scheduler': 'bandwidth',
+
+    # 指标相关
+    'JobMetrics': 'metrics',
+    'MetricsRecorder': 'metrics',
+    'get_metrics': 'metrics',
+    'current_metrics': 'metrics',
+
+    # YoutubeDL实例池相关
+    'YoutubeDLPool': 'ydlpool',
+    'get_ydl_pool': 'ydlpool',
+
+    # 任务调度相关
+    'Job': 'jobs',
+    'JobScheduler': 'jobs',
+    'JobCancelled': 'jobs',
+}
+
+# 定义公开的API接口
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name):
+    """首次访问时才导入对应的子模块"""
+    module_name = _EXPORTS.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    import importlib
+    value = getattr(importlib.import_module(f'.{module_name}', __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
 
 # 包初始化代码
 def init_package():
-    """包初始化函数"""
+    """包初始化函数（配置日志并创建临时目录），由入口程序显式调用，导入时不再自动执行"""
     import os
     import logging
 
@@ -54,6 +112,3 @@ def init_package():
     os.makedirs(temp_dir, exist_ok=True)
 
     print(f"核心模块初始化完成，临时目录: {temp_dir}")
-
-# 自动初始化
-init_package()
\ No newline at end of file
@@ -0,0 +1,431 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+异步上传模块
+基于 httpx 的协程版百度网盘上传器：秒传、预创建、分片上传、创建文件的流程与
+BaiduPanUploader 一致，一个事件循环即可同时驱动多个文件的多个分片。
+pan.baidu.com 和 d.pcs.baidu.com 各自保持一组长连接，安装 h2 时使用 HTTP/2 多路复用。
+
+依赖为可选项：pip install "httpx[http2]"
+"""
+
+import os
+import json
+import asyncio
+import threading
+from contextlib import ExitStack
+from typing import Callable, Dict, Iterable, List, Optional, Set
+import logging
+
+from .bandwidth import BandwidthScheduler, BandwidthShare
+from .baidupan import (
+    DEFAULT_REMOTE_DIR, MAX_CHUNK_SIZE_BY_VIP, MIN_CHUNK_SIZE, BaiduPanUploader, _account_key, choose_chunk_size,
+    get_account_cache
+)
+from .fingerprint import (
+    DEFAULT_HASH_WORKERS, ContentDigest, FileFingerprint, FingerprintCache, compute_content_digest,
+    compute_fingerprint
+)
+from .journal import UploadJournal
+from .metrics import current_metrics
+from .retry import BaiduApiError, RetryBudget, RetryPolicy
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncBaiduPanUploader:
+    """协程版上传器，需在同一个事件循环中使用，用完后调用 aclose() 或使用 async with"""
+
+    def __init__(
+        self,
+        access_token: str,
+        upload_workers: int = 8,
+        max_connections: Optional[int] = None,
+        journal: Optional[UploadJournal] = None,
+        fingerprint_cache: Optional[FingerprintCache] = None,
+        bandwidth: Optional[BandwidthScheduler] = None,
+        chunk_size: Optional[int] = None,
+        retry_policy: Optional[RetryPolicy] = None,
+        hash_workers: int = DEFAULT_HASH_WORKERS,
+        http2: bool = True
+    ):
+        """
+        初始化异步上传器
+
+        Args:
+            access_token: 百度网盘访问令牌
+            upload_workers: 所有文件合计同时上传的分片数
+            max_connections: 连接池大小（每个主机），None则与并发数一致
+            journal: 上传会话日志，用于断点续传，None则不记录
+            fingerprint_cache: 文件指纹缓存，None则每次重新计算
+            bandwidth: 带宽调度器，None则不限速
+            chunk_size: 固定的分片大小，None则按文件大小和账号等级自动选择
+            retry_policy: 接口调用的重试策略，None则使用默认策略
+            hash_workers: 并行计算分片MD5的线程数，1为串行计算
+            http2: 是否使用HTTP/2（未安装 h2 时自动退回HTTP/1.1）
+        """
+        try:
+            import httpx
+        except ImportError as e:
+            raise ImportError('异步上传器需要 httpx，请执行: pip install "httpx[http2]"') from e
+        if http2:
+            try:
+                import h2  # noqa: F401
+            except ImportError:
+                logger.warning("未安装 h2，异步上传器使用 HTTP/1.1")
+                http2 = False
+
+        self.access_token = access_token
+        self.journal = journal
+        self.fingerprint_cache = fingerprint_cache
+        self.bandwidth = bandwidth
+        self.retry_policy = retry_policy if retry_policy is not None else RetryPolicy()
+        self.base_url = "https://pan.baidu.com/rest/2.0"
+        self.pcs_url = "https://d.pcs.baidu.com/rest/2.0/pcs"
+        self.chunk_size = chunk_size
+        self.upload_workers = max(1, upload_workers)
+        self.hash_workers = max(1, hash_workers)
+        self.http2 = http2
+        self._max_chunk_size: Optional[int] = None
+        # 所有文件共用的分片并发上限
+        self._part_slots = asyncio.Semaphore(self.upload_workers)
+        self._transport_errors = (httpx.TransportError,)
+
+        max_connections = max_connections or self.upload_workers
+        self.client = httpx.AsyncClient(
+            http2=http2,
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+            headers={'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'},
+        )
+
+    async def aclose(self):
+        """关闭连接池"""
+        await self.client.aclose()
+
+    async def __aenter__(self) -> 'AsyncBaiduPanUploader':
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.aclose()
+
+    async def _request(self, method: str, url: str, timeout: float = 30, **kwargs) -> Dict:
+        """发送一次接口请求并检查结果，连接错误和超时按可重试的BaiduApiError抛出"""
+        current_metrics().add('api_calls')
+        try:
+            response = await self.client.request(method, url, timeout=timeout, **kwargs)
+        except self._transport_errors as e:
+            raise BaiduApiError(f"连接错误: {e!r}", retryable=True) from e
+        return BaiduPanUploader._check_response(response)
+
+    async def get_max_chunk_size(self) -> int:
+        """账号允许的最大分片大小，与同步上传器共用账号信息缓存"""
+        if self._max_chunk_size is not None:
+            return self._max_chunk_size
+
+        key = _account_key(self.access_token)
+        vip_type = get_account_cache().get(key)
+        if vip_type is None:
+            try:
+                result = await self.retry_policy.call_async(
+                    self._request, 'GET', f"{self.base_url}/xpan/nas",
+                    params={'method': 'uinfo', 'access_token': self.access_token},
+                    description="查询账号信息")
+                vip_type = result.get('vip_type', 0)
+                get_account_cache().put(key, vip_type)
+            except Exception as e:
+                logger.warning(f"查询账号信息异常: {e}")
+
+        self._max_chunk_size = MAX_CHUNK_SIZE_BY_VIP.get(vip_type, MIN_CHUNK_SIZE)
+        return self._max_chunk_size
+
+    async def get_chunk_size(self, file_size: int) -> int:
+        """本文件使用的分片大小"""
+        if self.chunk_size:
+            return self.chunk_size
+        return choose_chunk_size(file_size, await self.get_max_chunk_size())
+
+    def _get_content_digest(self, file_path: str) -> ContentDigest:
+        """秒传所需的文件摘要（阻塞，在线程中调用）"""
+        with current_metrics().phase('hash'):
+            if self.fingerprint_cache is not None:
+                return self.fingerprint_cache.get_or_compute_digest(file_path)
+            return compute_content_digest(file_path)
+
+    def _get_file_fingerprint(self, file_path: str, block_size: int, digest: ContentDigest) -> FileFingerprint:
+        """分片上传所需的文件指纹（阻塞，在线程中调用）"""
+        if self.fingerprint_cache is not None:
+            fingerprint = self.fingerprint_cache.get(file_path, block_size)
+            if fingerprint is not None:
+                return fingerprint
+        fingerprint = FileFingerprint.from_digest(digest, block_size)
+        if fingerprint is None:
+            with current_metrics().phase('hash'):
+                fingerprint = compute_fingerprint(file_path, block_size, self.hash_workers, digest)
+        if self.fingerprint_cache is not None:
+            self.fingerprint_cache.put(file_path, fingerprint)
+        return fingerprint
+
+    async def rapid_upload(self, remote_path: str, digest: ContentDigest) -> Optional[Dict]:
+        """秒传文件，失败返回None"""
+        file_info = digest.to_file_info()
+        data = {
+            'path': remote_path,
+            'content-length': file_info['size'],
+            'content-md5': file_info['content_md5'],
+            'slice-md5': file_info['slice_md5'],
+            'content-crc32': '0'
+        }
+        try:
+            with current_metrics().phase('rapid_upload'):
+                result = await self.retry_policy.call_async(
+                    self._request, 'POST', f"{self.base_url}/xpan/file",
+                    params={'method': 'rapidupload', 'access_token': self.access_token}, data=data,
+                    description="秒传")
+            logger.info(f"秒传成功: {remote_path}")
+            return result
+        except BaiduApiError as e:
+            logger.info(f"秒传失败: {remote_path}: {e}")
+            return None
+
+    async def precreate_upload(self, remote_path: str, fingerprint: FileFingerprint) -> Optional[Dict]:
+        """预创建上传，失败返回None"""
+        data = {
+            'path': remote_path,
+            'size': fingerprint.size,
+            'isdir': 0,
+            'autoinit': 1,
+            'block_list': json.dumps(fingerprint.block_list),
+            'rtype': 1
+        }
+        try:
+            with current_metrics().phase('precreate'):
+                return await self.retry_policy.call_async(
+                    self._request, 'POST', f"{self.base_url}/xpan/file",
+                    params={'method': 'precreate', 'access_token': self.access_token}, data=data,
+                    description="预创建")
+        except BaiduApiError as e:
+            logger.error(f"预创建失败: {remote_path}: {e}")
+            return None
+
+    @staticmethod
+    def _read_part(file_path: str, partseq: int, chunk_size: int) -> bytes:
+        with open(file_path, 'rb') as f:
+            f.seek(partseq * chunk_size)
+            return f.read(chunk_size)
+
+    async def _upload_part(
+        self,
+        file_path: str,
+        uploadid: str,
+        remote_path: str,
+        partseq: int,
+        chunk_size: int,
+        cancel_event: Optional[threading.Event] = None,
+        bandwidth_share: Optional[BandwidthShare] = None,
+        retry_budget: Optional[RetryBudget] = None
+    ) -> int:
+        """上传单个分片，返回分片序号；同时在内存中的分片数不超过并发上限"""
+        should_abort = cancel_event.is_set if cancel_event is not None else None
+        async with self._part_slots:
+            if should_abort is not None and should_abort():
+                raise RuntimeError("上传已取消")
+            chunk = await asyncio.to_thread(self._read_part, file_path, partseq, chunk_size)
+            params = {
+                'method': 'upload',
+                'access_token': self.access_token,
+                'type': 'tmpfile',
+                'path': remote_path,
+                'uploadid': uploadid,
+                'partseq': partseq
+            }
+
+            async def send():
+                if bandwidth_share is not None:
+                    await asyncio.to_thread(bandwidth_share.throttle, len(chunk), should_abort)
+                return await self._request('POST', f"{self.pcs_url}/superfile2", timeout=60,
+                                           params=params, files={'file': (f'part{partseq}', chunk)})
+
+            metrics = current_metrics()
+            with metrics.phase('upload_part'):
+                await self.retry_policy.call_async(send, description=f"分片 {partseq}", budget=retry_budget,
+                                                   should_abort=should_abort)
+            metrics.add('bytes_uploaded', len(chunk))
+        return partseq
+
+    async def upload_slices(
+        self,
+        file_path: str,
+        uploadid: str,
+        remote_path: str,
+        chunk_size: int,
+        done_parts: Optional[Set[int]] = None,
+        on_part_done: Optional[Callable[[int], None]] = None,
+        cancel_event: Optional[threading.Event] = None,
+        on_part_failed: Optional[Callable[[Exception], None]] = None
+    ) -> bool:
+        """
+        并发上传文件的所有分片
+
+        Args:
+            file_path: 本地文件路径
+            uploadid: 预创建返回的uploadid
+            remote_path: 网盘路径
+            chunk_size: 分片大小，必须与预创建时分片MD5列表的分片大小一致
+            done_parts: 已确认的分片序号（续传时跳过）
+            on_part_done: 分片被服务端确认后的回调，参数为分片序号
+            cancel_event: 取消信号，置位后不再发送新的分片
+            on_part_failed: 分片最终失败时的回调，参数为异常
+
+        Returns:
+            所有分片均上传成功返回True
+        """
+        done_parts = done_parts or set()
+        file_size = os.path.getsize(file_path)
+        part_count = (file_size + chunk_size - 1) // chunk_size
+        pending_parts = [partseq for partseq in range(part_count) if partseq not in done_parts]
+        logger.info(f"开始上传分片: {remote_path}, 分片大小: {chunk_size}, 待上传: {len(pending_parts)}/{part_count}")
+
+        budget = RetryBudget(max(10, len(pending_parts) // 10))
+        with ExitStack() as stack:
+            share = stack.enter_context(self.bandwidth.share('upload')) if self.bandwidth else None
+            tasks = [
+                asyncio.create_task(self._upload_part(file_path, uploadid, remote_path, partseq, chunk_size,
+                                                      cancel_event, share, budget))
+                for partseq in pending_parts
+            ]
+            try:
+                for next_done in asyncio.as_completed(tasks):
+                    partseq = await next_done
+                    if on_part_done:
+                        on_part_done(partseq)
+                return True
+            except Exception as e:
+                logger.error(f"分片上传失败: {remote_path}: {e}")
+                if on_part_failed:
+                    on_part_failed(e)
+                # 取消未完成的分片，等待其退出后再返回
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+                return False
+
+    async def create_file(self, remote_path: str, uploadid: str, fingerprint: FileFingerprint) -> Optional[Dict]:
+        """创建文件（完成上传），失败返回None"""
+        try:
+            return await self._create_file(remote_path, uploadid, fingerprint)
+        except BaiduApiError as e:
+            logger.error(f"创建文件失败: {remote_path}: {e}")
+            return None
+
+    async def _create_file(self, remote_path: str, uploadid: str, fingerprint: FileFingerprint) -> Dict:
+        """发送创建文件请求，失败时抛出BaiduApiError"""
+        data = {
+            'path': remote_path,
+            'size': fingerprint.size,
+            'isdir': 0,
+            'block_list': json.dumps(fingerprint.block_list),
+            'uploadid': uploadid,
+        }
+        with current_metrics().phase('create'):
+            return await self.retry_policy.call_async(
+                self._request, 'POST', f"{self.base_url}/xpan/file",
+                params={'method': 'create', 'access_token': self.access_token}, data=data,
+                description="创建文件")
+
+    def _drop_session(self, file_path: str, error: Exception):
+        """不可重试的错误（uploadid失效、鉴权失败等）时结束上传会话，下次上传重新预创建"""
+        if self.journal and isinstance(error, BaiduApiError) and not error.retryable:
+            logger.warning(f"上传会话已不可用，丢弃: {file_path}: {error}")
+            self.journal.finish(file_path)
+
+    async def upload_file(
+        self,
+        file_path: str,
+        remote_dir: str = DEFAULT_REMOTE_DIR,
+        cancel_event: Optional[threading.Event] = None
+    ) -> Optional[Dict]:
+        """上传一个文件：先尝试秒传，失败则分片上传，返回网盘接口的结果，失败返回None"""
+        if not os.path.exists(file_path):
+            logger.error(f"文件不存在: {file_path}")
+            return None
+
+        filename = os.path.basename(file_path)
+        safe_filename = filename.replace('?', '_').replace('*', '_').replace('"', '_')
+        remote_path = f"{remote_dir}/{safe_filename}"
+
+        chunk_size = await self.get_chunk_size(os.path.getsize(file_path))
+        session = self.journal.find(file_path, remote_path, chunk_size) if self.journal else None
+        if session:
+            fingerprint = session.fingerprint
+            uploadid = session.uploadid
+            done_parts = set(session.done_parts)
+            logger.info(f"续传上传会话: uploadid={uploadid}, 已确认分片数: {len(done_parts)}")
+        else:
+            # 哈希计算在线程中进行，不阻塞其他文件的分片上传
+            digest = await asyncio.to_thread(self._get_content_digest, file_path)
+            rapid_result = await self.rapid_upload(remote_path, digest)
+            if rapid_result:
+                return rapid_result
+
+            fingerprint = await asyncio.to_thread(self._get_file_fingerprint, file_path, chunk_size, digest)
+            precreate_result = await self.precreate_upload(remote_path, fingerprint)
+            uploadid = precreate_result.get('uploadid') if precreate_result else None
+            if not uploadid:
+                logger.error(f"获取uploadid失败: {remote_path}")
+                return None
+
+            done_parts = set()
+            if self.journal:
+                self.journal.begin(file_path, remote_path, uploadid, fingerprint)
+
+        on_part_done = None
+        if self.journal:
+            def on_part_done(partseq: int):
+                self.journal.mark_part(file_path, uploadid, partseq)
+
+        if not await self.upload_slices(file_path, uploadid, remote_path, fingerprint.block_size,
+                                        done_parts=done_parts, on_part_done=on_part_done,
+                                        cancel_event=cancel_event,
+                                        on_part_failed=lambda e: self._drop_session(file_path, e)):
+            return None
+
+        try:
+            create_result = await self._create_file(remote_path, uploadid, fingerprint)
+        except BaiduApiError as e:
+            logger.error(f"创建文件失败: {remote_path}: {e}")
+            self._drop_session(file_path, e)
+            return None
+        if self.journal:
+            self.journal.finish(file_path)
+        return create_result
+
+    async def upload_files(
+        self,
+        file_paths: Iterable[str],
+        remote_dir: str = DEFAULT_REMOTE_DIR,
+        max_files: int = 4,
+        cancel_event: Optional[threading.Event] = None
+    ) -> List[Optional[Dict]]:
+        """
+        同时上传多个文件，分片并发总数仍受 upload_workers 限制
+
+        Args:
+            file_paths: 本地文件路径
+            remote_dir: 网盘目录
+            max_files: 同时进行的文件数（包括哈希计算阶段）
+            cancel_event: 取消信号
+
+        Returns:
+            与file_paths顺序一致的上传结果，失败的文件为None
+        """
+        file_slots = asyncio.Semaphore(max(1, max_files))
+
+        async def upload_one(file_path: str) -> Optional[Dict]:
+            async with file_slots:
+                try:
+                    return await self.upload_file(file_path, remote_dir, cancel_event)
+                except Exception as e:
+                    logger.error(f"上传过程异常: {file_path}: {e}")
+                    return None
+
+        return list(await asyncio.gather(*(upload_one(path) for path in file_paths)))
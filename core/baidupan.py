@@ -1,21 +1,132 @@
 import os
 import json
 import hashlib
-import requests
 import time
-from typing import Dict, Optional, Tuple, Any, List
-from tqdm import tqdm
+import threading
+import contextvars
+from contextlib import ExitStack
+from concurrent.futures import CancelledError, Future, ThreadPoolExecutor, as_completed
+from typing import Callable, Dict, Iterator, Optional, Set, Tuple, Any, List
 import logging
 
+from .cache import PersistentLRUCache
+from .bandwidth import BandwidthScheduler, BandwidthShare, get_bandwidth_scheduler
+from .fingerprint import (
+    DEFAULT_HASH_WORKERS, ContentDigest, FileFingerprint, FingerprintCache, compute_content_digest,
+    compute_fingerprint, get_fingerprint_cache, iter_blocks
+)
+from .journal import UploadJournal, get_upload_journal
+from .metrics import current_metrics, get_metrics
+from .remote_index import RemoteIndex, get_remote_index
+from .retry import BaiduApiError, RetryBudget, RetryPolicy
+
 logger = logging.getLogger(__name__)
 
+# 上传目录（应用目录）
+DEFAULT_REMOTE_DIR = "/apps/yt-download"
+# 分片大小下限（普通用户固定为4MB）
+MIN_CHUNK_SIZE = 4 * 1024 * 1024
+# 各会员等级允许的最大分片大小（vip_type: 0普通用户 1普通会员 2超级会员）
+MAX_CHUNK_SIZE_BY_VIP = {
+    0: 4 * 1024 * 1024,
+    1: 16 * 1024 * 1024,
+    2: 32 * 1024 * 1024,
+}
+# 分片数超过该值时加大分片，减少请求次数（仍保留足够的分片供并发上传）
+TARGET_PART_COUNT = 64
+# 账号等级缓存有效期（秒）
+ACCOUNT_INFO_TTL = 24 * 3600
+
+
+def choose_chunk_size(file_size: int, max_chunk_size: int = MIN_CHUNK_SIZE) -> int:
+    """
+    按文件大小选择分片大小
+
+    从4MB起倍增，直到分片数不超过 TARGET_PART_COUNT 或达到账号允许的上限
+    """
+    chunk_size = MIN_CHUNK_SIZE
+    while chunk_size < max_chunk_size and (file_size + chunk_size - 1) // chunk_size > TARGET_PART_COUNT:
+        chunk_size *= 2
+    return min(chunk_size, max(max_chunk_size, MIN_CHUNK_SIZE))
+
+
+# 账号信息缓存（访问令牌的哈希 -> uinfo中的vip_type）
+_account_cache = None
+
+
+def get_account_cache() -> PersistentLRUCache:
+    """获取账号信息缓存（单例模式）"""
+    global _account_cache
+    if _account_cache is None:
+        current_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        _account_cache = PersistentLRUCache(
+            max_entries=16,
+            cache_path=os.path.join(current_dir, 'tmp', 'account_cache.json'),
+            ttl=ACCOUNT_INFO_TTL
+        )
+    return _account_cache
+
+
+def _account_key(access_token: str) -> str:
+    # 不在缓存文件中保存令牌本身
+    return hashlib.sha256(access_token.encode()).hexdigest()[:16]
+
+
+def cached_max_chunk_size(access_token: str) -> int:
+    """从缓存读取账号允许的最大分片大小（不发起请求），未缓存时按普通用户处理"""
+    vip_type = get_account_cache().get(_account_key(access_token))
+    return MAX_CHUNK_SIZE_BY_VIP.get(vip_type, MIN_CHUNK_SIZE)
+
 
 class BaiduPanUploader:
-    def __init__(self, access_token: str):
+    def __init__(
+        self,
+        access_token: str,
+        upload_workers: int = 4,
+        pool_size: Optional[int] = None,
+        journal: Optional[UploadJournal] = None,
+        fingerprint_cache: Optional[FingerprintCache] = None,
+        bandwidth: Optional[BandwidthScheduler] = None,
+        chunk_size: Optional[int] = None,
+        retry_policy: Optional[RetryPolicy] = None,
+        hash_workers: int = DEFAULT_HASH_WORKERS
+    ):
+        """
+        初始化上传器
+
+        Args:
+            access_token: 百度网盘访问令牌
+            upload_workers: 并发上传的分片数，1为串行上传
+            pool_size: 每个主机的连接池大小，None则与并发数一致
+            journal: 上传会话日志，用于断点续传，None则不记录
+            fingerprint_cache: 文件指纹缓存，None则每次重新计算
+            bandwidth: 带宽调度器，None则不限速
+            chunk_size: 固定的分片大小，None则按文件大小和账号等级自动选择
+            retry_policy: 接口调用的重试策略，None则使用默认策略
+            hash_workers: 并行计算分片MD5的线程数，1为串行计算
+        """
         self.access_token = access_token
+        self.journal = journal
+        self.fingerprint_cache = fingerprint_cache
+        self.bandwidth = bandwidth
+        self.retry_policy = retry_policy if retry_policy is not None else RetryPolicy()
         self.base_url = "https://pan.baidu.com/rest/2.0"
-        self.chunk_size = 4 * 1024 * 1024  # 4MB分片
+        self.pcs_url = "https://d.pcs.baidu.com/rest/2.0/pcs"
+        self.chunk_size = chunk_size
+        self._max_chunk_size: Optional[int] = None
+        # 每个上传线程复用一个分片缓冲区
+        self._local = threading.local()
+        self.upload_workers = max(1, upload_workers)
+        self.hash_workers = max(1, hash_workers)
+        # requests 在首次创建上传器时才导入，避免拖慢本地消息主机启动
+        import requests
+        from requests.adapters import HTTPAdapter
         self.session = requests.Session()
+        # 每个主机保持足够的长连接，避免并发分片互相等待连接
+        pool_size = pool_size or self.upload_workers
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
         self.session.headers.update({
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
         })
@@ -24,7 +135,7 @@ class BaiduPanUploader:
         """计算文件MD5"""
         md5 = hashlib.md5()
         with open(file_path, 'rb') as f:
-            for chunk in iter(lambda: f.read(8192), b""):
+            for chunk in iter_blocks(f, 1024 * 1024):
                 md5.update(chunk)
         return md5.hexdigest()
 
@@ -36,34 +147,128 @@ class BaiduPanUploader:
         content_md5_slice = hashlib.md5(slice_md5.encode()).hexdigest()
         return slice_md5, content_md5_slice
 
+    def _request(self, method: str, url: str, timeout: float = 30, **kwargs) -> Dict:
+        """
+        发送一次接口请求并检查结果
+
+        HTTP错误、无法解析的响应以及errno/error_code非0时抛出BaiduApiError，
+        由重试策略决定是否重试
+        """
+        current_metrics().add('api_calls')
+        response = self.session.request(method, url, timeout=timeout, **kwargs)
+        return self._check_response(response)
+
+    @staticmethod
+    def _check_response(response: Any) -> Dict:
+        """解析接口响应（requests 或 httpx 的响应对象），失败时抛出BaiduApiError"""
+        try:
+            result = response.json()
+        except ValueError:
+            # 网关返回的错误页等非JSON响应
+            raise BaiduApiError(f"HTTP {response.status_code}: 无法解析的响应",
+                                status_code=response.status_code,
+                                retryable=response.status_code >= 500 or response.status_code == 200)
+
+        errno = result.get('errno', result.get('error_code', 0))
+        if response.status_code != 200 or errno != 0:
+            errmsg = result.get('errmsg') or result.get('error_msg') or '未知错误'
+            raise BaiduApiError(f"HTTP {response.status_code}, errno: {errno}, {errmsg}",
+                                errno=errno or None, status_code=response.status_code)
+        return result
+
+    def get_max_chunk_size(self) -> int:
+        """账号允许的最大分片大小，通过uinfo查询一次后缓存"""
+        if self._max_chunk_size is not None:
+            return self._max_chunk_size
+
+        key = _account_key(self.access_token)
+        vip_type = get_account_cache().get(key)
+        if vip_type is None:
+            try:
+                result = self.retry_policy.call(
+                    self._request, 'GET', f"{self.base_url}/xpan/nas",
+                    params={'method': 'uinfo', 'access_token': self.access_token},
+                    description="查询账号信息")
+                vip_type = result.get('vip_type', 0)
+                get_account_cache().put(key, vip_type)
+            except Exception as e:
+                logger.warning(f"查询账号信息异常: {e}")
+
+        # 查询失败时本实例按普通用户处理，不写入缓存
+        self._max_chunk_size = MAX_CHUNK_SIZE_BY_VIP.get(vip_type, MIN_CHUNK_SIZE)
+        logger.info(f"账号等级: vip_type={vip_type}, 最大分片: {self._max_chunk_size} 字节")
+        return self._max_chunk_size
+
+    def get_chunk_size(self, file_size: int) -> int:
+        """本文件使用的分片大小（指纹分片、分片上传和创建文件均以此为准）"""
+        if self.chunk_size:
+            return self.chunk_size
+        return choose_chunk_size(file_size, self.get_max_chunk_size())
+
+    def _get_content_digest(self, file_path: str) -> ContentDigest:
+        """秒传所需的文件摘要，优先使用缓存（包括下载期间按任意分片大小计算的指纹）"""
+        with current_metrics().phase('hash'):
+            if self.fingerprint_cache is not None:
+                return self.fingerprint_cache.get_or_compute_digest(file_path)
+            return compute_content_digest(file_path)
+
+    def _get_file_fingerprint(
+        self,
+        file_path: str,
+        block_size: Optional[int] = None,
+        digest: Optional[ContentDigest] = None
+    ) -> FileFingerprint:
+        """
+        计算文件指纹（全文MD5、前256KB MD5、分片MD5列表），优先使用缓存
+
+        已有文件摘要时只计算分片MD5列表；不超过一个分片的文件直接由摘要得出
+        """
+        if block_size is None:
+            block_size = self.get_chunk_size(os.path.getsize(file_path))
+        if self.fingerprint_cache is not None:
+            fingerprint = self.fingerprint_cache.get(file_path, block_size)
+            if fingerprint is not None:
+                logger.info(f"文件指纹缓存命中: {file_path}")
+                return fingerprint
+        fingerprint = FileFingerprint.from_digest(digest, block_size) if digest is not None else None
+        if fingerprint is None:
+            with current_metrics().phase('hash'):
+                fingerprint = compute_fingerprint(file_path, block_size, self.hash_workers, digest)
+        if self.fingerprint_cache is not None:
+            self.fingerprint_cache.put(file_path, fingerprint)
+        return fingerprint
+
     def _get_file_info(self, file_path: str) -> Dict:
         """获取文件信息（大小、MD5等）"""
-        file_size = os.path.getsize(file_path)
-        content_md5 = self._get_file_md5(file_path)
-        slice_md5, content_md5_slice = self._get_file_slice_md5(file_path)
+        return self._get_file_fingerprint(file_path).to_file_info()
 
-        return {
-            'size': file_size,
-            'content_md5': content_md5,
-            'slice_md5': slice_md5,
-            'content_md5_slice': content_md5_slice
-        }
     def _get_file_block_list(self, file_path: str) -> List:
-        block_list = []
-        # 计算分片MD5列表
-        with open(file_path, 'rb') as f:
-            while True:
-                chunk = f.read(self.chunk_size)
-                if not chunk:
-                    break
-                block_list.append(hashlib.md5(chunk).hexdigest())
-        return block_list
-
-    def rapid_upload(self, file_path: str, remote_path: str) -> Optional[Dict]:
-        """秒传文件"""
+        """计算分片MD5列表"""
+        return self._get_file_fingerprint(file_path).block_list
+
+    def prefetch_digest(self, file_path: str):
+        """
+        提前计算并缓存秒传所需的文件摘要，批量上传时在上传前一个文件期间调用
+
+        只算摘要：秒传命中时不需要分片MD5列表，未命中时 upload_file 再补算；
+        没有指纹缓存时无处保存结果，不做任何事
+        """
+        if self.fingerprint_cache is None:
+            return
+        self._get_content_digest(file_path)
+
+    def rapid_upload(
+        self,
+        file_path: str,
+        remote_path: str,
+        fingerprint: Optional[ContentDigest] = None
+    ) -> Optional[Dict]:
+        """秒传文件（传入文件摘要或指纹可避免重复读取文件）"""
         try:
-            file_info = self._get_file_info(file_path)
-            logger.info(f"秒传文件信息: size={file_info['size']}, md5={file_info['content_md5']}")
+            if fingerprint is None:
+                fingerprint = self._get_content_digest(file_path)
+            file_info = fingerprint.to_file_info()
+            logger.debug(f"秒传文件信息: size={file_info['size']}, md5={file_info['content_md5']}")
 
             url = f"{self.base_url}/xpan/file"
             params = {
@@ -79,27 +284,35 @@ class BaiduPanUploader:
                 'content-crc32': '0'  # CRC32可选，填0即可
             }
 
-            logger.info(f"秒传请求参数: {data}")
+            logger.debug(f"秒传请求参数: {data}")
 
-            response = self.session.post(url, params=params, data=data, timeout=30)
-            result = response.json()
-            logger.info(f"秒传响应: {result}")
-
-            if result.get('errno') == 0:
-                logger.info(f"秒传成功: {remote_path}")
-                return result
-            else:
-                logger.warning(f"秒传失败: {result.get('errmsg', '未知错误')}, errno: {result.get('errno')}")
-                return None
+            with current_metrics().phase('rapid_upload'):
+                result = self.retry_policy.call(self._request, 'POST', url, params=params, data=data,
+                                                description="秒传")
+            logger.info(f"秒传成功: {remote_path}")
+            logger.debug(f"秒传响应: {result}")
+            return result
 
+        except BaiduApiError as e:
+            logger.warning(f"秒传失败: {e}")
+            return None
         except Exception as e:
             logger.error(f"秒传请求异常: {e}")
             return None
 
-    def precreate_upload(self, file_path: str, remote_path: str, block_list: list) -> dict[str, Any] | None:
+    def precreate_upload(
+        self,
+        file_path: str,
+        remote_path: str,
+        block_list: Optional[list] = None,
+        fingerprint: Optional[FileFingerprint] = None
+    ) -> dict[str, Any] | None:
         """预创建上传（分片上传）"""
         try:
-            file_info = self._get_file_info(file_path)
+            if fingerprint is None:
+                fingerprint = self._get_file_fingerprint(file_path)
+            if block_list is None:
+                block_list = fingerprint.block_list
             url = f"{self.base_url}/xpan/file"
             params = {
                 'method': 'precreate',
@@ -108,72 +321,178 @@ class BaiduPanUploader:
 
             data = {
                 'path': remote_path,
-                'size': file_info['size'],
+                'size': fingerprint.size,
                 'isdir': 0,
                 'autoinit': 1,
                 'block_list': json.dumps(block_list),
                 'rtype': 1  # 重命名策略：重命名
             }
 
-            print(remote_path)
-            logger.info(f"预创建请求: {data}")
-
-            response = self.session.post(url, params=params, data=data, timeout=30)
-            result = response.json()
-            logger.info(f"预创建响应: {result}")
+            logger.debug(f"预创建请求: {data}")
 
-            if result.get('errno') == 0:
-                return result
-            else:
-                logger.error(f"预创建失败: {result.get('errmsg')}, errno: {result.get('errno')}")
-                return None
+            with current_metrics().phase('precreate'):
+                result = self.retry_policy.call(self._request, 'POST', url, params=params, data=data,
+                                                description="预创建")
+            logger.debug(f"预创建响应: {result}")
+            return result
 
+        except BaiduApiError as e:
+            logger.error(f"预创建失败: {e}")
+            return None
         except Exception as e:
             logger.error(f"预创建请求异常: {e}")
             return None
 
-    def upload_slices(self, file_path: str, uploadid: str, remote_path: str) -> bool:
-        """上传分片数据"""
+    def _read_part(self, file_path: str, partseq: int, chunk_size: int) -> memoryview:
+        """
+        把分片读入本线程复用的缓冲区
+
+        返回的memoryview在本线程读取下一个分片之前有效；requests 组装请求体时
+        直接从中复制，不再额外分配一个分片大小的bytes对象
+        """
+        buffer = getattr(self._local, 'buffer', None)
+        if buffer is None or len(buffer) != chunk_size:
+            buffer = self._local.buffer = bytearray(chunk_size)
+        view = memoryview(buffer)
+        n = 0
+        with open(file_path, 'rb', buffering=0) as f:
+            f.seek(partseq * chunk_size)
+            while n < chunk_size:
+                read = f.readinto(view[n:])
+                if not read:
+                    break
+                n += read
+        return view[:n]
+
+    def _upload_part(
+        self,
+        file_path: str,
+        uploadid: str,
+        remote_path: str,
+        partseq: int,
+        cancel_event: Optional[threading.Event] = None,
+        bandwidth_share: Optional[BandwidthShare] = None,
+        chunk_size: Optional[int] = None,
+        retry_budget: Optional[RetryBudget] = None
+    ) -> int:
+        """上传单个分片，临时错误按重试策略重试，返回该分片的字节数，最终失败时抛出异常"""
+        if cancel_event is not None and cancel_event.is_set():
+            raise RuntimeError("上传已取消")
+
+        chunk_size = chunk_size or self.get_chunk_size(os.path.getsize(file_path))
+        chunk = self._read_part(file_path, partseq, chunk_size)
+
+        should_abort = cancel_event.is_set if cancel_event is not None else None
+
+        url = f"{self.pcs_url}/superfile2"
+        params = {
+            'method': 'upload',
+            'access_token': self.access_token,
+            'type': 'tmpfile',
+            'path': remote_path,
+            'uploadid': uploadid,
+            'partseq': partseq
+        }
+
+        files = {'file': (f'part{partseq}', chunk)}
+
+        def send():
+            if bandwidth_share is not None:
+                # 同一任务的并发分片共用一个份额，重发的字节同样计入
+                bandwidth_share.throttle(len(chunk), should_abort)
+            return self._request('POST', url, timeout=60, params=params, files=files)
+
+        # 每个分片有独立的重试次数，同时消耗整个上传共享的重试预算
+        metrics = current_metrics()
+        with metrics.phase('upload_part'):
+            self.retry_policy.call(send, description=f"分片 {partseq}", budget=retry_budget,
+                                   should_abort=should_abort)
+        metrics.add('bytes_uploaded', len(chunk))
+        logger.debug(f"分片 {partseq} 上传成功")
+        return len(chunk)
+
+    def upload_slices(
+        self,
+        file_path: str,
+        uploadid: str,
+        remote_path: str,
+        workers: Optional[int] = None,
+        done_parts: Optional[Set[int]] = None,
+        on_part_done: Optional[Callable[[int], None]] = None,
+        cancel_event: Optional[threading.Event] = None,
+        chunk_size: Optional[int] = None,
+        on_part_failed: Optional[Callable[[int, Exception], None]] = None
+    ) -> bool:
+        """
+        上传分片数据
+
+        Args:
+            file_path: 本地文件路径
+            uploadid: 预创建返回的uploadid
+            remote_path: 网盘路径
+            workers: 并发上传的分片数，None则使用实例配置
+            done_parts: 已确认的分片序号（续传时跳过）
+            on_part_done: 分片被服务端确认后的回调，参数为分片序号
+            cancel_event: 取消信号，置位后不再发送新的分片
+            chunk_size: 分片大小，必须与预创建时分片MD5列表的分片大小一致，None则按文件大小选择
+            on_part_failed: 分片最终失败（重试后仍失败）时的回调，参数为分片序号和异常
+
+        Returns:
+            所有分片均上传成功返回True
+        """
+        workers = max(1, workers or self.upload_workers)
+        done_parts = done_parts or set()
         try:
             file_size = os.path.getsize(file_path)
-            logger.info(f"开始上传分片，文件大小: {file_size}")
-
-            with open(file_path, 'rb') as f, tqdm(
-                    total=file_size, unit='B', unit_scale=True, desc="上传进度"
-            ) as pbar:
-
-                partseq = 0
-                while True:
-                    chunk = f.read(self.chunk_size)
-                    if not chunk:
-                        break
-
-                    # 上传单个分片
-                    url = "https://d.pcs.baidu.com/rest/2.0/pcs/superfile2"
-                    params = {
-                        'method': 'upload',
-                        'access_token': self.access_token,
-                        'type': 'tmpfile',
-                        'path': remote_path,
-                        'uploadid': uploadid,
-                        'partseq': partseq
-                    }
-
-                    files = {'file': (f'part{partseq}', chunk)}
-
+            chunk_size = chunk_size or self.get_chunk_size(file_size)
+            part_count = (file_size + chunk_size - 1) // chunk_size
+            pending_parts = [partseq for partseq in range(part_count) if partseq not in done_parts]
+            done_bytes = sum(
+                min(chunk_size, file_size - partseq * chunk_size)
+                for partseq in range(part_count) if partseq in done_parts
+            )
+            logger.info(f"开始上传分片，文件大小: {file_size}, 分片大小: {chunk_size}, 分片数: {part_count}, "
+                        f"待上传: {len(pending_parts)}, 并发数: {workers}")
+
+            from tqdm import tqdm
+            with ExitStack() as stack:
+                pbar = stack.enter_context(
+                    tqdm(total=file_size, initial=done_bytes, unit='B', unit_scale=True, desc="上传进度"))
+                share = stack.enter_context(self.bandwidth.share('upload')) if self.bandwidth else None
+                # 整个文件的重试预算：偶发错误逐片重试，大面积失败时尽早停止
+                budget = RetryBudget(max(10, len(pending_parts) // 10))
+                executor = stack.enter_context(
+                    ThreadPoolExecutor(max_workers=workers, thread_name_prefix='superfile2'))
+                # 每个分片在当前上下文的副本中运行，分片耗时计入本任务的指标
+                futures = {
+                    executor.submit(contextvars.copy_context().run, self._upload_part, file_path, uploadid,
+                                    remote_path, partseq, cancel_event, share, chunk_size, budget): partseq
+                    for partseq in pending_parts
+                }
+                # 进度只在分片被服务端确认后更新
+                failed = False
+                for future in as_completed(futures):
+                    partseq = futures[future]
                     try:
-                        response = self.session.post(url, params=params, files=files, timeout=60)
-                        if response.status_code != 200:
-                            logger.error(f"分片 {partseq} 上传失败: {response.status_code}")
-                            return False
-                        logger.debug(f"分片 {partseq} 上传成功")
-
+                        part_size = future.result()
+                    except CancelledError:
+                        continue
                     except Exception as e:
-                        logger.error(f"分片 {partseq} 上传异常: {e}")
-                        return False
-
-                    partseq += 1
-                    pbar.update(len(chunk))
+                        logger.error(f"分片 {partseq} 上传失败: {e}")
+                        if on_part_failed:
+                            on_part_failed(partseq, e)
+                        if not failed:
+                            failed = True
+                            # 取消未开始的分片，已在传输中的分片仍会被确认并记录
+                            for pending in futures:
+                                pending.cancel()
+                        continue
+                    pbar.update(part_size)
+                    if on_part_done:
+                        on_part_done(partseq)
+
+            if failed:
+                return False
 
             logger.info("所有分片上传完成")
             return True
@@ -182,41 +501,101 @@ class BaiduPanUploader:
             logger.error(f"分片上传过程异常: {e}")
             return False
 
-    def create_file(self, size: int, remote_path: str, uploadid: str, block_list: list) -> Optional[Dict]:
-        """创建文件（完成上传）"""
+    def create_file(
+        self,
+        size: Optional[int],
+        remote_path: str,
+        uploadid: str,
+        block_list: Optional[list] = None,
+        fingerprint: Optional[FileFingerprint] = None
+    ) -> Optional[Dict]:
+        """创建文件（完成上传），传入fingerprint时以其大小和分片列表为准"""
         try:
-            url = f"{self.base_url}/xpan/file"
-            params = {
-                'method': 'create',
-                'access_token': self.access_token
-            }
-
-            data = {
-                'path': remote_path,
-                'size': size,
-                'isdir': 0,
-                'block_list': json.dumps(block_list),
-                'uploadid': uploadid,
-            }
-
-            logger.info(f"创建文件请求: {data}")
-
-            response = self.session.post(url, params=params, data=data, timeout=30)
-            result = response.json()
-            logger.info(f"创建文件响应: {result}")
-
-            if result.get('errno') == 0:
-                return result
-            else:
-                logger.error(f"创建文件失败: {result.get('errmsg')}, errno: {result.get('errno')}")
-                return None
-
+            if fingerprint is not None:
+                size = fingerprint.size
+                block_list = fingerprint.block_list
+            if size is None or block_list is None:
+                raise ValueError("缺少文件大小或分片MD5列表")
+            return self._create_file(size, remote_path, uploadid, block_list)
+
+        except BaiduApiError as e:
+            logger.error(f"创建文件失败: {e}")
+            return None
         except Exception as e:
             logger.error(f"创建文件请求异常: {e}")
             return None
 
-    def upload_file(self, file_path: str, remote_dir: str = "/apps/yt-download") -> Optional[Dict]:
-        """主上传方法：先尝试秒传，失败则分片上传"""
+    def _create_file(self, size: int, remote_path: str, uploadid: str, block_list: list) -> Dict:
+        """发送创建文件请求，失败时抛出BaiduApiError（调用方据此判断上传会话是否还能续传）"""
+        url = f"{self.base_url}/xpan/file"
+        params = {
+            'method': 'create',
+            'access_token': self.access_token
+        }
+
+        data = {
+            'path': remote_path,
+            'size': size,
+            'isdir': 0,
+            'block_list': json.dumps(block_list),
+            'uploadid': uploadid,
+        }
+
+        logger.debug(f"创建文件请求: {data}")
+
+        with current_metrics().phase('create'):
+            result = self.retry_policy.call(self._request, 'POST', url, params=params, data=data,
+                                            description="创建文件")
+        logger.debug(f"创建文件响应: {result}")
+        return result
+
+    def _drop_session(self, file_path: str, error: Exception):
+        """
+        上传会话遇到不可重试的错误（uploadid失效、鉴权失败等）时结束会话，
+        下次上传重新预创建，而不是在有效期内反复续传一个已失效的会话；
+        网络错误、服务端临时错误和取消保留会话
+        """
+        if self.journal and isinstance(error, BaiduApiError) and not error.retryable:
+            logger.warning(f"上传会话已不可用，丢弃: {file_path}: {error}")
+            self.journal.finish(file_path)
+
+    def list_files(self, remote_dir: str = DEFAULT_REMOTE_DIR, page_size: int = 1000) -> Iterator[Dict]:
+        """
+        分页列出网盘目录下的文件（xpan list 接口）
+
+        Args:
+            remote_dir: 网盘目录
+            page_size: 每页条目数（接口上限1000）
+
+        Yields:
+            文件信息（path、server_filename、fs_id、md5、size、isdir等）
+        """
+        url = f"{self.base_url}/xpan/file"
+        start = 0
+        while True:
+            params = {
+                'method': 'list',
+                'access_token': self.access_token,
+                'dir': remote_dir,
+                'start': start,
+                'limit': page_size,
+                'web': 0,
+            }
+            result = self.retry_policy.call(self._request, 'GET', url, params=params,
+                                            description=f"列出目录 {remote_dir}")
+            entries = result.get('list', [])
+            yield from entries
+            if len(entries) < page_size:
+                return
+            start += len(entries)
+
+    def upload_file(
+        self,
+        file_path: str,
+        remote_dir: str = DEFAULT_REMOTE_DIR,
+        cancel_event: Optional[threading.Event] = None
+    ) -> Optional[Dict]:
+        """主上传方法：先尝试秒传，失败则分片上传；cancel_event置位后中止分片上传"""
         # 已下载文件所处的路径
         # print(f"已下载文件所处的路径:{file_path}")
         if not os.path.exists(file_path):
@@ -225,67 +604,172 @@ class BaiduPanUploader:
 
         # 生成远程文件名（清理文件名中的特殊字符）
         filename = os.path.basename(file_path)
-        # 生成block_list
-        block_list = self._get_file_block_list(file_path)
         # 替换可能引起问题的字符
         safe_filename = filename.replace('?', '_').replace('*', '_').replace('"', '_')
         remote_path = f"{remote_dir}/{safe_filename}"
-        remote_path = "/apps/yt-download/于朦胧母亲的声明系伪造｜教美国教友躲避ICE抓人的择吉时法｜周末玄学大课堂：鬼遮眼实例与科学解读｜出门给儿童叫魂的定向秘法｜或疯或死出马仙的可怜下场｜ [Esk-pbgFaBI].webm"
 
         logger.info(f"开始上传: {filename} -> {remote_path}")
 
-        # 1. 尝试秒传
-        rapid_result = self.rapid_upload(file_path, remote_path)
-        if rapid_result:
-            return rapid_result
-
-        logger.info("秒传失败，开始分片上传...")
+        # 0. 查找未完成的上传会话，存在则直接续传
+        # 分片大小按文件大小和账号等级选择，指纹、续传会话、分片上传和创建文件保持一致
+        chunk_size = self.get_chunk_size(os.path.getsize(file_path))
+        session = self.journal.find(file_path, remote_path, chunk_size) if self.journal else None
+        if session:
+            fingerprint = session.fingerprint
+            uploadid = session.uploadid
+            done_parts = set(session.done_parts)
+            logger.info(f"续传上传会话: uploadid={uploadid}, 已确认分片数: {len(done_parts)}")
+        else:
+            # 1. 尝试秒传：只需要全文MD5和前256KB MD5，优先复用下载期间或之前计算的结果
+            digest = self._get_content_digest(file_path)
+            rapid_result = self.rapid_upload(file_path, remote_path, fingerprint=digest)
+            if rapid_result:
+                return rapid_result
+
+            logger.info("秒传失败，开始分片上传...")
+            # 分片上传才需要分片MD5列表，此时才计算（全文MD5沿用摘要）
+            fingerprint = self._get_file_fingerprint(file_path, chunk_size, digest=digest)
+
+            # 2. 分片上传
+            # 预创建
+            precreate_result = self.precreate_upload(file_path, remote_path, fingerprint=fingerprint)
+            if not precreate_result:
+                return None
 
-        # 2. 分片上传
-        # 预创建
-        precreate_result = self.precreate_upload(file_path, remote_path, block_list)
-        if not precreate_result:
-            return None
+            uploadid = precreate_result.get('uploadid')
+            if not uploadid:
+                logger.error("获取uploadid失败")
+                return None
 
-        uploadid = precreate_result.get('uploadid')
-        if not uploadid:
-            logger.error("获取uploadid失败")
-            return None
+            done_parts = set()
+            if self.journal:
+                self.journal.begin(file_path, remote_path, uploadid, fingerprint)
 
-        # 获取block_list（需要在precreate和create中使用相同的）
-        # block_list = precreate_result.get('block_list', [])
+        # 上传分片，每个确认的分片都写入日志
+        on_part_done = None
+        if self.journal:
+            def on_part_done(partseq: int):
+                self.journal.mark_part(file_path, uploadid, partseq)
 
-        # 上传分片
-        if not self.upload_slices(file_path, uploadid, remote_path):
+        if not self.upload_slices(file_path, uploadid, remote_path, done_parts=done_parts,
+                                  on_part_done=on_part_done, cancel_event=cancel_event,
+                                  chunk_size=fingerprint.block_size,
+                                  on_part_failed=lambda partseq, e: self._drop_session(file_path, e)):
             return None
 
         # 创建文件
-        create_result = self.create_file(os.path.getsize(file_path), remote_path, uploadid, block_list)
+        try:
+            create_result = self._create_file(fingerprint.size, remote_path, uploadid, fingerprint.block_list)
+        except Exception as e:
+            logger.error(f"创建文件失败: {e}")
+            # 临时错误时保留会话，重试时只需重新创建文件
+            self._drop_session(file_path, e)
+            return None
+        if self.journal:
+            self.journal.finish(file_path)
         return create_result
 
 
-def handle_upload(video_id: str, local_path: str, access_token: str) -> Dict:
-    """处理上传请求"""
-    logger.info(f"处理上传请求: video_id={video_id}, local_path={local_path}")
+def _remote_file_info(result: Dict) -> Dict:
+    """create 直接返回文件信息，rapidupload 的文件信息在 info 字段中"""
+    return result.get('info') or result
 
-    # 检查访问令牌
-    if not access_token or access_token == '你的访问令牌':
-        return {
-            'status': 'error',
-            'message': '百度访问令牌未设置或无效',
-            'videoId': video_id
-        }
 
+def sync_remote_index(
+    access_token: str,
+    remote_dir: str = DEFAULT_REMOTE_DIR,
+    remote_index: Optional[RemoteIndex] = None
+) -> int:
+    """列出网盘上传目录并重建远程索引，返回索引到的视频数"""
+    remote_index = remote_index if remote_index is not None else get_remote_index()
     uploader = BaiduPanUploader(access_token)
+    return remote_index.rebuild(remote_dir, uploader.list_files(remote_dir))
 
+
+_index_sync_lock = threading.Lock()
+
+
+def ensure_remote_index(
+    access_token: str,
+    remote_dir: str = DEFAULT_REMOTE_DIR,
+    remote_index: Optional[RemoteIndex] = None
+) -> bool:
+    """
+    上传前按需建立远程索引：索引文件不存在时列出网盘目录重建
+
+    失败只记录日志和失败时间（此后一段时间内不再自动重试），不影响上传本身
+
+    Returns:
+        索引是否可用
+    """
+    remote_index = remote_index if remote_index is not None else get_remote_index()
+    with _index_sync_lock:
+        if not remote_index.needs_sync():
+            return os.path.exists(remote_index.index_path)
+        try:
+            sync_remote_index(access_token, remote_dir, remote_index)
+            return True
+        except Exception as e:
+            logger.warning(f"建立远程索引失败: {e}")
+            remote_index.mark_sync_failed(e)
+            return False
+
+
+# 访问令牌 -> 长期复用的上传器（连接池和账号等级查询结果随之复用）
+_uploaders: Dict[str, BaiduPanUploader] = {}
+_uploaders_lock = threading.Lock()
+
+
+def get_uploader(access_token: str) -> BaiduPanUploader:
+    """获取该访问令牌的共享上传器（使用全局上传日志、指纹缓存和带宽调度器）"""
+    with _uploaders_lock:
+        uploader = _uploaders.get(access_token)
+        if uploader is None:
+            uploader = _uploaders[access_token] = BaiduPanUploader(
+                access_token,
+                journal=get_upload_journal(),
+                fingerprint_cache=get_fingerprint_cache(),
+                bandwidth=get_bandwidth_scheduler()
+            )
+        return uploader
+
+
+def _invalid_token(access_token: str) -> bool:
+    return not access_token or access_token == '你的访问令牌'
+
+
+def _upload_one(
+    uploader: BaiduPanUploader,
+    video_id: str,
+    local_path: str,
+    cancel_event: Optional[threading.Event] = None
+) -> Dict:
+    """上传一个文件，各阶段耗时、字节数和重试次数记入本文件的指标"""
+    with get_metrics().job('upload', video_id) as metrics:
+        response = _upload_response(uploader, video_id, local_path, cancel_event)
+        metrics.labels['status'] = response['status']
+        return response
+
+
+def _upload_response(
+    uploader: BaiduPanUploader,
+    video_id: str,
+    local_path: str,
+    cancel_event: Optional[threading.Event] = None
+) -> Dict:
+    """上传一个文件并转换为应答格式，成功后记入远程索引"""
     try:
-        result = uploader.upload_file(local_path)
+        result = uploader.upload_file(local_path, cancel_event=cancel_event)
 
         if result and result.get('errno') == 0:
+            info = _remote_file_info(result)
+            # 上传时算好的本地内容摘要已在指纹缓存中，这里只查缓存
+            digest = uploader.fingerprint_cache.get_digest(local_path) if uploader.fingerprint_cache else None
+            get_remote_index().record(video_id, info, content_md5=digest.content_md5 if digest else None)
             return {
                 'status': 'success',
-                'fs_id': result.get('fs_id', ''),
-                'path': result.get('path', ''),
+                'fs_id': info.get('fs_id', ''),
+                'path': info.get('path', ''),
                 'videoId': video_id,
                 'message': '上传成功'
             }
@@ -306,3 +790,99 @@ def handle_upload(video_id: str, local_path: str, access_token: str) -> Dict:
             'videoId': video_id
         }
 
+
+def handle_upload(
+    video_id: str,
+    local_path: str,
+    access_token: str,
+    cancel_event: Optional[threading.Event] = None
+) -> Dict:
+    """处理上传请求，cancel_event用于取消正在进行的上传（已确认的分片保留在日志中），成功后记入远程索引"""
+    logger.info(f"处理上传请求: video_id={video_id}, local_path={local_path}")
+
+    # 检查访问令牌
+    if _invalid_token(access_token):
+        return {
+            'status': 'error',
+            'message': '百度访问令牌未设置或无效',
+            'videoId': video_id
+        }
+
+    # 使用共享上传器：复用连接池，并通过全局上传日志和指纹缓存跳过已上传的分片和重复的哈希计算
+    return _upload_one(get_uploader(access_token), video_id, local_path, cancel_event)
+
+
+def handle_upload_batch(
+    files: List[Dict[str, Any]],
+    access_token: str,
+    cancel_events: Optional[List[Optional[threading.Event]]] = None,
+    on_result: Optional[Callable[[int, Dict], None]] = None,
+    on_start: Optional[Callable[[int], None]] = None
+) -> Dict:
+    """
+    批量上传文件：所有文件共用一个上传器，上传第N个文件时在后台计算第N+1个文件的秒传摘要
+
+    Args:
+        files: 待上传文件列表，每项为 {'videoId': ..., 'localPath': ...}
+        access_token: 百度网盘访问令牌
+        cancel_events: 与files一一对应的取消信号，置位的文件跳过或中止上传
+        on_result: 每个文件完成后的回调，参数为文件序号和handle_upload格式的结果
+        on_start: 每个文件开始上传时的回调，参数为文件序号（跳过的文件不调用）
+
+    Returns:
+        {'status': 'success'|'partial'|'error', 'results': [...], 'succeeded': 成功数, 'failed': 失败数}
+    """
+    logger.info(f"处理批量上传请求: {len(files)} 个文件")
+    cancel_events = cancel_events or [None] * len(files)
+    results: List[Dict] = []
+
+    def report(index: int, result: Dict):
+        results.append(result)
+        if on_result:
+            on_result(index, result)
+
+    if _invalid_token(access_token):
+        for index, item in enumerate(files):
+            report(index, {'status': 'error', 'message': '百度访问令牌未设置或无效', 'videoId': item.get('videoId')})
+    else:
+        uploader = get_uploader(access_token)
+
+        def prefetch(index: int) -> Optional[Future]:
+            """在后台计算第index个文件的秒传摘要，文件不存在或已取消时跳过"""
+            if index >= len(files):
+                return None
+            event = cancel_events[index]
+            path = files[index].get('localPath')
+            if not path or not os.path.exists(path) or (event is not None and event.is_set()):
+                return None
+            return prefetcher.submit(uploader.prefetch_digest, path)
+
+        with ThreadPoolExecutor(max_workers=1, thread_name_prefix='prefetch') as prefetcher:
+            pending = prefetch(0)
+            for index, item in enumerate(files):
+                video_id, local_path = item.get('videoId'), item.get('localPath')
+                # 等本文件的摘要算完再开始上传，避免与预取重复读取文件
+                if pending is not None:
+                    try:
+                        pending.result()
+                    except Exception as e:
+                        logger.warning(f"预取文件摘要失败: {local_path}: {e}")
+                pending = prefetch(index + 1)
+
+                event = cancel_events[index]
+                if event is not None and event.is_set():
+                    report(index, {'status': 'cancelled', 'message': '任务已取消', 'videoId': video_id})
+                elif not local_path or not os.path.exists(local_path):
+                    report(index, {'status': 'error', 'message': f'文件不存在: {local_path}', 'videoId': video_id})
+                else:
+                    if on_start:
+                        on_start(index)
+                    report(index, _upload_one(uploader, video_id, local_path, event))
+
+    succeeded = sum(1 for result in results if result['status'] == 'success')
+    failed = len(results) - succeeded
+    if not failed:
+        status = 'success'
+    else:
+        status = 'partial' if succeeded else 'error'
+    return {'status': status, 'results': results, 'succeeded': succeeded, 'failed': failed}
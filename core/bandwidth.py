@@ -0,0 +1,234 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+带宽调度模块
+上传和下载各有一个总带宽预算，在所有活跃任务之间平均分配；
+每个任务使用自己份额的令牌桶限速，限额可在运行时调整
+"""
+
+import os
+import time
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, TYPE_CHECKING
+import logging
+
+if TYPE_CHECKING:
+    import yt_dlp
+
+logger = logging.getLogger(__name__)
+
+DIRECTIONS = ('download', 'upload')
+
+
+class TokenBucket:
+    """令牌桶限速器（线程安全），rate为None时不限速"""
+
+    def __init__(self, rate: Optional[float] = None, burst: float = 1.0):
+        """
+        初始化令牌桶
+
+        Args:
+            rate: 速率（字节/秒），None则不限速
+            burst: 桶容量对应的秒数（允许的突发量为 rate * burst）
+        """
+        self.burst = burst
+        self._lock = threading.Lock()
+        self._rate = rate
+        self._tokens = self._capacity()
+        self._updated = time.monotonic()
+
+    def _capacity(self) -> float:
+        return (self._rate or 0) * self.burst
+
+    def _refill(self, now: float):
+        if self._rate:
+            self._tokens = min(self._capacity(), self._tokens + (now - self._updated) * self._rate)
+        self._updated = now
+
+    @property
+    def rate(self) -> Optional[float]:
+        return self._rate
+
+    def set_rate(self, rate: Optional[float]):
+        """调整速率，已欠下的令牌保留"""
+        with self._lock:
+            self._refill(time.monotonic())
+            self._rate = rate
+            self._tokens = min(self._tokens, self._capacity())
+
+    def consume(self, nbytes: int, should_abort: Optional[Callable[[], bool]] = None):
+        """
+        取出nbytes个令牌，不足时等待
+
+        单次请求可以超过桶容量（例如一个4MB分片），此时令牌记为负数，
+        调用方等待到欠账还清为止，长期平均速率仍为rate。
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            if not self._rate:
+                return
+            self._tokens -= nbytes
+            wait = -self._tokens / self._rate if self._tokens < 0 else 0.0
+
+        deadline = time.monotonic() + wait
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            if should_abort is not None and should_abort():
+                raise RuntimeError("限速等待时任务被取消")
+            time.sleep(min(remaining, 0.5))
+
+
+class BandwidthShare:
+    """一个任务在某个方向上的带宽份额"""
+
+    def __init__(self, direction: str, on_rate: Optional[Callable[[Optional[float]], None]] = None):
+        self.direction = direction
+        self.on_rate = on_rate
+        self.bucket = TokenBucket()
+
+    @property
+    def rate(self) -> Optional[float]:
+        return self.bucket.rate
+
+    def set_rate(self, rate: Optional[float]):
+        self.bucket.set_rate(rate)
+        if self.on_rate is not None:
+            self.on_rate(rate)
+
+    def throttle(self, nbytes: int, should_abort: Optional[Callable[[], bool]] = None):
+        """按本任务的份额为nbytes字节限速"""
+        self.bucket.consume(nbytes, should_abort)
+
+
+class BandwidthScheduler:
+    """
+    带宽调度器
+
+    每个方向的总限额在该方向的活跃任务之间平均分配，任务开始或结束、
+    限额调整时重新分配。None 表示不限速。
+    """
+
+    def __init__(self, download_limit: Optional[float] = None, upload_limit: Optional[float] = None):
+        """
+        初始化带宽调度器
+
+        Args:
+            download_limit: 下载总带宽（字节/秒），None则不限速
+            upload_limit: 上传总带宽（字节/秒），None则不限速
+        """
+        self._lock = threading.Lock()
+        self._limits: Dict[str, Optional[float]] = {'download': None, 'upload': None}
+        self._shares: Dict[str, List[BandwidthShare]] = {d: [] for d in DIRECTIONS}
+        self.set_limits(download=download_limit, upload=upload_limit)
+
+    @staticmethod
+    def _normalize(limit: Optional[float]) -> Optional[float]:
+        if limit is None or limit <= 0:
+            return None
+        return float(limit)
+
+    def _rebalance(self, direction: str):
+        """重新计算该方向每个任务的份额（需持有锁）"""
+        shares = self._shares[direction]
+        limit = self._limits[direction]
+        rate = limit / len(shares) if limit and shares else None
+        for share in shares:
+            share.set_rate(rate)
+
+    def set_limits(self, **limits: Optional[float]) -> Dict[str, Optional[float]]:
+        """
+        调整总限额，未给出的方向保持不变
+
+        Args:
+            download: 下载总带宽（字节/秒），None或0表示不限速
+            upload: 上传总带宽（字节/秒），None或0表示不限速
+
+        Returns:
+            调整后的限额
+        """
+        unknown = set(limits) - set(DIRECTIONS)
+        if unknown:
+            raise ValueError(f"未知的带宽方向: {', '.join(sorted(unknown))}")
+        with self._lock:
+            for direction, limit in limits.items():
+                self._limits[direction] = self._normalize(limit)
+                self._rebalance(direction)
+            if limits:
+                logger.info(f"带宽限额: {self._limits}")
+            return dict(self._limits)
+
+    def limits(self) -> Dict[str, Any]:
+        """当前限额及各方向的活跃任务数"""
+        with self._lock:
+            return {
+                'download': self._limits['download'],
+                'upload': self._limits['upload'],
+                'active': {d: len(self._shares[d]) for d in DIRECTIONS},
+            }
+
+    @contextmanager
+    def share(
+        self,
+        direction: str,
+        on_rate: Optional[Callable[[Optional[float]], None]] = None
+    ) -> Iterator[BandwidthShare]:
+        """
+        在任务执行期间占用一个带宽份额
+
+        Args:
+            direction: 'download' 或 'upload'
+            on_rate: 份额变化时的回调（参数为新的速率，None表示不限速）
+        """
+        if direction not in DIRECTIONS:
+            raise ValueError(f"未知的带宽方向: {direction}")
+        share = BandwidthShare(direction, on_rate)
+        with self._lock:
+            self._shares[direction].append(share)
+            self._rebalance(direction)
+        try:
+            yield share
+        finally:
+            with self._lock:
+                self._shares[direction].remove(share)
+                self._rebalance(direction)
+
+    @contextmanager
+    def limit_ydl(self, ydl: 'yt_dlp.YoutubeDL') -> Iterator[BandwidthShare]:
+        """
+        在下载期间把本任务的下载份额写入ydl的ratelimit选项
+
+        yt-dlp 的下载器在每个数据块之后读取 params['ratelimit']，
+        因此份额变化对正在进行的下载立即生效；结束后恢复原来的设置。
+        """
+        original = ydl.params.get('ratelimit')
+
+        def apply(rate: Optional[float]):
+            rates = [r for r in (rate, original) if r]
+            ydl.params['ratelimit'] = min(rates) if rates else None
+
+        try:
+            with self.share('download', on_rate=apply) as share:
+                yield share
+        finally:
+            ydl.params['ratelimit'] = original
+
+
+# 全局带宽调度器
+_default_scheduler = None
+
+
+def get_bandwidth_scheduler() -> BandwidthScheduler:
+    """获取带宽调度器（单例模式），初始限额由环境变量 YT_DOWNLOAD_RATELIMIT / YT_UPLOAD_RATELIMIT（字节/秒）配置"""
+    global _default_scheduler
+    if _default_scheduler is None:
+        download_limit = os.getenv('YT_DOWNLOAD_RATELIMIT')
+        upload_limit = os.getenv('YT_UPLOAD_RATELIMIT')
+        _default_scheduler = BandwidthScheduler(
+            download_limit=float(download_limit) if download_limit else None,
+            upload_limit=float(upload_limit) if upload_limit else None
+        )
+    return _default_scheduler
@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+通用缓存模块
+线程安全的LRU缓存，可选过期时间，可选持久化到JSON文件
+"""
+
+import os
+import json
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class PersistentLRUCache:
+    """按条目数淘汰的LRU缓存，值必须可JSON序列化"""
+
+    def __init__(self, max_entries: int = 1024, cache_path: Optional[str] = None, ttl: Optional[float] = None):
+        """
+        初始化缓存
+
+        Args:
+            max_entries: 最大条目数，超出时淘汰最久未使用的条目
+            cache_path: 持久化文件路径，None则只保存在内存中
+            ttl: 条目有效期（秒），None则永不过期
+        """
+        self.max_entries = max(1, max_entries)
+        self.cache_path = cache_path
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        # 键 -> (值, 写入时间)
+        self._data: 'OrderedDict[str, Tuple[Any, float]]' = OrderedDict()
+
+        if self.cache_path:
+            os.makedirs(os.path.dirname(os.path.abspath(self.cache_path)), exist_ok=True)
+            self._load()
+
+    def _load(self):
+        """从文件加载缓存（按最近使用顺序保存）"""
+        if not os.path.exists(self.cache_path):
+            return
+        try:
+            with open(self.cache_path, 'r', encoding='utf-8') as f:
+                entries = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"缓存文件损坏，已忽略: {self.cache_path}: {e}")
+            return
+        for entry in entries:
+            # 兼容旧格式 [键, 值]
+            key, value = entry[0], entry[1]
+            stored_at = entry[2] if len(entry) > 2 else time.time()
+            self._data[key] = (value, stored_at)
+        self._evict()
+
+    def _save(self):
+        """原子地写回缓存文件"""
+        if not self.cache_path:
+            return
+        tmp_path = self.cache_path + '.tmp'
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump([[key, value, stored_at] for key, (value, stored_at) in self._data.items()],
+                          f, ensure_ascii=False)
+            os.replace(tmp_path, self.cache_path)
+        except OSError as e:
+            logger.warning(f"写入缓存文件失败: {self.cache_path}: {e}")
+
+    def _expired(self, stored_at: float) -> bool:
+        return self.ttl is not None and time.time() - stored_at > self.ttl
+
+    def _evict(self):
+        if self.ttl is not None:
+            for key in [k for k, (_, stored_at) in self._data.items() if self._expired(stored_at)]:
+                del self._data[key]
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+
+    def get(self, key: str) -> Optional[Any]:
+        """读取缓存，命中时标记为最近使用，过期条目视为未命中"""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            if self._expired(entry[1]):
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return entry[0]
+
+    def put(self, key: str, value: Any):
+        """写入缓存并持久化"""
+        with self._lock:
+            self._data[key] = (value, time.time())
+            self._data.move_to_end(key)
+            self._evict()
+            self._save()
+
+    def pop(self, key: str) -> Optional[Any]:
+        """删除缓存条目"""
+        with self._lock:
+            entry = self._data.pop(key, None)
+            if entry is None:
+                return None
+            self._save()
+            return entry[0]
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._data.clear()
+            self._save()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._data)
+
+    def __contains__(self, key: str) -> bool:
+        return self.get(key) is not None
+
+    def items(self) -> Dict[str, Any]:
+        """返回未过期缓存内容的快照"""
+        with self._lock:
+            return {key: value for key, (value, stored_at) in self._data.items() if not self._expired(stored_at)}
@@ -7,11 +7,24 @@
 
 import os
 import sys
+import copy
+import time
 import tempfile
-import yt_dlp
-from typing import Callable, Optional, Dict, Any
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Optional, Dict, Any, Iterable, Iterator, List, TYPE_CHECKING
 import logging
 
+if TYPE_CHECKING:
+    import yt_dlp
+
+from .bandwidth import BandwidthScheduler
+from .cache import PersistentLRUCache
+from .fingerprint import StreamingFingerprinter, get_fingerprint_cache
+from .metrics import current_metrics
+from .staging import StagingArea
+from .ydlpool import YoutubeDLPool, get_ydl_pool
+
 # 配置日志
 logger = logging.getLogger(__name__)
 
@@ -19,17 +32,85 @@ class DownloadError(Exception):
     """下载错误异常类"""
     pass
 
+class VideoInfoCache:
+    """视频信息缓存，以视频ID为键，支持过期时间、LRU淘汰和可选持久化"""
+    
+    def __init__(
+        self,
+        ttl: float = 1800,
+        max_entries: int = 256,
+        cache_path: Optional[str] = None,
+        max_raw_entries: int = 16
+    ):
+        """
+        初始化视频信息缓存
+        
+        Args:
+            ttl: 缓存有效期（秒），YouTube的媒体地址约6小时后失效，不宜过长
+            max_entries: 格式化信息的最大缓存条目数
+            cache_path: 格式化信息的持久化文件路径，None则只保存在内存中
+            max_raw_entries: 原始提取结果的最大条目数（仅在内存中，供下载复用）
+        """
+        self._formatted = PersistentLRUCache(max_entries=max_entries, cache_path=cache_path, ttl=ttl)
+        self._raw = PersistentLRUCache(max_entries=max_raw_entries, ttl=ttl)
+    
+    def get(self, video_id: str) -> Optional[Dict[str, Any]]:
+        """获取格式化后的视频信息（_format_video_info的结果）"""
+        return self._formatted.get(video_id)
+    
+    def pop_raw(self, video_id: str) -> Optional[Dict[str, Any]]:
+        """取出原始提取结果（下载会修改info，因此取出后即从缓存移除）"""
+        return self._raw.pop(video_id)
+    
+    def put(self, video_id: str, formatted: Dict[str, Any], raw: Optional[Dict[str, Any]] = None):
+        """写入视频信息"""
+        self._formatted.put(video_id, formatted)
+        if raw is not None:
+            self._raw.put(video_id, raw)
+    
+    def clear(self):
+        """清空缓存"""
+        self._formatted.clear()
+        self._raw.clear()
+
+
 class VideoDownloader:
     """视频下载器类"""
     
-    def __init__(self, download_dir: Optional[str] = None):
+    def __init__(
+        self,
+        download_dir: Optional[str] = None,
+        stream_fingerprint: bool = True,
+        info_cache: Optional[VideoInfoCache] = None,
+        ydl_pool: Optional[YoutubeDLPool] = None,
+        staging: Optional[StagingArea] = None,
+        bandwidth: Optional[BandwidthScheduler] = None,
+        ydl_options: Optional[Dict[str, Any]] = None,
+        block_size_for: Optional[Callable[[int], int]] = None
+    ):
         """
         初始化下载器
         
         Args:
             download_dir: 下载目录，如果为None则使用临时目录
+            stream_fingerprint: 是否在下载过程中同步计算上传所需的文件指纹
+            info_cache: 视频信息缓存，None则使用仅在内存中的默认缓存
+            ydl_pool: YoutubeDL实例池，None则使用全局实例池
+            staging: 暂存区，设置后下载前按预计大小等待空间（download_dir应为暂存目录）
+            bandwidth: 带宽调度器，设置后下载速度按本任务的份额限制
+            ydl_options: 覆盖默认yt-dlp选项的配置（如format、cookiefile），所有下载共用
+            block_size_for: 流式指纹按文件大小选择分片大小的规则（应与上传器一致），None则使用默认分片大小
         """
-        if download_dir is None:
+        self.stream_fingerprint = stream_fingerprint
+        self.ydl_options = dict(ydl_options or {})
+        self.block_size_for = block_size_for
+        self.info_cache = info_cache if info_cache is not None else VideoInfoCache()
+        self.ydl_pool = ydl_pool if ydl_pool is not None else get_ydl_pool()
+        self.staging = staging
+        self.bandwidth = bandwidth
+        if download_dir is None and staging is not None:
+            self.download_dir = staging.staging_dir
+        elif download_dir is None:
             # 使用项目根目录下的tmp文件夹
             current_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
             self.download_dir = os.path.join(current_dir, 'tmp')
@@ -89,6 +170,7 @@ class VideoDownloader:
                 'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
             }
         }
+        ydl_opts.update(self.ydl_options)
         
         return ydl_opts
     
@@ -102,6 +184,12 @@ class VideoDownloader:
         Returns:
             视频信息字典
         """
+        video_key = self._video_key(video_url)
+        cached = self.info_cache.get(video_key)
+        if cached is not None:
+            logger.debug(f"视频信息缓存命中: {video_key}")
+            return cached
+        
         ydl_opts = {
             'quiet': True,
             'no_warnings': True,
@@ -109,17 +197,116 @@ class VideoDownloader:
         }
         
         try:
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                info = ydl.extract_info(video_url, download=False)
-                return self._format_video_info(info)
+            with self.ydl_pool.acquire(ydl_opts) as ydl:
+                raw = ydl.extract_info(video_url, download=False, process=False)
+                # 格式处理会修改info并写入本次的格式选择结果（requested_formats等），
+                # 因此只处理副本；缓存未经处理的提取结果，随后的下载按自己的格式配置重新选择
+                info = ydl.process_ie_result(copy.deepcopy(raw), download=False)
+                formatted = self._format_video_info(info)
+                self.info_cache.put(video_key, formatted, raw)
+                return formatted
         except Exception as e:
             logger.error(f"获取视频信息失败: {e}")
             raise DownloadError(f"获取视频信息失败: {e}")
     
+    def get_video_info_batch(
+        self,
+        video_urls: Iterable[str],
+        max_workers: int = 4
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        并发获取多个视频的信息，按完成顺序逐个返回
+        
+        Args:
+            video_urls: 视频URL或ID列表（重复项只查询一次）
+            max_workers: 最大并发提取数
+            
+        Returns:
+            结果迭代器，每项为 {'videoId', 'status': 'ok', 'info'} 或
+            {'videoId', 'status': 'error', 'message'}
+        """
+        pending = []
+        seen = set()
+        for video_url in video_urls:
+            video_key = self._video_key(video_url)
+            if video_key in seen:
+                continue
+            seen.add(video_key)
+            cached = self.info_cache.get(video_key)
+            if cached is not None:
+                # 缓存命中的结果直接返回，不占用并发
+                yield {'videoId': video_key, 'status': 'ok', 'info': cached}
+            else:
+                pending.append((video_key, video_url))
+        
+        if not pending:
+            return
+        
+        with ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix='video-info') as executor:
+            futures = {
+                executor.submit(self.get_video_info, video_url): video_key
+                for video_key, video_url in pending
+            }
+            try:
+                for future in as_completed(futures):
+                    video_key = futures[future]
+                    try:
+                        yield {'videoId': video_key, 'status': 'ok', 'info': future.result()}
+                    except DownloadError as e:
+                        yield {'videoId': video_key, 'status': 'error', 'message': str(e)}
+            finally:
+                # 调用方提前停止迭代时不再启动剩余的提取
+                for future in futures:
+                    future.cancel()
+    
+    def expand_playlist(self, playlist_url: str, flat: bool = True) -> List[Dict[str, Any]]:
+        """
+        展开播放列表/频道中的视频
+        
+        Args:
+            playlist_url: 播放列表或频道URL
+            flat: 是否只做平面提取（只读列表页，不逐个解析视频，速度快）
+            
+        Returns:
+            视频条目列表，每项包含 id、title、url、duration
+        """
+        ydl_opts = {
+            'quiet': True,
+            'no_warnings': True,
+            'skip_download': True,
+            'extract_flat': 'in_playlist' if flat else False,
+        }
+        
+        try:
+            with self.ydl_pool.acquire(ydl_opts) as ydl:
+                info = ydl.extract_info(playlist_url, download=False)
+        except Exception as e:
+            logger.error(f"展开播放列表失败: {e}")
+            raise DownloadError(f"展开播放列表失败: {e}")
+        
+        entries = []
+        for entry in info.get('entries') or []:
+            if not entry:
+                continue
+            video_id = entry.get('id', '')
+            if not flat and video_id:
+                # 完整提取的条目顺便写入信息缓存
+                self.info_cache.put(video_id, self._format_video_info(entry))
+            entries.append({
+                'id': video_id,
+                'title': entry.get('title', ''),
+                'url': entry.get('url') or entry.get('webpage_url', ''),
+                'duration': entry.get('duration', 0)
+            })
+        
+        logger.info(f"播放列表 {info.get('title', playlist_url)} 共 {len(entries)} 个视频")
+        return entries
+    
     def download_video(
         self, 
         video_url: str, 
-        on_progress: Optional[Callable[[int], None]] = None
+        on_progress: Optional[Callable[[int], None]] = None,
+        should_abort: Optional[Callable[[], bool]] = None
     ) -> Dict[str, Any]:
         """
         下载视频
@@ -127,27 +314,65 @@ class VideoDownloader:
         Args:
             video_url: 视频URL或ID
             on_progress: 进度回调函数
+            should_abort: 等待暂存空间期间检查，返回True时放弃下载
             
         Returns:
             下载结果信息
         """
+        import yt_dlp
+        
+        video_key = self._video_key(video_url)
         # 确保URL格式正确
         if not video_url.startswith(('http://', 'https://')):
             video_url = f'https://www.youtube.com/watch?v={video_url}'
         
         ydl_opts = self.get_ydl_options(on_progress)
+        metrics = current_metrics()
+        progress_hooks = list(ydl_opts['progress_hooks']) + [metrics.progress_hook]
+        before_download = []
+        after_download = []
+        # 边下载边计算指纹，结果写入指纹缓存供上传直接使用
+        # （所选格式需要合并时改为在合并完成后对最终文件计算）
+        fingerprinter = None
+        if self.stream_fingerprint:
+            fingerprinter = StreamingFingerprinter(cache=get_fingerprint_cache(),
+                                                   block_size_for=self.block_size_for)
+            progress_hooks.append(fingerprinter.progress_hook)
+            before_download.append(fingerprinter.before_download)
+            after_download.append(fingerprinter.after_download)
+        # 暂存区空间不足时，在格式选择之后、开始下载之前等待
+        admission = None
+        if self.staging is not None:
+            admission = self.staging.admission(should_abort)
+            progress_hooks.append(admission.progress_hook)
+            before_download.append(admission.before_download)
+            after_download.append(admission.after_download)
         
         try:
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                # 先获取信息（用于记录）
-                info = ydl.extract_info(video_url, download=False)
-                logger.info(f"开始下载: {info.get('title', '未知标题')}")
+            # 复用实例池中同配置的YoutubeDL，进度钩子只在本次下载期间生效
+            with self.ydl_pool.acquire(ydl_opts, progress_hooks, before_download, after_download) as ydl, \
+                    (self.bandwidth.limit_ydl(ydl) if self.bandwidth else nullcontext()):
+                # 只提取一次页面和播放器数据（不做格式处理），下载时复用同一个info；
+                # 刚通过get_video_info查询过的视频直接复用缓存的未处理提取结果
+                extract_start = time.monotonic()
+                info = self.info_cache.pop_raw(video_key)
+                if info is None:
+                    info = ydl.extract_info(video_url, download=False, process=False)
+                    self.info_cache.put(video_key, self._format_video_info(info))
+                else:
+                    logger.info(f"复用已缓存的视频信息: {video_key}")
+                extract_time = time.monotonic() - extract_start
+                metrics.add_phase('extract', extract_time)
+                logger.info(f"开始下载: {info.get('title', '未知标题')}（元数据提取耗时 {extract_time:.2f}s）")
                 
-                # 执行下载
-                ydl.download([video_url])
+                # 执行下载（格式选择、下载、后处理）
+                download_start = time.monotonic()
+                info = ydl.process_ie_result(info, download=True)
+                download_time = time.monotonic() - download_start
+                metrics.record_download(download_start)
                 
-                # 获取最终文件路径
-                final_filename = ydl.prepare_filename(info)
+                # 获取最终文件路径（合并/转封装后扩展名可能变化，优先使用实际落盘路径）
+                final_filename = self._get_final_filename(ydl, info)
                 
                 result = {
                     'status': 'completed',
@@ -155,10 +380,14 @@ class VideoDownloader:
                     'videoId': info.get('id', ''),
                     'title': info.get('title', ''),
                     'duration': info.get('duration', 0),
-                    'filesize': os.path.getsize(final_filename) if os.path.exists(final_filename) else 0
+                    'filesize': os.path.getsize(final_filename) if os.path.exists(final_filename) else 0,
+                    'timings': {
+                        'extract': round(extract_time, 3),
+                        'download': round(download_time, 3)
+                    }
                 }
                 
-                logger.info(f"下载成功: {result['title']} -> {result['localPath']}")
+                logger.info(f"下载成功: {result['title']} -> {result['localPath']}（下载耗时 {download_time:.2f}s）")
                 return result
                 
         except yt_dlp.DownloadError as e:
@@ -167,6 +396,29 @@ class VideoDownloader:
         except Exception as e:
             logger.error(f"未知错误: {e}")
             raise DownloadError(f"下载过程出错: {e}")
+        finally:
+            if admission:
+                admission.release()
+            if fingerprinter:
+                fingerprinter.close()
+    
+    @staticmethod
+    def _video_key(video_url: str) -> str:
+        """缓存键：YouTube链接统一为视频ID，其他链接使用原URL"""
+        if not video_url.startswith(('http://', 'https://')):
+            return video_url
+        from yt_dlp.extractor.youtube import YoutubeIE
+        if YoutubeIE.suitable(video_url):
+            return YoutubeIE.get_temp_id(video_url) or video_url
+        return video_url
+    
+    @staticmethod
+    def _get_final_filename(ydl: 'yt_dlp.YoutubeDL', info: Dict[str, Any]) -> str:
+        """获取下载完成后的实际文件路径"""
+        for download in info.get('requested_downloads') or []:
+            if download.get('filepath'):
+                return download['filepath']
+        return ydl.prepare_filename(info)
     
     def _format_video_info(self, info: Dict[str, Any]) -> Dict[str, Any]:
         """格式化视频信息"""
@@ -182,7 +434,7 @@ class VideoDownloader:
             'thumbnail': info.get('thumbnail', ''),
             'webpage_url': info.get('webpage_url', ''),
             'categories': info.get('categories', []),
-            'tags': info.get('tags', [])[:10],  # 只取前10个标签
+            'tags': (info.get('tags') or [])[:10],  # 只取前10个标签
             'formats': [
                 {
                     'format_id': fmt.get('format_id'),
@@ -190,7 +442,7 @@ class VideoDownloader:
                     'filesize': fmt.get('filesize'),
                     'quality': fmt.get('quality')
                 }
-                for fmt in info.get('formats', [])[:5]  # 只显示前5个格式
+                for fmt in (info.get('formats') or [])[:5]  # 只显示前5个格式
             ]
         }
 
@@ -237,6 +489,20 @@ def get_video_info(video_url: str) -> Dict[str, Any]:
     downloader = get_downloader()
     return downloader.get_video_info(video_url)
 
+def get_video_info_batch(video_urls: Iterable[str], max_workers: int = 4) -> Iterator[Dict[str, Any]]:
+    """
+    并发获取多个视频信息（简化接口）
+    
+    Args:
+        video_urls: 视频URL或ID列表
+        max_workers: 最大并发提取数
+        
+    Returns:
+        按完成顺序返回的结果迭代器
+    """
+    downloader = get_downloader()
+    return downloader.get_video_info_batch(video_urls, max_workers)
+
 # 测试函数
 def test_download():
     """测试下载功能"""
@@ -0,0 +1,514 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+文件指纹模块
+一次顺序读取同时计算秒传与分片上传所需的全部MD5
+"""
+
+import os
+import queue
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import BinaryIO, Callable, Dict, Any, Iterator, List, Optional
+import logging
+
+from .cache import PersistentLRUCache
+
+logger = logging.getLogger(__name__)
+
+# 秒传校验使用的前缀长度（前256KB）
+SLICE_SIZE = 256 * 1024
+# 默认分片大小（4MB）
+DEFAULT_BLOCK_SIZE = 4 * 1024 * 1024
+# 默认并行计算分片MD5的线程数（全文MD5另占一个核）
+DEFAULT_HASH_WORKERS = max(1, min(4, (os.cpu_count() or 1) - 1))
+
+
+class ContentDigest:
+    """秒传所需的文件摘要：文件大小、全文MD5、前256KB MD5（与分片大小无关）"""
+
+    def __init__(self, size: int, content_md5: str, slice_md5: str):
+        self.size = size
+        self.content_md5 = content_md5
+        self.slice_md5 = slice_md5
+
+    @property
+    def content_md5_slice(self) -> str:
+        """分片MD5的二次MD5（与旧接口 _get_file_slice_md5 保持一致）"""
+        return hashlib.md5(self.slice_md5.encode()).hexdigest()
+
+    def to_file_info(self) -> Dict[str, Any]:
+        """转换为旧版 _get_file_info 的返回格式"""
+        return {
+            'size': self.size,
+            'content_md5': self.content_md5,
+            'slice_md5': self.slice_md5,
+            'content_md5_slice': self.content_md5_slice
+        }
+
+    def to_dict(self) -> Dict[str, Any]:
+        """序列化为字典"""
+        return {
+            'size': self.size,
+            'content_md5': self.content_md5,
+            'slice_md5': self.slice_md5
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'ContentDigest':
+        """从字典恢复摘要"""
+        return cls(size=data['size'], content_md5=data['content_md5'], slice_md5=data['slice_md5'])
+
+    def __repr__(self) -> str:
+        return f"ContentDigest(size={self.size}, content_md5={self.content_md5})"
+
+
+class FileFingerprint(ContentDigest):
+    """文件指纹：文件摘要以及分片MD5列表"""
+
+    def __init__(
+        self,
+        size: int,
+        content_md5: str,
+        slice_md5: str,
+        block_list: List[str],
+        block_size: int = DEFAULT_BLOCK_SIZE
+    ):
+        super().__init__(size, content_md5, slice_md5)
+        self.block_list = block_list
+        self.block_size = block_size
+
+    @classmethod
+    def from_digest(cls, digest: ContentDigest, block_size: int) -> Optional['FileFingerprint']:
+        """
+        不超过一个分片的文件，分片MD5列表就是全文MD5，无需再读取文件
+
+        Returns:
+            文件大于一个分片时返回None
+        """
+        if digest.size > block_size:
+            return None
+        block_list = [digest.content_md5] if digest.size else []
+        return cls(digest.size, digest.content_md5, digest.slice_md5, block_list, block_size)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """序列化为字典"""
+        return {
+            'size': self.size,
+            'content_md5': self.content_md5,
+            'slice_md5': self.slice_md5,
+            'block_list': list(self.block_list),
+            'block_size': self.block_size
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'FileFingerprint':
+        """从字典恢复指纹"""
+        return cls(
+            size=data['size'],
+            content_md5=data['content_md5'],
+            slice_md5=data['slice_md5'],
+            block_list=list(data['block_list']),
+            block_size=data.get('block_size', DEFAULT_BLOCK_SIZE)
+        )
+
+    def __repr__(self) -> str:
+        return (f"FileFingerprint(size={self.size}, content_md5={self.content_md5}, "
+                f"blocks={len(self.block_list)}, block_size={self.block_size})")
+
+
+def iter_blocks(f: BinaryIO, block_size: int, buffer: Optional[bytearray] = None) -> Iterator[memoryview]:
+    """
+    按分片读取文件，所有分片复用同一个缓冲区（不为每个分片分配新的bytes对象）
+
+    产出的memoryview只在下一次迭代之前有效，需要保留数据时应自行复制
+    """
+    if buffer is None or len(buffer) != block_size:
+        buffer = bytearray(block_size)
+    view = memoryview(buffer)
+    while True:
+        n = f.readinto(view)
+        if not n:
+            return
+        yield view[:n]
+
+
+def _hash_block(chunk: memoryview, buffer: bytearray, free_buffers: 'queue.Queue[bytearray]') -> str:
+    """计算一个分片的MD5并归还缓冲区（hashlib 在计算大块数据时释放GIL）"""
+    try:
+        return hashlib.md5(chunk).hexdigest()
+    finally:
+        free_buffers.put(buffer)
+
+
+def compute_content_digest(file_path: str) -> ContentDigest:
+    """只计算秒传所需的摘要（一次MD5计算，不计算分片MD5列表）"""
+    content_md5 = hashlib.md5()
+    slice_md5: Optional[str] = None
+    size = 0
+    with open(file_path, 'rb') as f:
+        for chunk in iter_blocks(f, DEFAULT_BLOCK_SIZE):
+            size += len(chunk)
+            content_md5.update(chunk)
+            if slice_md5 is None:
+                slice_md5 = hashlib.md5(chunk[:SLICE_SIZE]).hexdigest()
+    return ContentDigest(size, content_md5.hexdigest(), slice_md5 or hashlib.md5(b'').hexdigest())
+
+
+def compute_fingerprint(
+    file_path: str,
+    block_size: int = DEFAULT_BLOCK_SIZE,
+    workers: int = 1,
+    digest: Optional[ContentDigest] = None
+) -> FileFingerprint:
+    """
+    单次读取计算文件指纹
+
+    Args:
+        file_path: 本地文件路径
+        block_size: 分片大小，不能小于256KB
+        workers: 计算分片MD5的线程数，大于1时分片MD5在线程池中并行计算，
+            全文MD5仍由当前线程按顺序计算，文件只读取一次
+        digest: 已知的文件摘要，给出时只计算分片MD5列表
+
+    Returns:
+        文件指纹对象
+    """
+    if block_size < SLICE_SIZE:
+        raise ValueError(f"分片大小不能小于 {SLICE_SIZE} 字节: {block_size}")
+
+    content_md5 = hashlib.md5() if digest is None else None
+    slice_md5: Optional[str] = None
+    block_list = []
+    size = 0
+
+    if workers > 1:
+        # 缓冲区在分片MD5计算完成后归还，读取最多领先计算 workers+1 个分片
+        free_buffers: 'queue.Queue[bytearray]' = queue.Queue()
+        for _ in range(workers + 1):
+            free_buffers.put(bytearray(block_size))
+        futures = []
+        with open(file_path, 'rb') as f, \
+                ThreadPoolExecutor(max_workers=workers, thread_name_prefix='block-md5') as executor:
+            while True:
+                buffer = free_buffers.get()
+                n = f.readinto(buffer)
+                if not n:
+                    break
+                chunk = memoryview(buffer)[:n]
+                size += n
+                if slice_md5 is None:
+                    slice_md5 = hashlib.md5(chunk[:SLICE_SIZE]).hexdigest()
+                futures.append(executor.submit(_hash_block, chunk, buffer, free_buffers))
+                # 缓冲区只有当前线程会再次取用，全文MD5计算完之前不会被覆盖
+                if content_md5 is not None:
+                    content_md5.update(chunk)
+            block_list = [future.result() for future in futures]
+    else:
+        with open(file_path, 'rb') as f:
+            for chunk in iter_blocks(f, block_size):
+                size += len(chunk)
+                if content_md5 is not None:
+                    content_md5.update(chunk)
+                if slice_md5 is None:
+                    slice_md5 = hashlib.md5(chunk[:SLICE_SIZE]).hexdigest()
+                block_list.append(hashlib.md5(chunk).hexdigest())
+
+    if slice_md5 is None:
+        # 空文件
+        slice_md5 = hashlib.md5(b'').hexdigest()
+
+    if digest is not None:
+        if size != digest.size or slice_md5 != digest.slice_md5:
+            raise ValueError(f"文件在计算摘要之后被修改: {file_path}")
+        return FileFingerprint(digest.size, digest.content_md5, digest.slice_md5, block_list, block_size)
+
+    return FileFingerprint(
+        size=size,
+        content_md5=content_md5.hexdigest(),
+        slice_md5=slice_md5,
+        block_list=block_list,
+        block_size=block_size
+    )
+
+
+class FingerprintCache:
+    """
+    文件指纹缓存，以(路径, 大小, 修改时间, inode)为键，跨进程重启持久化
+
+    每个文件一个条目：文件摘要以及按分片大小保存的分片MD5列表，
+    秒传只需要摘要，不论之前按哪种分片大小计算过都能命中
+    """
+
+    def __init__(self, max_entries: int = 256, cache_path: Optional[str] = None):
+        """
+        初始化指纹缓存
+
+        Args:
+            max_entries: 最大缓存文件数
+            cache_path: 持久化文件路径，None则使用项目根目录下的tmp/fingerprint_cache.json
+        """
+        if cache_path is None:
+            current_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+            cache_path = os.path.join(current_dir, 'tmp', 'fingerprint_cache.json')
+        self._cache = PersistentLRUCache(max_entries=max_entries, cache_path=cache_path)
+
+    @staticmethod
+    def _key(file_path: str) -> Optional[str]:
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            return None
+        return f"{os.path.abspath(file_path)}|{stat.st_size}|{stat.st_mtime_ns}|{stat.st_ino}"
+
+    def _entry(self, file_path: str) -> Optional[Dict[str, Any]]:
+        key = self._key(file_path)
+        return self._cache.get(key) if key is not None else None
+
+    def get_digest(self, file_path: str) -> Optional[ContentDigest]:
+        """查找文件摘要，文件被修改过则不会命中"""
+        entry = self._entry(file_path)
+        return ContentDigest.from_dict(entry) if entry else None
+
+    def get_or_compute_digest(self, file_path: str) -> ContentDigest:
+        """命中缓存则直接返回，否则只计算文件摘要并写入缓存"""
+        digest = self.get_digest(file_path)
+        if digest is not None:
+            logger.info(f"文件摘要缓存命中: {file_path}")
+            return digest
+        digest = compute_content_digest(file_path)
+        self.put(file_path, digest)
+        return digest
+
+    def get(self, file_path: str, block_size: int = DEFAULT_BLOCK_SIZE) -> Optional[FileFingerprint]:
+        """查找指定分片大小的文件指纹，文件被修改过则不会命中"""
+        entry = self._entry(file_path)
+        if not entry:
+            return None
+        block_list = entry.get('blocks', {}).get(str(block_size))
+        if block_list is None:
+            return None
+        digest = ContentDigest.from_dict(entry)
+        return FileFingerprint(digest.size, digest.content_md5, digest.slice_md5, list(block_list), block_size)
+
+    def put(self, file_path: str, fingerprint: ContentDigest):
+        """保存文件指纹或文件摘要（与已保存的其他分片大小的指纹合并）"""
+        key = self._key(file_path)
+        if key is None:
+            return
+        entry = self._cache.get(key) or {}
+        blocks = dict(entry.get('blocks', {}))
+        if isinstance(fingerprint, FileFingerprint):
+            blocks[str(fingerprint.block_size)] = list(fingerprint.block_list)
+        entry = ContentDigest.to_dict(fingerprint)
+        entry['blocks'] = blocks
+        self._cache.put(key, entry)
+
+    def get_or_compute(
+        self,
+        file_path: str,
+        block_size: int = DEFAULT_BLOCK_SIZE,
+        workers: int = 1,
+        digest: Optional[ContentDigest] = None
+    ) -> FileFingerprint:
+        """命中缓存则直接返回，否则计算（workers、digest见compute_fingerprint）并写入缓存"""
+        fingerprint = self.get(file_path, block_size)
+        if fingerprint is not None:
+            logger.info(f"文件指纹缓存命中: {file_path}")
+            return fingerprint
+        fingerprint = compute_fingerprint(file_path, block_size, workers, digest)
+        self.put(file_path, fingerprint)
+        return fingerprint
+
+    def __len__(self) -> int:
+        return len(self._cache)
+
+
+class StreamingFingerprinter:
+    """
+    边下载边计算文件指纹
+
+    由yt-dlp进度钩子驱动：下载线程只投递已写入的字节数，后台线程按完整分片
+    读取正在增长的文件并计算MD5。下载完成时补读剩余数据，结果写入指纹缓存，
+    上传时即可直接命中。所选格式需要合并时由 before_download 停用，不读取各个分流文件；
+    合并或修复等后处理改写文件后，由 after_download 趁文件还在页缓存中对最终文件计算一次，
+    上传时同样直接命中缓存。
+    """
+
+    def __init__(
+        self,
+        block_size: int = DEFAULT_BLOCK_SIZE,
+        cache: Optional[FingerprintCache] = None,
+        block_size_for: Optional[Callable[[int], int]] = None
+    ):
+        """
+        初始化流式指纹计算
+
+        Args:
+            block_size: 分片大小，需与上传器一致
+            cache: 计算结果写入的指纹缓存
+            block_size_for: 按文件大小选择分片大小（与上传器的选择规则一致），
+                None则固定使用block_size；下载中的文件以yt-dlp报告的预计大小为准
+        """
+        if block_size < SLICE_SIZE:
+            raise ValueError(f"分片大小不能小于 {SLICE_SIZE} 字节: {block_size}")
+        self.block_size = block_size
+        self.block_size_for = block_size_for
+        self.cache = cache
+        self.results: Dict[str, FileFingerprint] = {}
+        # 本次下载的文件会原样上传时才计算
+        self.enabled = True
+        self._events: 'queue.Queue[tuple]' = queue.Queue()
+        self._reset()
+        self._thread = threading.Thread(target=self._run, name='stream-fingerprint', daemon=True)
+        self._thread.start()
+
+    def _reset(self, path: Optional[str] = None, total: Optional[int] = None):
+        """丢弃已计算的状态，从文件开头重新计算"""
+        self._path = path
+        self._block_size = self.block_size
+        if self.block_size_for is not None and total:
+            self._block_size = max(SLICE_SIZE, self.block_size_for(total))
+        self._offset = 0
+        self._content_md5 = hashlib.md5()
+        self._slice_md5: Optional[str] = None
+        self._block_list: List[str] = []
+        # 读取缓冲区在同一文件的多次进度事件之间复用
+        if getattr(self, '_buffer', None) is None or len(self._buffer) != self._block_size:
+            self._buffer = bytearray(self._block_size)
+
+    def before_download(self, info: Dict[str, Any]):
+        """
+        yt-dlp下载前钩子（格式选择之后调用）
+
+        视频流和音频流分别下载再合并时，上传的是合并生成的新文件，
+        各个分流文件的指纹不会被用到，本次下载停用计算
+        """
+        self.enabled = not info.get('requested_formats')
+        if not self.enabled:
+            logger.debug(f"所选格式需要合并，不在下载期间计算指纹: {info.get('id')}")
+
+    def after_download(self, info: Dict[str, Any]):
+        """
+        yt-dlp下载后钩子（合并等后处理完成、文件移到最终位置之后调用）
+
+        下载期间没有得到最终文件的指纹时（格式需要合并，或文件被后处理改写），
+        读取最终文件计算一次并写入缓存，上传时不再读取文件
+        """
+        path = info.get('filepath')
+        if self.cache is None or not path or not os.path.exists(path):
+            return
+        # 等下载期间投递的事件处理完，流式计算的结果已写入缓存时不再重复计算
+        self._events.join()
+        size = os.path.getsize(path)
+        block_size = self.block_size
+        if self.block_size_for is not None:
+            block_size = max(SLICE_SIZE, self.block_size_for(size))
+        try:
+            self.results[path] = self.cache.get_or_compute(path, block_size)
+        except OSError as e:
+            logger.debug(f"下载后计算指纹失败，上传时将重新计算: {path}: {e}")
+
+    def progress_hook(self, d: Dict[str, Any]):
+        """yt-dlp进度钩子，只投递事件，不在下载线程中读文件"""
+        if not self.enabled:
+            return
+        status = d.get('status')
+        if status == 'downloading':
+            path = d.get('tmpfilename') or d.get('filename')
+            if path:
+                total = d.get('total_bytes') or d.get('total_bytes_estimate')
+                self._events.put(('data', path, d.get('downloaded_bytes') or 0, total))
+        elif status == 'finished' and d.get('filename'):
+            self._events.put(('finish', d['filename'], 0, None))
+
+    def close(self, timeout: Optional[float] = None):
+        """等待已投递的事件处理完毕并结束后台线程"""
+        self._events.put(('close', None, 0, None))
+        self._thread.join(timeout)
+
+    def _run(self):
+        while True:
+            op, path, available, total = self._events.get()
+            try:
+                if op == 'close':
+                    return
+                if op == 'data':
+                    self._on_data(path, available, total)
+                else:
+                    self._on_finish(path)
+            except OSError as e:
+                logger.debug(f"流式指纹计算失败，下载完成后将重新计算: {path}: {e}")
+                self._reset()
+            finally:
+                self._events.task_done()
+
+    def _on_data(self, path: str, available: int, total: Optional[int] = None):
+        if path != self._path or available < self._offset:
+            # 开始下载新文件，或下载从头重新开始
+            self._reset(path, total)
+
+        if self._offset + self._block_size > available:
+            return
+        with open(path, 'rb') as f:
+            f.seek(self._offset)
+            for chunk in iter_blocks(f, self._block_size, self._buffer):
+                if len(chunk) < self._block_size:
+                    # 数据还在下载器的写缓冲中，等下一次进度事件
+                    break
+                self._update(chunk)
+                if self._offset + self._block_size > available:
+                    break
+
+    def _on_finish(self, path: str):
+        if self._path not in (path, path + '.part'):
+            # 没有观察到下载过程（例如文件已存在），从头计算
+            self._reset(path, os.path.getsize(path))
+
+        stat_before = os.stat(path)
+        if self.block_size_for is not None and \
+                max(SLICE_SIZE, self.block_size_for(stat_before.st_size)) != self._block_size:
+            # 预计大小与实际大小对应的分片大小不同，按实际大小重新计算
+            self._reset(path, stat_before.st_size)
+        with open(path, 'rb') as f:
+            f.seek(self._offset)
+            for chunk in iter_blocks(f, self._block_size, self._buffer):
+                self._update(chunk)
+
+        if self._offset != stat_before.st_size:
+            logger.debug(f"流式指纹与文件大小不一致，已丢弃: {path}")
+            self._reset()
+            return
+
+        fingerprint = FileFingerprint(
+            size=self._offset,
+            content_md5=self._content_md5.hexdigest(),
+            slice_md5=self._slice_md5 or hashlib.md5(b'').hexdigest(),
+            block_list=self._block_list,
+            block_size=self._block_size
+        )
+        self.results[path] = fingerprint
+        if self.cache is not None:
+            self.cache.put(path, fingerprint)
+        logger.info(f"下载期间完成文件指纹计算: {path}")
+        self._reset()
+
+    def _update(self, chunk: memoryview):
+        self._offset += len(chunk)
+        self._content_md5.update(chunk)
+        if self._slice_md5 is None:
+            self._slice_md5 = hashlib.md5(chunk[:SLICE_SIZE]).hexdigest()
+        self._block_list.append(hashlib.md5(chunk).hexdigest())
+
+
+# 全局指纹缓存实例
+_default_fingerprint_cache = None
+
+
+def get_fingerprint_cache() -> FingerprintCache:
+    """获取指纹缓存实例（单例模式）"""
+    global _default_fingerprint_cache
+    if _default_fingerprint_cache is None:
+        _default_fingerprint_cache = FingerprintCache()
+    return _default_fingerprint_cache
@@ -0,0 +1,297 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+任务调度模块
+为本地消息主机提供多任务下载/上传队列，下载和上传分别使用独立的并发池
+"""
+
+import time
+import uuid
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, Any, List, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+# 已结束任务的保留时间（秒），超过后不再能查询
+FINISHED_JOB_TTL = 3600
+# 最多保留的已结束任务数
+MAX_FINISHED_JOBS = 200
+
+
+class JobCancelled(Exception):
+    """任务被取消异常类"""
+    pass
+
+
+class Job:
+    """单个同步任务（下载，或下载后上传，或仅上传）"""
+
+    def __init__(self, kind: str, video_id: str, title: str = '',
+                 local_path: Optional[str] = None, upload: bool = False):
+        self.job_id = uuid.uuid4().hex[:12]
+        self.kind = kind
+        self.video_id = video_id
+        self.title = title
+        self.local_path = local_path
+        self.upload = upload
+        self.status = 'queued'
+        self.percent = 0
+        self.message = ''
+        self.result: Optional[Dict[str, Any]] = None
+        self.cancel_event = threading.Event()
+        self._future: Optional[Future] = None
+
+    @property
+    def cancelled(self) -> bool:
+        return self.cancel_event.is_set()
+
+    def check_cancelled(self):
+        """在下载/上传回调中调用，任务被取消时抛出JobCancelled"""
+        if self.cancel_event.is_set():
+            raise JobCancelled(f"任务已取消: {self.job_id}")
+
+    def to_dict(self) -> Dict[str, Any]:
+        """任务状态快照"""
+        return {
+            'jobId': self.job_id,
+            'kind': self.kind,
+            'videoId': self.video_id,
+            'title': self.title,
+            'status': self.status,
+            'percent': self.percent,
+            'localPath': self.local_path,
+            'message': self.message
+        }
+
+
+class JobScheduler:
+    """任务调度器：下载池和上传池相互独立，进度与结果消息均带jobId"""
+
+    def __init__(
+        self,
+        download_fn: Callable[[Job, Callable[[int], None]], str],
+        upload_fn: Callable[[Job], Dict[str, Any]],
+        emit: Callable[[Dict[str, Any]], None],
+        download_workers: int = 2,
+        upload_workers: int = 1,
+        upload_batch_fn: Optional[Callable[[List[Job], Callable[[Job, Dict[str, Any]], None],
+                                            Callable[[Job], None]], None]] = None,
+        finished_ttl: float = FINISHED_JOB_TTL,
+        max_finished: int = MAX_FINISHED_JOBS
+    ):
+        """
+        初始化调度器
+
+        Args:
+            download_fn: 下载函数，参数为任务和进度回调，返回本地文件路径
+            upload_fn: 上传函数，参数为任务，返回handle_upload格式的结果
+            emit: 消息发送函数（需线程安全）
+            download_workers: 同时进行的下载数
+            upload_workers: 同时进行的上传数
+            upload_batch_fn: 批量上传函数，参数为一批任务、单个任务完成的回调和单个任务开始上传的回调，
+                None则批量任务逐个上传
+            finished_ttl: 已结束任务的保留时间（秒）
+            max_finished: 最多保留的已结束任务数，超出时先淘汰最早结束的任务
+        """
+        self.download_fn = download_fn
+        self.upload_fn = upload_fn
+        self.upload_batch_fn = upload_batch_fn
+        self.emit = emit
+        self._download_pool = ThreadPoolExecutor(max_workers=max(1, download_workers), thread_name_prefix='download')
+        self._upload_pool = ThreadPoolExecutor(max_workers=max(1, upload_workers), thread_name_prefix='upload')
+        self._lock = threading.Lock()
+        self._jobs: Dict[str, Job] = {}
+        # 已结束的任务：jobId -> 结束时间，按结束先后排列
+        self._finished: 'OrderedDict[str, float]' = OrderedDict()
+        self.finished_ttl = finished_ttl
+        self.max_finished = max(0, max_finished)
+
+    def submit_download(self, video_id: str, title: str = '', upload: bool = False) -> Job:
+        """提交下载任务，upload为True时下载完成后自动进入上传队列"""
+        job = Job('download', video_id, title, upload=upload)
+        self._register(job)
+        job._future = self._download_pool.submit(self._run_download, job)
+        return job
+
+    def submit_upload(self, video_id: str, local_path: str) -> Job:
+        """提交上传任务"""
+        job = Job('upload', video_id, local_path=local_path, upload=True)
+        self._register(job)
+        job._future = self._upload_pool.submit(self._run_upload, job)
+        return job
+
+    def submit_upload_batch(self, files: List[Dict[str, str]]) -> List[Job]:
+        """
+        提交一批上传任务（每项为 {'videoId': ..., 'localPath': ...}）
+
+        每个文件仍是独立的任务，可单独查询和取消；整批在一个上传线程中依次执行，
+        以便共用连接并在上传期间预取下一个文件的指纹
+        """
+        if self.upload_batch_fn is None:
+            return [self.submit_upload(item['videoId'], item['localPath']) for item in files]
+        jobs = [Job('upload', item['videoId'], local_path=item['localPath'], upload=True) for item in files]
+        for job in jobs:
+            # 整批共用一个future，单个任务取消时只置位取消信号，由批量函数跳过
+            self._register(job)
+        self._upload_pool.submit(self._run_upload_batch, jobs)
+        return jobs
+
+    def _register(self, job: Job):
+        with self._lock:
+            self._evict()
+            self._jobs[job.job_id] = job
+        logger.info(f"任务入队: {job.job_id} ({job.kind}) videoId={job.video_id}")
+
+    def _evict(self):
+        """淘汰过期或超出数量的已结束任务（需持有锁），长期运行的主机不会无限累积任务"""
+        now = time.monotonic()
+        while self._finished:
+            job_id, finished_at = next(iter(self._finished.items()))
+            if len(self._finished) <= self.max_finished and now - finished_at < self.finished_ttl:
+                break
+            del self._finished[job_id]
+            self._jobs.pop(job_id, None)
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def status(self, job_id: Optional[str] = None) -> Dict[str, Any]:
+        """查询单个任务或全部任务的状态"""
+        if job_id:
+            job = self.get(job_id)
+            if job is None:
+                return {'status': 'error', 'message': f'任务不存在: {job_id}', 'jobId': job_id}
+            return {'status': 'ok', 'job': job.to_dict()}
+        with self._lock:
+            self._evict()
+            jobs: List[Job] = list(self._jobs.values())
+        return {'status': 'ok', 'jobs': [job.to_dict() for job in jobs]}
+
+    def cancel(self, job_id: str) -> Dict[str, Any]:
+        """取消任务：排队中的任务直接移出队列，运行中的任务在下一个进度回调时中止"""
+        job = self.get(job_id)
+        if job is None:
+            return {'status': 'error', 'message': f'任务不存在: {job_id}', 'jobId': job_id}
+        if job.status in ('completed', 'error', 'cancelled'):
+            return {'status': 'error', 'message': f'任务已结束: {job.status}', 'jobId': job_id}
+
+        job.cancel_event.set()
+        if job._future is not None and job._future.cancel():
+            self._finish(job, 'cancelled', '任务已取消')
+        return {'status': 'cancelling', 'jobId': job_id}
+
+    def shutdown(self, cancel_running: bool = False, wait: bool = True):
+        """关闭调度器"""
+        if cancel_running:
+            with self._lock:
+                jobs = list(self._jobs.values())
+            for job in jobs:
+                job.cancel_event.set()
+        self._download_pool.shutdown(wait=wait, cancel_futures=cancel_running)
+        self._upload_pool.shutdown(wait=wait, cancel_futures=cancel_running)
+
+    def _finish(self, job: Job, status: str, message: str = '', extra: Optional[Dict[str, Any]] = None):
+        job.status = status
+        job.message = message
+        with self._lock:
+            self._finished[job.job_id] = time.monotonic()
+            self._finished.move_to_end(job.job_id)
+            self._evict()
+        payload = {'status': status, 'jobId': job.job_id, 'videoId': job.video_id}
+        if message:
+            payload['message'] = message
+        if extra:
+            payload.update(extra)
+        self.emit(payload)
+
+    def _run_download(self, job: Job):
+        if job.cancelled:
+            self._finish(job, 'cancelled', '任务已取消')
+            return
+
+        def on_progress(pct: int):
+            job.check_cancelled()
+            job.percent = pct
+            self.emit({'jobId': job.job_id, 'videoId': job.video_id, 'percent': pct})
+
+        job.status = 'downloading'
+        try:
+            job.local_path = self.download_fn(job, on_progress)
+        except Exception as e:
+            if job.cancelled:
+                self._finish(job, 'cancelled', '任务已取消')
+            else:
+                logger.error(f"任务 {job.job_id} 下载失败: {e}")
+                self._finish(job, 'error', str(e))
+            return
+
+        if not job.upload:
+            self._finish(job, 'completed', extra={'localPath': job.local_path})
+            return
+
+        # 下载完成后转入上传队列，不占用下载并发
+        self.emit({'status': 'downloaded', 'jobId': job.job_id, 'videoId': job.video_id,
+                   'localPath': job.local_path})
+        job.status = 'queued'
+        job._future = self._upload_pool.submit(self._run_upload, job)
+
+    def _run_upload(self, job: Job):
+        if job.cancelled:
+            self._finish(job, 'cancelled', '任务已取消')
+            return
+
+        job.status = 'uploading'
+        try:
+            result = self.upload_fn(job)
+        except Exception as e:
+            if job.cancelled:
+                self._finish(job, 'cancelled', '任务已取消')
+            else:
+                logger.error(f"任务 {job.job_id} 上传失败: {e}")
+                self._finish(job, 'error', str(e))
+            return
+
+        self._complete_upload(job, result)
+
+    def _run_upload_batch(self, jobs: List[Job]):
+        runnable = []
+        for job in jobs:
+            if job.cancelled:
+                self._finish(job, 'cancelled', '任务已取消')
+            else:
+                runnable.append(job)
+        if not runnable:
+            return
+
+        finished = set()
+
+        def on_start(job: Job):
+            # 批内其余文件仍在排队，开始上传本文件时才改为上传中
+            job.status = 'uploading'
+
+        def on_result(job: Job, result: Dict[str, Any]):
+            finished.add(job.job_id)
+            self._complete_upload(job, result)
+
+        try:
+            self.upload_batch_fn(runnable, on_result, on_start)
+        except Exception as e:
+            logger.error(f"批量上传失败: {e}")
+            for job in runnable:
+                if job.job_id not in finished:
+                    self._finish(job, 'cancelled' if job.cancelled else 'error', str(e))
+
+    def _complete_upload(self, job: Job, result: Dict[str, Any]):
+        job.result = result
+        if job.cancelled and result.get('status') != 'success':
+            self._finish(job, 'cancelled', '任务已取消')
+        elif result.get('status') == 'success':
+            self._finish(job, 'completed', result.get('message', ''),
+                         extra={'localPath': job.local_path, 'fs_id': result.get('fs_id', ''),
+                                'path': result.get('path', '')})
+        else:
+            self._finish(job, 'error', result.get('message', '上传失败'))
@@ -0,0 +1,224 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+上传会话日志模块
+以JSON-lines格式记录分片上传的uploadid、文件指纹和已确认的分片，
+上传中断后重试时可跳过已上传的分片
+"""
+
+import os
+import json
+import time
+import threading
+from typing import Dict, Any, Optional, Set
+import logging
+
+from .fingerprint import FileFingerprint
+
+logger = logging.getLogger(__name__)
+
+# 会话最长保留时间（秒），超过后不再续传，避免使用已失效的uploadid
+DEFAULT_MAX_AGE = 24 * 3600
+
+
+class UploadSession:
+    """单个文件的分片上传会话"""
+
+    def __init__(
+        self,
+        local_path: str,
+        remote_path: str,
+        uploadid: str,
+        fingerprint: FileFingerprint,
+        size: int,
+        mtime_ns: int,
+        created_at: float
+    ):
+        self.local_path = local_path
+        self.remote_path = remote_path
+        self.uploadid = uploadid
+        self.fingerprint = fingerprint
+        self.size = size
+        self.mtime_ns = mtime_ns
+        self.created_at = created_at
+        self.done_parts: Set[int] = set()
+
+    def to_record(self) -> Dict[str, Any]:
+        """转换为日志中的begin记录"""
+        return {
+            'op': 'begin',
+            'local_path': self.local_path,
+            'remote_path': self.remote_path,
+            'uploadid': self.uploadid,
+            'fingerprint': self.fingerprint.to_dict(),
+            'size': self.size,
+            'mtime_ns': self.mtime_ns,
+            'created_at': self.created_at
+        }
+
+
+class UploadJournal:
+    """上传会话日志"""
+
+    def __init__(self, journal_path: Optional[str] = None, max_age: float = DEFAULT_MAX_AGE):
+        """
+        初始化上传日志
+
+        Args:
+            journal_path: 日志文件路径，None则使用项目根目录下的tmp/upload_journal.jsonl
+            max_age: 会话最长保留时间（秒）
+        """
+        if journal_path is None:
+            current_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+            journal_path = os.path.join(current_dir, 'tmp', 'upload_journal.jsonl')
+        self.journal_path = journal_path
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._sessions: Dict[str, UploadSession] = {}
+
+        os.makedirs(os.path.dirname(self.journal_path), exist_ok=True)
+        self._load()
+
+    @staticmethod
+    def _key(local_path: str) -> str:
+        return os.path.abspath(local_path)
+
+    def _load(self):
+        """回放日志，恢复未完成的会话"""
+        if not os.path.exists(self.journal_path):
+            return
+
+        with open(self.journal_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    self._replay(json.loads(line))
+                except (ValueError, KeyError, TypeError, AttributeError):
+                    # 进程中断时最后一行可能不完整；缺少字段或格式不对的记录同样跳过
+                    logger.warning(f"跳过损坏的上传日志记录: {line[:80]}")
+
+        # 启动时压缩日志，只保留未完成的会话
+        self._rewrite()
+
+    def _replay(self, record: Dict[str, Any]):
+        """回放一条日志记录，记录格式不对时抛出 ValueError/KeyError/TypeError/AttributeError"""
+        key = record['local_path']
+        op = record.get('op')
+        if op == 'begin':
+            self._sessions[key] = UploadSession(
+                local_path=key,
+                remote_path=record['remote_path'],
+                uploadid=record['uploadid'],
+                fingerprint=FileFingerprint.from_dict(record['fingerprint']),
+                size=record['size'],
+                mtime_ns=record['mtime_ns'],
+                created_at=record['created_at']
+            )
+        elif op == 'part':
+            session = self._sessions.get(key)
+            if session and session.uploadid == record.get('uploadid'):
+                session.done_parts.add(int(record['partseq']))
+        elif op == 'end':
+            self._sessions.pop(key, None)
+
+    def _append(self, record: Dict[str, Any]):
+        with open(self.journal_path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(record, ensure_ascii=False) + '\n')
+            f.flush()
+
+    def _rewrite(self):
+        tmp_path = self.journal_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for session in self._sessions.values():
+                f.write(json.dumps(session.to_record(), ensure_ascii=False) + '\n')
+                for partseq in sorted(session.done_parts):
+                    f.write(json.dumps({
+                        'op': 'part',
+                        'local_path': session.local_path,
+                        'uploadid': session.uploadid,
+                        'partseq': partseq
+                    }, ensure_ascii=False) + '\n')
+        os.replace(tmp_path, self.journal_path)
+
+    def find(self, local_path: str, remote_path: str, chunk_size: int) -> Optional[UploadSession]:
+        """
+        查找可续传的会话
+
+        文件大小、修改时间、远程路径或分片大小任一不一致，或会话已过期时返回None
+        """
+        key = self._key(local_path)
+        with self._lock:
+            session = self._sessions.get(key)
+            if session is None:
+                return None
+
+            try:
+                stat = os.stat(key)
+            except OSError:
+                stat = None
+
+            if (stat is None
+                    or stat.st_size != session.size
+                    or stat.st_mtime_ns != session.mtime_ns
+                    or session.remote_path != remote_path
+                    or session.fingerprint.block_size != chunk_size
+                    or time.time() - session.created_at > self.max_age):
+                logger.info(f"丢弃失效的上传会话: {key}")
+                self._sessions.pop(key, None)
+                self._append({'op': 'end', 'local_path': key})
+                return None
+
+            return session
+
+    def begin(self, local_path: str, remote_path: str, uploadid: str, fingerprint: FileFingerprint) -> UploadSession:
+        """记录新的上传会话"""
+        key = self._key(local_path)
+        stat = os.stat(key)
+        session = UploadSession(
+            local_path=key,
+            remote_path=remote_path,
+            uploadid=uploadid,
+            fingerprint=fingerprint,
+            size=stat.st_size,
+            mtime_ns=stat.st_mtime_ns,
+            created_at=time.time()
+        )
+        with self._lock:
+            self._sessions[key] = session
+            self._append(session.to_record())
+        return session
+
+    def mark_part(self, local_path: str, uploadid: str, partseq: int):
+        """记录已被服务端确认的分片"""
+        key = self._key(local_path)
+        with self._lock:
+            session = self._sessions.get(key)
+            if session is None or session.uploadid != uploadid:
+                return
+            session.done_parts.add(partseq)
+            self._append({'op': 'part', 'local_path': key, 'uploadid': uploadid, 'partseq': partseq})
+
+    def finish(self, local_path: str):
+        """结束会话（上传完成或会话不可再用）"""
+        key = self._key(local_path)
+        with self._lock:
+            if self._sessions.pop(key, None) is None:
+                return
+            self._append({'op': 'end', 'local_path': key})
+            if not self._sessions:
+                # 没有未完成的会话时清空日志
+                self._rewrite()
+
+
+# 全局上传日志实例
+_default_journal = None
+
+
+def get_upload_journal() -> UploadJournal:
+    """获取上传日志实例（单例模式）"""
+    global _default_journal
+    if _default_journal is None:
+        _default_journal = UploadJournal()
+    return _default_journal
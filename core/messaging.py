@@ -0,0 +1,167 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+本地消息（Native Messaging）输出模块
+由单一写线程负责写出带长度前缀的消息帧，并按任务合并进度消息
+"""
+
+import json
+import time
+import threading
+from collections import OrderedDict, deque
+from typing import Any, BinaryIO, Deque, Dict, Optional, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+# 任务结束状态，收到后清除该任务的进度记录，之后到达的该任务进度被丢弃
+FINAL_STATUSES = ('completed', 'error', 'cancelled')
+# 记住的已结束任务数上限
+MAX_FINISHED_JOBS = 1024
+
+
+def encode_frame(obj: Dict[str, Any]) -> bytes:
+    """编码为本地消息帧：4字节小端长度 + UTF-8 JSON"""
+    body = json.dumps(obj, ensure_ascii=False).encode('utf-8')
+    return len(body).to_bytes(4, 'little') + body
+
+
+class MessageWriter:
+    """
+    线程安全的消息写出器
+
+    普通消息按发送顺序立即写出；进度消息（含percent且不含status）按任务合并，
+    每个任务最多每 progress_interval 秒写出一次最新进度，百分比未变化的进度直接丢弃。
+    任务的结束消息写出后，迟到的该任务进度（按jobId判断）直接丢弃，不会出现在结束消息之后。
+    输出流写入失败（例如浏览器已关闭管道）或写出器关闭后，之后投递的消息直接丢弃并记录日志。
+    """
+
+    def __init__(self, stream: BinaryIO, progress_interval: float = 0.5):
+        """
+        初始化写出器
+
+        Args:
+            stream: 输出的二进制流（通常为 sys.stdout.buffer）
+            progress_interval: 同一任务两次进度消息的最小间隔（秒）
+        """
+        self.stream = stream
+        self.progress_interval = progress_interval
+        self._cond = threading.Condition()
+        self._queue: Deque[Dict[str, Any]] = deque()
+        # 任务 -> 尚未写出的最新进度
+        self._pending: Dict[str, Dict[str, Any]] = {}
+        # 任务 -> (最近写出的百分比, 写出时间)
+        self._last_sent: Dict[str, Tuple[Any, float]] = {}
+        # 已写入结束消息的任务（jobId）
+        self._finished_jobs: 'OrderedDict[str, None]' = OrderedDict()
+        self._closed = False
+        # 写出失败后置位，不再接收消息
+        self.failed = False
+        # 写出失败或关闭后丢弃的消息数（含失败时未写出的消息）
+        self.dropped = 0
+        self._thread = threading.Thread(target=self._run, name='message-writer', daemon=True)
+        self._thread.start()
+
+    @staticmethod
+    def _progress_key(obj: Dict[str, Any]) -> Optional[str]:
+        """进度消息返回其任务键，其他消息返回None"""
+        if 'percent' in obj and 'status' not in obj:
+            return MessageWriter._job_key(obj)
+        return None
+
+    @staticmethod
+    def _job_key(obj: Dict[str, Any]) -> str:
+        # 调度器的消息都带jobId；旧接口的消息只有videoId或两者都没有
+        return str(obj.get('jobId') or obj.get('videoId') or '')
+
+    def send(self, obj: Dict[str, Any]):
+        """投递一条消息（可在任意线程调用）"""
+        key = self._progress_key(obj)
+        with self._cond:
+            if self._closed or self.failed:
+                # 没有写线程消费（退出时仍在运行的后台线程也会走到这里），继续排队只会占用内存
+                self.dropped += 1
+                logger.debug(f"输出已{'关闭' if self._closed else '断开'}，丢弃消息: {obj}")
+                return
+            if key is not None:
+                if obj.get('jobId') in self._finished_jobs:
+                    logger.debug(f"任务已结束，丢弃迟到的进度: {obj}")
+                    return
+                last = self._last_sent.get(key)
+                if last is not None and last[0] == obj['percent']:
+                    # 与上次写出的百分比相同，丢弃
+                    self._pending.pop(key, None)
+                    return
+                self._pending[key] = obj
+            else:
+                job_key = self._job_key(obj)
+                # 先写出该任务尚未写出的进度，保证消息顺序
+                if job_key in self._pending:
+                    self._queue.append(self._pending.pop(job_key))
+                self._queue.append(obj)
+                if obj.get('status') in FINAL_STATUSES:
+                    self._last_sent.pop(job_key, None)
+                    if obj.get('jobId'):
+                        self._finished_jobs[obj['jobId']] = None
+                        self._finished_jobs.move_to_end(obj['jobId'])
+                        while len(self._finished_jobs) > MAX_FINISHED_JOBS:
+                            self._finished_jobs.popitem(last=False)
+            self._cond.notify()
+
+    def _take_batch(self, flush_all: bool) -> list:
+        """取出当前可写出的消息（需持有锁）"""
+        batch = list(self._queue)
+        self._queue.clear()
+        now = time.monotonic()
+        for key in list(self._pending):
+            last = self._last_sent.get(key)
+            if flush_all or last is None or now - last[1] >= self.progress_interval:
+                msg = self._pending.pop(key)
+                self._last_sent[key] = (msg['percent'], now)
+                batch.append(msg)
+        return batch
+
+    def _next_deadline(self) -> Optional[float]:
+        """最近一个待写出进度的到期等待时间（需持有锁）"""
+        now = time.monotonic()
+        waits = [
+            self._last_sent[key][1] + self.progress_interval - now
+            for key in self._pending if key in self._last_sent
+        ]
+        return max(0.0, min(waits)) if waits else None
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while True:
+                    batch = self._take_batch(flush_all=self._closed)
+                    if batch or self._closed:
+                        break
+                    self._cond.wait(self._next_deadline())
+                closed = self._closed
+
+            if batch:
+                try:
+                    # 一批消息只刷新一次
+                    self.stream.write(b''.join(encode_frame(msg) for msg in batch))
+                    self.stream.flush()
+                except (OSError, ValueError) as e:
+                    with self._cond:
+                        self.failed = True
+                        self.dropped += len(batch) + len(self._queue) + len(self._pending)
+                        self._queue.clear()
+                        self._pending.clear()
+                    logger.error(f"写出消息失败，之后的消息将被丢弃: {e}")
+                    return
+
+            if closed and not batch:
+                return
+
+    def close(self, timeout: Optional[float] = 5.0):
+        """写出所有剩余消息并结束写线程"""
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify()
+        self._thread.join(timeout)
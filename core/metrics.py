@@ -0,0 +1,242 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+指标模块
+记录每个下载/上传任务各阶段的耗时（提取、下载、合并、哈希、秒传探测、预创建、分片上传、创建文件）、
+字节数和重试次数；任务结束时写入JSON Lines指标文件，并汇总供 stats 命令查询
+
+当前任务通过 contextvars 传递，深层代码用 current_metrics() 取得，不需要逐层传参；
+不在任务范围内时 current_metrics() 返回不做任何记录的空对象
+"""
+
+import os
+import json
+import math
+import time
+import threading
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Deque, Dict, Iterator, List, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+# 每个阶段保留的最近耗时样本数（用于计算分位数）
+SAMPLES_PER_PHASE = 1000
+# stats 中返回的最近任务数
+RECENT_JOBS = 20
+# 指标文件超过该大小时轮转为 .1
+MAX_METRICS_FILE_BYTES = 10 * 1024 * 1024
+
+
+def _percentile(ordered: List[float], pct: float) -> float:
+    """已排序样本的最近秩分位数"""
+    if not ordered:
+        return 0.0
+    rank = max(1, math.ceil(len(ordered) * pct / 100))
+    return ordered[rank - 1]
+
+
+class JobMetrics:
+    """一个任务的阶段耗时和计数（线程安全，分片上传线程可同时记录）"""
+
+    def __init__(self, kind: str, video_id: str = '', **labels: Any):
+        self.kind = kind
+        self.video_id = video_id
+        self.labels = labels
+        self.started = time.time()
+        self._start = time.monotonic()
+        self._lock = threading.Lock()
+        # 阶段 -> 各次耗时（秒）
+        self.phases: Dict[str, List[float]] = {}
+        self.counters: Dict[str, int] = {}
+        # 进度钩子记录的最后一个文件下载完成的时间
+        self._last_finished: Optional[float] = None
+
+    def add_phase(self, name: str, seconds: float):
+        with self._lock:
+            self.phases.setdefault(name, []).append(seconds)
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        """计时一个阶段，同一阶段可多次进入（例如每个分片）"""
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.add_phase(name, time.monotonic() - start)
+
+    def add(self, counter: str, value: int = 1):
+        with self._lock:
+            self.counters[counter] = self.counters.get(counter, 0) + value
+
+    def progress_hook(self, d: Dict[str, Any]):
+        """yt-dlp进度钩子：记录每个文件下载完成的时间和字节数，用于区分下载和后处理阶段"""
+        if d['status'] == 'finished':
+            self._last_finished = time.monotonic()
+            self.add('bytes_downloaded', d.get('total_bytes') or d.get('downloaded_bytes') or 0)
+
+    def record_download(self, started: float):
+        """
+        process_ie_result 返回后调用：最后一个文件下载完成之前计为download，
+        之后（合并、转封装、移动文件）计为merge
+
+        Args:
+            started: 开始下载时的 time.monotonic()
+        """
+        end = time.monotonic()
+        finished = self._last_finished if self._last_finished is not None else end
+        self.add_phase('download', max(0.0, finished - started))
+        self.add_phase('merge', max(0.0, end - finished))
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            phases = {
+                name: {'count': len(samples), 'total_s': round(sum(samples), 4)}
+                for name, samples in self.phases.items()
+            }
+            counters = dict(self.counters)
+        return {
+            'ts': round(self.started, 3),
+            'kind': self.kind,
+            'videoId': self.video_id,
+            **self.labels,
+            'wall_s': round(time.monotonic() - self._start, 4),
+            'phases': phases,
+            'counters': counters,
+        }
+
+
+class _NullMetrics(JobMetrics):
+    """不在任务范围内时使用，丢弃所有记录"""
+
+    def __init__(self):
+        super().__init__('none')
+
+    def add_phase(self, name: str, seconds: float):
+        pass
+
+    def add(self, counter: str, value: int = 1):
+        pass
+
+    def progress_hook(self, d: Dict[str, Any]):
+        pass
+
+    def record_download(self, started: float):
+        pass
+
+
+_NULL_METRICS = _NullMetrics()
+_current: contextvars.ContextVar[JobMetrics] = contextvars.ContextVar('job_metrics', default=_NULL_METRICS)
+
+
+def current_metrics() -> JobMetrics:
+    """当前任务的指标（不在任务范围内时返回空对象）"""
+    return _current.get()
+
+
+class MetricsRecorder:
+    """汇总所有任务的指标，并把每个任务的结果追加到JSON Lines文件"""
+
+    def __init__(self, metrics_path: Optional[str] = None):
+        """
+        初始化指标记录器
+
+        Args:
+            metrics_path: 指标文件路径，None则使用项目根目录下的tmp/metrics.jsonl
+        """
+        if metrics_path is None:
+            current_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+            metrics_path = os.path.join(current_dir, 'tmp', 'metrics.jsonl')
+        self.metrics_path = metrics_path
+        self._lock = threading.Lock()
+        self._samples: Dict[str, Deque[float]] = {}
+        self._phase_totals: Dict[str, List[float]] = {}
+        self._counters: Dict[str, int] = {}
+        self._jobs: Dict[str, int] = {}
+        self._recent: Deque[Dict[str, Any]] = deque(maxlen=RECENT_JOBS)
+
+        os.makedirs(os.path.dirname(os.path.abspath(self.metrics_path)), exist_ok=True)
+
+    @contextmanager
+    def job(self, kind: str, video_id: str = '', **labels: Any) -> Iterator[JobMetrics]:
+        """
+        在任务范围内记录指标，退出时写入指标文件
+
+        范围内抛出异常时状态记为error；调用方也可以在范围内设置 metrics.labels['status']
+        """
+        metrics = JobMetrics(kind, video_id, **labels)
+        token = _current.set(metrics)
+        try:
+            yield metrics
+        except BaseException:
+            metrics.labels.setdefault('status', 'error')
+            raise
+        finally:
+            _current.reset(token)
+            metrics.labels.setdefault('status', 'ok')
+            self.record(metrics)
+
+    def record(self, metrics: JobMetrics):
+        """汇总一个已结束任务的指标并写入文件"""
+        entry = metrics.to_dict()
+        with metrics._lock:
+            phases = {name: list(samples) for name, samples in metrics.phases.items()}
+        with self._lock:
+            key = f"{entry['kind']}:{entry['status']}"
+            self._jobs[key] = self._jobs.get(key, 0) + 1
+            for name, samples in phases.items():
+                self._samples.setdefault(name, deque(maxlen=SAMPLES_PER_PHASE)).extend(samples)
+                totals = self._phase_totals.setdefault(name, [0, 0.0])
+                totals[0] += len(samples)
+                totals[1] += sum(samples)
+            for name, value in entry['counters'].items():
+                self._counters[name] = self._counters.get(name, 0) + value
+            self._recent.append(entry)
+            self._write(entry)
+
+    def _write(self, entry: Dict[str, Any]):
+        """追加一行到指标文件（需持有锁）"""
+        try:
+            if os.path.exists(self.metrics_path) and os.path.getsize(self.metrics_path) > MAX_METRICS_FILE_BYTES:
+                os.replace(self.metrics_path, self.metrics_path + '.1')
+            with open(self.metrics_path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+        except OSError as e:
+            logger.warning(f"写入指标文件失败: {self.metrics_path}: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        """汇总：各阶段的次数、总耗时和分位数，各计数器的总和，以及最近的任务"""
+        with self._lock:
+            phases = {}
+            for name, samples in self._samples.items():
+                ordered = sorted(samples)
+                count, total = self._phase_totals[name]
+                phases[name] = {
+                    'count': count,
+                    'total_s': round(total, 3),
+                    'avg_ms': round(total / count * 1000, 1) if count else 0.0,
+                    'p50_ms': round(_percentile(ordered, 50) * 1000, 1),
+                    'p95_ms': round(_percentile(ordered, 95) * 1000, 1),
+                    'max_ms': round(ordered[-1] * 1000, 1) if ordered else 0.0,
+                }
+            return {
+                'jobs': dict(self._jobs),
+                'phases': phases,
+                'counters': dict(self._counters),
+                'recent': list(self._recent),
+                'metricsFile': self.metrics_path,
+            }
+
+
+# 全局指标记录器实例
+_default_metrics = None
+
+
+def get_metrics() -> MetricsRecorder:
+    """获取指标记录器实例（单例模式），指标文件路径可由环境变量 YT_METRICS_FILE 配置"""
+    global _default_metrics
+    if _default_metrics is None:
+        _default_metrics = MetricsRecorder(os.getenv('YT_METRICS_FILE') or None)
+    return _default_metrics
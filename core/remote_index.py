@@ -0,0 +1,189 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+远程文件索引模块
+记录已同步到网盘的视频（视频ID -> 网盘路径、fs_id、大小、本地文件内容MD5），
+下载和上传前先查索引，已同步的视频不再重复处理
+"""
+
+import os
+import re
+import json
+import time
+import threading
+from typing import Any, Dict, Iterable, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+# 下载文件名模板为 "%(title)s [%(id)s].%(ext)s"，从文件名中取出视频ID
+_VIDEO_ID_PATTERN = re.compile(r'\[([^\[\]]+)\]\.[^./]+$')
+# 按需同步失败后，在此期间内不再自动重试（sync_index 命令不受限制）
+SYNC_RETRY_INTERVAL = 24 * 3600
+
+
+def video_id_from_filename(filename: str) -> Optional[str]:
+    """从下载文件名中解析视频ID，不符合命名模板时返回None"""
+    match = _VIDEO_ID_PATTERN.search(filename)
+    return match.group(1) if match else None
+
+
+class RemoteIndex:
+    """已同步视频索引，持久化到JSON文件"""
+
+    def __init__(self, index_path: Optional[str] = None):
+        """
+        初始化远程索引
+
+        Args:
+            index_path: 索引文件路径，None则使用项目根目录下的tmp/remote_index.json
+        """
+        if index_path is None:
+            current_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+            index_path = os.path.join(current_dir, 'tmp', 'remote_index.json')
+        self.index_path = index_path
+        # 记录最近一次按需同步失败的时间，新启动的进程据此不再重复尝试
+        self.sync_failure_path = index_path + '.failed'
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Dict[str, Any]] = {}
+
+        os.makedirs(os.path.dirname(os.path.abspath(self.index_path)), exist_ok=True)
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.index_path):
+            return
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                self._entries = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"远程索引文件损坏，已忽略: {self.index_path}: {e}")
+
+    def _save(self):
+        """原子地写回索引文件（需持有锁）"""
+        tmp_path = self.index_path + '.tmp'
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self._entries, f, ensure_ascii=False)
+            os.replace(tmp_path, self.index_path)
+        except OSError as e:
+            logger.warning(f"写入远程索引失败: {self.index_path}: {e}")
+
+    def needs_sync(self) -> bool:
+        """索引文件不存在、且最近没有按需同步失败的记录时返回True"""
+        if os.path.exists(self.index_path):
+            return False
+        try:
+            with open(self.sync_failure_path, 'r', encoding='utf-8') as f:
+                failed_at = float(json.load(f)['failed_at'])
+        except (OSError, ValueError, KeyError, TypeError):
+            return True
+        return time.time() - failed_at >= SYNC_RETRY_INTERVAL
+
+    def mark_sync_failed(self, error: Exception):
+        """记录按需同步失败，SYNC_RETRY_INTERVAL 内不再自动重试"""
+        try:
+            with open(self.sync_failure_path, 'w', encoding='utf-8') as f:
+                json.dump({'failed_at': time.time(), 'error': str(error)}, f, ensure_ascii=False)
+        except OSError as e:
+            logger.warning(f"记录远程索引同步失败出错: {self.sync_failure_path}: {e}")
+
+    def get(self, video_id: str) -> Optional[Dict[str, Any]]:
+        """查找已同步的视频，返回 {'path', 'fs_id', 'size', 'content_md5', 'synced_at'}"""
+        with self._lock:
+            entry = self._entries.get(video_id)
+            return dict(entry) if entry else None
+
+    def record(self, video_id: str, info: Dict[str, Any], content_md5: Optional[str] = None):
+        """
+        记录一个已同步的视频
+
+        Args:
+            video_id: 视频ID
+            info: 网盘返回的文件信息（create/rapidupload/list 的结果，至少包含path）
+            content_md5: 本地文件的内容MD5（上传时计算的摘要），可与本地文件比较判断是否变化
+        """
+        if not video_id or not info.get('path'):
+            return
+        with self._lock:
+            self._entries[video_id] = self._entry(info, content_md5)
+            self._save()
+
+    def remove(self, video_id: str):
+        """删除索引中的视频（例如网盘文件已被删除）"""
+        with self._lock:
+            if self._entries.pop(video_id, None) is not None:
+                self._save()
+
+    @staticmethod
+    def _entry(info: Dict[str, Any], content_md5: Optional[str] = None) -> Dict[str, Any]:
+        # 网盘接口返回的md5是服务端计算的值，与本地文件的内容MD5不同，不记入索引
+        return {
+            'path': info.get('path', ''),
+            'fs_id': info.get('fs_id', ''),
+            'size': info.get('size', 0),
+            'content_md5': content_md5 or '',
+            'synced_at': time.time(),
+        }
+
+    def rebuild(self, remote_dir: str, files: Iterable[Dict[str, Any]]) -> int:
+        """
+        用网盘目录的完整列表重建该目录下的索引
+
+        目录下已不存在的视频从索引中删除，其他目录的记录保持不变
+
+        Args:
+            remote_dir: 网盘目录
+            files: 该目录下的文件列表（xpan list 接口返回的条目）
+
+        Returns:
+            该目录下索引到的视频数
+        """
+        prefix = remote_dir.rstrip('/') + '/'
+        entries = {}
+        for info in files:
+            if info.get('isdir'):
+                continue
+            video_id = video_id_from_filename(info.get('server_filename') or os.path.basename(info.get('path', '')))
+            if video_id:
+                entries[video_id] = self._entry(info)
+
+        with self._lock:
+            # 目录列表中没有本地内容MD5，同一文件沿用上传时记录的值
+            for video_id, entry in entries.items():
+                old = self._entries.get(video_id)
+                if old and old.get('path') == entry['path'] and old.get('size') == entry['size']:
+                    entry['content_md5'] = old.get('content_md5', '')
+            self._entries = {
+                video_id: entry for video_id, entry in self._entries.items()
+                if not entry.get('path', '').startswith(prefix)
+            }
+            self._entries.update(entries)
+            self._save()
+        if os.path.exists(self.sync_failure_path):
+            try:
+                os.remove(self.sync_failure_path)
+            except OSError:
+                pass
+        logger.info(f"远程索引已重建: {remote_dir}, 视频数: {len(entries)}")
+        return len(entries)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def __contains__(self, video_id: str) -> bool:
+        with self._lock:
+            return video_id in self._entries
+
+
+# 全局远程索引实例
+_default_remote_index = None
+
+
+def get_remote_index() -> RemoteIndex:
+    """获取远程索引实例（单例模式）"""
+    global _default_remote_index
+    if _default_remote_index is None:
+        _default_remote_index = RemoteIndex()
+    return _default_remote_index
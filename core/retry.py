@@ -0,0 +1,185 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+重试模块
+百度网盘接口调用的指数退避重试：区分可重试的临时错误与应立即失败的鉴权、容量错误，
+并为每个分片和整个上传设置重试预算
+"""
+
+import time
+import random
+import threading
+from typing import Any, Awaitable, Callable, Optional, TypeVar
+import logging
+
+from .metrics import current_metrics
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+
+# 鉴权失败：-6 身份验证失败，111 access token 失效，6 不允许接入用户数据
+AUTH_ERRNOS = {-6, 6, 111}
+# 容量不足：-10 云端容量已满
+QUOTA_ERRNOS = {-10}
+# 频控及服务端临时错误：31034 命中接口频控，42000 访问过于频繁，42211/42212 服务繁忙，-1 内部错误
+RETRYABLE_ERRNOS = {-1, 31034, 42000, 42211, 42212}
+
+
+class BaiduApiError(Exception):
+    """百度网盘接口错误，errno为接口返回的错误码（HTTP错误时为None）"""
+
+    def __init__(self, message: str, errno: Optional[int] = None,
+                 status_code: Optional[int] = None, retryable: Optional[bool] = None):
+        super().__init__(message)
+        self.errno = errno
+        self.status_code = status_code
+        if retryable is None:
+            retryable = self._classify(errno, status_code)
+        self.retryable = retryable
+
+    @staticmethod
+    def _classify(errno: Optional[int], status_code: Optional[int]) -> bool:
+        if errno in AUTH_ERRNOS or errno in QUOTA_ERRNOS:
+            return False
+        if errno in RETRYABLE_ERRNOS:
+            return True
+        if status_code is not None and (status_code >= 500 or status_code == 429):
+            return True
+        # 其余业务错误（参数错误、文件已存在等）重试也不会成功
+        return False
+
+
+class RetryBudget:
+    """多个调用共享的重试次数上限（线程安全），避免网络整体故障时每个分片都重试到底"""
+
+    def __init__(self, total: int):
+        self.remaining = total
+        self._lock = threading.Lock()
+
+    def take(self) -> bool:
+        """消耗一次重试机会，预算耗尽时返回False"""
+        with self._lock:
+            if self.remaining <= 0:
+                return False
+            self.remaining -= 1
+            return True
+
+
+def is_retryable(exc: BaseException) -> bool:
+    """判断异常是否值得重试"""
+    if isinstance(exc, BaiduApiError):
+        return exc.retryable
+    # 连接错误、超时（requests 的异常均继承自 IOError）
+    return isinstance(exc, OSError)
+
+
+class RetryPolicy:
+    """指数退避重试策略（全抖动）"""
+
+    def __init__(self, max_attempts: int = 5, base_delay: float = 1.0, max_delay: float = 30.0):
+        """
+        初始化重试策略
+
+        Args:
+            max_attempts: 单次调用的最大尝试次数（含第一次）
+            base_delay: 第一次重试前的最大等待时间（秒），之后每次翻倍
+            max_delay: 单次等待时间上限（秒）
+        """
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def backoff(self, attempt: int) -> float:
+        """第attempt次失败后的等待时间，在[0, base*2^(attempt-1)]内随机，避免并发分片同时重试"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+    def call(
+        self,
+        fn: Callable[..., T],
+        *args: Any,
+        description: str = '',
+        budget: Optional[RetryBudget] = None,
+        should_abort: Optional[Callable[[], bool]] = None,
+        **kwargs: Any
+    ) -> T:
+        """
+        调用fn，遇到可重试的错误时退避后重试
+
+        Args:
+            fn: 被调用的函数
+            description: 日志中的操作名称
+            budget: 共享的重试预算，耗尽后不再重试
+            should_abort: 返回True时不再重试（例如任务被取消）
+
+        Returns:
+            fn的返回值，最后一次失败的异常原样抛出
+        """
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                return fn(*args, **kwargs)
+            except Exception as e:
+                delay = self._next_delay(e, attempt, description, budget, should_abort)
+                if delay is None:
+                    raise
+                self._sleep(delay, should_abort)
+
+    async def call_async(
+        self,
+        fn: Callable[..., Awaitable[T]],
+        *args: Any,
+        description: str = '',
+        budget: Optional[RetryBudget] = None,
+        should_abort: Optional[Callable[[], bool]] = None,
+        **kwargs: Any
+    ) -> T:
+        """call 的协程版本：fn返回可等待对象，退避期间不阻塞事件循环"""
+        # 只有异步上传器会用到，不在本地消息主机启动时加载asyncio
+        import asyncio
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                return await fn(*args, **kwargs)
+            except Exception as e:
+                delay = self._next_delay(e, attempt, description, budget, should_abort)
+                if delay is None:
+                    raise
+                deadline = time.monotonic() + delay
+                while not (should_abort is not None and should_abort()):
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    await asyncio.sleep(min(remaining, 0.5))
+
+    def _next_delay(
+        self,
+        exc: Exception,
+        attempt: int,
+        description: str,
+        budget: Optional[RetryBudget],
+        should_abort: Optional[Callable[[], bool]]
+    ) -> Optional[float]:
+        """第attempt次失败后的等待时间，不应重试时返回None"""
+        if not is_retryable(exc) or attempt >= self.max_attempts:
+            return None
+        if should_abort is not None and should_abort():
+            return None
+        if budget is not None and not budget.take():
+            logger.warning(f"{description} 重试预算已耗尽: {exc}")
+            return None
+        delay = self.backoff(attempt)
+        current_metrics().add('retries')
+        logger.warning(f"{description} 第 {attempt} 次失败，{delay:.1f}s 后重试: {exc}")
+        return delay
+
+    @staticmethod
+    def _sleep(delay: float, should_abort: Optional[Callable[[], bool]]):
+        deadline = time.monotonic() + delay
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or (should_abort is not None and should_abort()):
+                return
+            time.sleep(min(remaining, 0.5))
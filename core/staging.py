@@ -0,0 +1,322 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+下载暂存区模块
+管理tmp目录的磁盘占用：字节预算、已上传文件按时间淘汰、下载前的准入控制和剩余空间检查
+
+预算只计算暂存区记录的媒体文件（经由准入控制下载完成的文件）和下载中已写入的数据，
+同目录下的缓存、索引等文件不计入
+"""
+
+import os
+import json
+import time
+import shutil
+import threading
+from typing import Any, Callable, Dict, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+# 暂存区自身的索引文件名
+INDEX_FILENAME = 'staging_index.json'
+# 等待暂存空间的默认最长时间（秒）
+DEFAULT_RESERVE_TIMEOUT = 30 * 60
+
+
+class StagingError(Exception):
+    """暂存区错误异常类"""
+    pass
+
+
+class Reservation:
+    """一次下载预留的空间，随下载进度逐步转化为实际占用"""
+
+    def __init__(self, staging: 'StagingArea', expected_bytes: int):
+        self.staging = staging
+        self.expected_bytes = expected_bytes
+        self._written: Dict[str, int] = {}
+        self.released = False
+
+    @property
+    def written(self) -> int:
+        """已写入磁盘的字节数"""
+        return sum(self._written.values())
+
+    @property
+    def outstanding(self) -> int:
+        """尚未落盘的预留字节数"""
+        return max(0, self.expected_bytes - self.written)
+
+    def progress_hook(self, d: Dict[str, Any]):
+        """yt-dlp进度钩子：已写入磁盘的部分不再重复计入预留"""
+        if d.get('status') == 'downloading':
+            name = d.get('tmpfilename') or d.get('filename') or ''
+            self._written[name] = d.get('downloaded_bytes') or 0
+
+    def release(self):
+        """下载结束（成功或失败）后释放预留"""
+        if not self.released:
+            self.released = True
+            self.staging._release(self)
+
+
+class DownloadAdmission:
+    """
+    绑定到一次下载的准入控制
+
+    before_download 注册为yt-dlp的下载前钩子（格式选择之后），按预计大小预留空间，
+    progress_hook 注册为进度钩子，after_download 注册为下载后钩子（记录最终文件），
+    下载结束后调用 release。
+    """
+
+    def __init__(self, staging: 'StagingArea', should_abort: Optional[Callable[[], bool]] = None):
+        self.staging = staging
+        self.should_abort = should_abort
+        self.reservation: Optional[Reservation] = None
+
+    def before_download(self, info: Dict[str, Any]):
+        # 播放列表中的每个视频都会调用一次，上一个视频已经落盘
+        self.release()
+        self.reservation = self.staging.reserve(self.staging.expected_size(info),
+                                                should_abort=self.should_abort)
+
+    def progress_hook(self, d: Dict[str, Any]):
+        if self.reservation is not None:
+            self.reservation.progress_hook(d)
+
+    def after_download(self, info: Dict[str, Any]):
+        if info.get('filepath'):
+            self.staging.track(info['filepath'])
+
+    def release(self):
+        if self.reservation is not None:
+            self.reservation.release()
+            self.reservation = None
+
+
+class StagingArea:
+    """下载暂存区"""
+
+    def __init__(
+        self,
+        staging_dir: Optional[str] = None,
+        byte_budget: Optional[int] = None,
+        min_free_bytes: int = 1024 * 1024 * 1024,
+        poll_interval: float = 5.0,
+        reserve_timeout: Optional[float] = DEFAULT_RESERVE_TIMEOUT
+    ):
+        """
+        初始化暂存区
+
+        Args:
+            staging_dir: 暂存目录，None则使用项目根目录下的tmp
+            byte_budget: 暂存目录的字节预算，None则不限制（仍检查磁盘剩余空间）
+            min_free_bytes: 磁盘上至少保留的剩余空间
+            poll_interval: 等待空间时重新检查的间隔（秒），目录可能被外部修改
+            reserve_timeout: reserve 未指定timeout时的最长等待时间（秒），None则一直等待
+        """
+        if staging_dir is None:
+            current_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+            staging_dir = os.path.join(current_dir, 'tmp')
+        self.staging_dir = staging_dir
+        self.byte_budget = byte_budget
+        self.min_free_bytes = min_free_bytes
+        self.poll_interval = poll_interval
+        self.reserve_timeout = reserve_timeout
+        self._cond = threading.Condition()
+        self._reservations = []
+        # 暂存区记录的媒体文件 -> 记录时间
+        self._files: Dict[str, float] = {}
+        # 已上传文件 -> 上传完成时间
+        self._uploaded: Dict[str, float] = {}
+        self._index_path = os.path.join(self.staging_dir, INDEX_FILENAME)
+
+        os.makedirs(self.staging_dir, exist_ok=True)
+        self._load_index()
+
+    def _load_index(self):
+        if not os.path.exists(self._index_path):
+            return
+        try:
+            with open(self._index_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if 'uploaded' in data:
+                files, uploaded = data.get('files') or {}, data['uploaded']
+            else:
+                # 旧版索引只记录已上传文件
+                files, uploaded = data, data
+        except (OSError, ValueError, AttributeError) as e:
+            logger.warning(f"暂存区索引损坏，已忽略: {e}")
+            return
+        self._uploaded = {path: ts for path, ts in uploaded.items() if os.path.exists(path)}
+        self._files = {path: ts for path, ts in files.items() if os.path.exists(path)}
+        self._files.update(self._uploaded)
+
+    def _save_index(self):
+        tmp_path = self._index_path + '.tmp'
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'files': self._files, 'uploaded': self._uploaded}, f, ensure_ascii=False)
+            os.replace(tmp_path, self._index_path)
+        except OSError as e:
+            logger.warning(f"写入暂存区索引失败: {e}")
+
+    def disk_usage(self) -> int:
+        """记录的媒体文件和下载中已写入数据的实际占用（字节）"""
+        total = sum(r.written for r in self._reservations)
+        for path in list(self._files):
+            try:
+                total += os.path.getsize(path)
+            except OSError:
+                pass
+        return total
+
+    def _reserved(self) -> int:
+        return sum(r.outstanding for r in self._reservations)
+
+    def usage(self) -> Dict[str, Any]:
+        """暂存区状态"""
+        with self._cond:
+            return {
+                'dir': self.staging_dir,
+                'used': self.disk_usage(),
+                'reserved': self._reserved(),
+                'budget': self.byte_budget,
+                'free': shutil.disk_usage(self.staging_dir).free,
+                'evictable': len(self._uploaded),
+            }
+
+    @staticmethod
+    def expected_size(info: Dict[str, Any]) -> int:
+        """根据（已选择格式的）info估算下载需要的空间"""
+        formats = info.get('requested_formats') or [info]
+        total = sum(fmt.get('filesize') or fmt.get('filesize_approx') or 0 for fmt in formats)
+        if len(formats) > 1:
+            # 合并时各分轨文件和合并后的文件会同时存在
+            total *= 2
+        return int(total)
+
+    def _shortfall(self, needed: int) -> int:
+        """满足needed字节还差多少空间（需持有锁）"""
+        shortfall = 0
+        reserved = self._reserved()
+        if self.byte_budget is not None:
+            shortfall = self.disk_usage() + reserved + needed - self.byte_budget
+        free = shutil.disk_usage(self.staging_dir).free - self.min_free_bytes
+        return max(shortfall, reserved + needed - free, 0)
+
+    def _evict(self, needed_bytes: int) -> int:
+        """按上传完成时间从旧到新删除已上传文件（需持有锁），返回释放的字节数"""
+        freed = 0
+        for path, _ in sorted(self._uploaded.items(), key=lambda item: item[1]):
+            if freed >= needed_bytes:
+                break
+            try:
+                size = os.path.getsize(path)
+                os.remove(path)
+                freed += size
+                logger.info(f"暂存区淘汰已上传文件: {path} ({size} 字节)")
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.warning(f"删除已上传文件失败: {path}: {e}")
+                continue
+            del self._uploaded[path]
+            self._files.pop(path, None)
+        if freed:
+            self._save_index()
+        return freed
+
+    def reserve(
+        self,
+        expected_bytes: int,
+        timeout: Optional[float] = None,
+        should_abort: Optional[Callable[[], bool]] = None
+    ) -> Reservation:
+        """
+        为一次下载申请空间，空间不足时先淘汰已上传文件，仍不足则等待
+
+        Args:
+            expected_bytes: 预计文件大小（未知时为0，只要求当前未超出预算）
+            timeout: 最长等待时间（秒），None则使用 reserve_timeout
+            should_abort: 返回True时放弃等待（例如任务被取消）
+
+        Returns:
+            预留对象，下载结束后必须调用release()
+        """
+        if self.byte_budget is not None and expected_bytes > self.byte_budget:
+            raise StagingError(f"文件大小 {expected_bytes} 超出暂存区预算 {self.byte_budget}")
+
+        if timeout is None:
+            timeout = self.reserve_timeout
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while True:
+                shortfall = self._shortfall(expected_bytes)
+                if shortfall > 0:
+                    shortfall -= self._evict(shortfall)
+                if shortfall <= 0:
+                    reservation = Reservation(self, expected_bytes)
+                    self._reservations.append(reservation)
+                    return reservation
+
+                if should_abort is not None and should_abort():
+                    raise StagingError("等待暂存空间时任务被取消")
+                wait = self.poll_interval
+                if deadline is not None:
+                    wait = min(wait, deadline - time.monotonic())
+                    if wait <= 0:
+                        raise StagingError(
+                            f"等待暂存空间 {timeout:.0f} 秒后超时，仍缺少 {shortfall} 字节：没有可淘汰的已上传文件，"
+                            f"请上传或删除暂存目录 {self.staging_dir} 中的文件，"
+                            f"或调整 YT_STAGING_BUDGET_MB / YT_STAGING_MIN_FREE_MB")
+                logger.info(f"暂存空间不足，等待释放 {shortfall} 字节")
+                self._cond.wait(wait)
+
+    def _release(self, reservation: Reservation):
+        with self._cond:
+            if reservation in self._reservations:
+                self._reservations.remove(reservation)
+            self._cond.notify_all()
+
+    def admission(self, should_abort: Optional[Callable[[], bool]] = None) -> DownloadAdmission:
+        """为一次下载创建准入控制"""
+        return DownloadAdmission(self, should_abort)
+
+    def track(self, path: str):
+        """记录下载完成的媒体文件，计入暂存区占用"""
+        path = os.path.abspath(path)
+        with self._cond:
+            if not os.path.exists(path):
+                return
+            self._files[path] = time.time()
+            self._save_index()
+
+    def mark_uploaded(self, path: str):
+        """标记文件已上传，之后可被淘汰"""
+        path = os.path.abspath(path)
+        with self._cond:
+            if not os.path.exists(path):
+                return
+            self._uploaded[path] = time.time()
+            self._files.setdefault(path, self._uploaded[path])
+            self._save_index()
+            self._cond.notify_all()
+
+
+# 全局暂存区实例
+_default_staging = None
+
+
+def get_staging_area() -> StagingArea:
+    """获取暂存区实例（单例模式），预算由环境变量 YT_STAGING_BUDGET_MB / YT_STAGING_MIN_FREE_MB 配置"""
+    global _default_staging
+    if _default_staging is None:
+        budget_mb = os.getenv('YT_STAGING_BUDGET_MB')
+        min_free_mb = int(os.getenv('YT_STAGING_MIN_FREE_MB', '1024'))
+        _default_staging = StagingArea(
+            byte_budget=int(budget_mb) * 1024 * 1024 if budget_mb else None,
+            min_free_bytes=min_free_mb * 1024 * 1024
+        )
+    return _default_staging
@@ -0,0 +1,190 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+YoutubeDL实例池模块
+按配置档复用预热好的YoutubeDL实例，保留cookie、提取器和播放器JS/nsig缓存
+"""
+
+import json
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, TYPE_CHECKING
+import logging
+
+if TYPE_CHECKING:
+    import yt_dlp
+
+logger = logging.getLogger(__name__)
+
+
+class _ProgressDispatcher:
+    """实例级进度钩子，转发给当前租用者注册的钩子"""
+
+    def __init__(self):
+        self.hooks: List[Callable[[Dict[str, Any]], None]] = []
+
+    def __call__(self, d: Dict[str, Any]):
+        for hook in self.hooks:
+            hook(d)
+
+
+def _make_hook_pp(ydl: 'yt_dlp.YoutubeDL', dispatcher: _ProgressDispatcher):
+    """创建调用dispatcher的后处理器（由添加时的when决定调用时机）"""
+    from yt_dlp.postprocessor.common import PostProcessor
+
+    class _HookPP(PostProcessor):
+        def run(self, info):
+            dispatcher(info)
+            return [], info
+
+    return _HookPP(ydl)
+
+
+class YoutubeDLPool:
+    """
+    YoutubeDL实例池
+
+    配置相同的请求共享同一组实例；每个实例同一时间只租给一个任务，
+    进度钩子和下载前后的钩子在租用期间绑定，归还时解绑。
+    """
+
+    def __init__(self, max_per_profile: int = 4):
+        """
+        初始化实例池
+
+        Args:
+            max_per_profile: 每个配置档最多创建的实例数，超出时等待归还
+        """
+        self.max_per_profile = max(1, max_per_profile)
+        self._cond = threading.Condition()
+        self._idle: Dict[str, List['yt_dlp.YoutubeDL']] = {}
+        self._created: Dict[str, int] = {}
+        self._dispatchers: Dict[int, _ProgressDispatcher] = {}
+        self._before_download: Dict[int, _ProgressDispatcher] = {}
+        self._after_download: Dict[int, _ProgressDispatcher] = {}
+        self._closed = False
+
+    @staticmethod
+    def profile_key(options: Dict[str, Any]) -> str:
+        """配置档键：选项内容的稳定序列化（进度钩子不属于配置档）"""
+        options = {k: v for k, v in options.items() if k != 'progress_hooks'}
+        return json.dumps(options, sort_keys=True, ensure_ascii=False, default=repr)
+
+    def _create(self, options: Dict[str, Any]) -> 'yt_dlp.YoutubeDL':
+        # yt_dlp 导入较慢，首次创建实例时才加载
+        import yt_dlp
+        dispatcher = _ProgressDispatcher()
+        options = dict(options, progress_hooks=[dispatcher])
+        ydl = yt_dlp.YoutubeDL(options)
+        before_download = _ProgressDispatcher()
+        ydl.add_post_processor(_make_hook_pp(ydl, before_download), when='before_dl')
+        # after_move：合并等后处理完成、文件移到最终位置之后
+        after_download = _ProgressDispatcher()
+        ydl.add_post_processor(_make_hook_pp(ydl, after_download), when='after_move')
+        self._dispatchers[id(ydl)] = dispatcher
+        self._before_download[id(ydl)] = before_download
+        self._after_download[id(ydl)] = after_download
+        return ydl
+
+    def warm(self, options: Dict[str, Any], count: int = 1):
+        """预先创建实例（可在后台线程中调用）"""
+        key = self.profile_key(options)
+        for _ in range(count):
+            with self._cond:
+                if self._closed or self._created.get(key, 0) >= self.max_per_profile:
+                    return
+                self._created[key] = self._created.get(key, 0) + 1
+            try:
+                ydl = self._create(options)
+            except Exception:
+                with self._cond:
+                    self._created[key] -= 1
+                raise
+            with self._cond:
+                self._idle.setdefault(key, []).append(ydl)
+                self._cond.notify()
+
+    @contextmanager
+    def acquire(
+        self,
+        options: Dict[str, Any],
+        progress_hooks: Optional[List[Callable[[Dict[str, Any]], None]]] = None,
+        before_download: Optional[List[Callable[[Dict[str, Any]], None]]] = None,
+        after_download: Optional[List[Callable[[Dict[str, Any]], None]]] = None
+    ) -> Iterator['yt_dlp.YoutubeDL']:
+        """
+        租用一个实例
+
+        Args:
+            options: yt-dlp选项（决定配置档）
+            progress_hooks: 本次租用期间生效的进度钩子
+            before_download: 本次租用期间生效的下载前钩子，参数为已选择格式的info（可阻塞或抛出异常中止下载）
+            after_download: 本次租用期间生效的下载后钩子，参数为后处理完成的info（info['filepath']为最终文件）
+        """
+        key = self.profile_key(options)
+        ydl = None
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise RuntimeError("YoutubeDL实例池已关闭")
+                idle = self._idle.get(key)
+                if idle:
+                    ydl = idle.pop()
+                    break
+                if self._created.get(key, 0) < self.max_per_profile:
+                    self._created[key] = self._created.get(key, 0) + 1
+                    break
+                self._cond.wait()
+
+        if ydl is None:
+            try:
+                ydl = self._create(options)
+            except Exception:
+                with self._cond:
+                    self._created[key] -= 1
+                    self._cond.notify()
+                raise
+
+        dispatcher = self._dispatchers[id(ydl)]
+        pre_dispatcher = self._before_download[id(ydl)]
+        post_dispatcher = self._after_download[id(ydl)]
+        dispatcher.hooks = list(progress_hooks or [])
+        pre_dispatcher.hooks = list(before_download or [])
+        post_dispatcher.hooks = list(after_download or [])
+        try:
+            yield ydl
+        finally:
+            dispatcher.hooks = []
+            pre_dispatcher.hooks = []
+            post_dispatcher.hooks = []
+            with self._cond:
+                if self._closed:
+                    ydl.close()
+                else:
+                    self._idle.setdefault(key, []).append(ydl)
+                self._cond.notify()
+
+    def close(self):
+        """关闭所有空闲实例（保存cookie），租用中的实例在归还时关闭"""
+        with self._cond:
+            self._closed = True
+            idle = [ydl for instances in self._idle.values() for ydl in instances]
+            self._idle.clear()
+            self._cond.notify_all()
+        for ydl in idle:
+            try:
+                ydl.close()
+            except Exception as e:
+                logger.warning(f"关闭YoutubeDL实例失败: {e}")
+
+
+# 全局实例池
+_default_pool = None
+
+
+def get_ydl_pool() -> YoutubeDLPool:
+    """获取YoutubeDL实例池（单例模式）"""
+    global _default_pool
+    if _default_pool is None:
+        _default_pool = YoutubeDLPool()
+    return _default_pool
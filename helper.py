@@ -1,8 +1,8 @@
 import argparse
+import atexit
 import sys
-from typing import Callable
-
-import yt_dlp
+import threading
+from typing import Callable, List, Optional
 
 HEARTBEAT_SEC = 5
 
@@ -11,11 +11,19 @@ def log(message: str):
     with open('/tmp/native_host.log', 'a') as f:
         f.write(f"{message}\n")
 
+_writer = None
+
+def get_writer():
+    """获取消息写出器（首次调用时创建，进程退出前写出剩余消息）"""
+    global _writer
+    if _writer is None:
+        _writer = MessageWriter(sys.stdout.buffer, progress_interval=PROGRESS_INTERVAL)
+        atexit.register(_writer.close)
+    return _writer
+
 def send_json(obj):
-    body = json.dumps(obj, ensure_ascii=False).encode('utf-8')
-    sys.stdout.buffer.write(len(body).to_bytes(4, 'little'))
-    sys.stdout.buffer.write(body)
-    sys.stdout.buffer.flush()
+    # 所有消息经由单一写线程写出，并发任务的消息帧不会交错
+    get_writer().send(obj)
 
 def read_json():
     raw_len = sys.stdin.buffer.read(4)
@@ -30,12 +38,33 @@ def handle_ping():
 
 import os
 import json
-from core.baidupan import handle_upload
+from core import init_package
+from core.bandwidth import get_bandwidth_scheduler
+from core.baidupan import (
+    cached_max_chunk_size, choose_chunk_size, ensure_remote_index, handle_upload, handle_upload_batch,
+    sync_remote_index
+)
+from core.download import VideoDownloader
+from core.jobs import Job, JobScheduler
+from core.messaging import MessageWriter
+from core.metrics import get_metrics
+from core.remote_index import get_remote_index
+from core.staging import get_staging_area
+from core.ydlpool import get_ydl_pool
 
 
 # 百度网盘配置（可以从环境变量或配置文件中读取）
 BAIDU_ACCESS_TOKEN = os.getenv('BAIDU_ACCESS_TOKEN', '121.27a0fc94de7788692e21f2132e18c48f.YGb5RHek4rGuPuCoMhL8nsZgBWZIUNtjaIbPXBY.0oT7xQ')
 
+# 任务并发配置
+DOWNLOAD_CONCURRENCY = int(os.getenv('YT_DOWNLOAD_CONCURRENCY', '2'))
+UPLOAD_CONCURRENCY = int(os.getenv('YT_UPLOAD_CONCURRENCY', '1'))
+# 同一任务两次进度消息的最小间隔（秒）
+PROGRESS_INTERVAL = float(os.getenv('YT_PROGRESS_INTERVAL', '0.5'))
+
+_scheduler: Optional[JobScheduler] = None
+_downloader: Optional[VideoDownloader] = None
+
 
 def handle_upload_command(video_id: str, local_path: str):
     """处理上传命令"""
@@ -54,42 +83,179 @@ def handle_upload_command(video_id: str, local_path: str):
     result = handle_upload(video_id, local_path, BAIDU_ACCESS_TOKEN)
     send_json(result)
 
-def loop_once():
+def get_scheduler(download_workers: int = DOWNLOAD_CONCURRENCY,
+                  upload_workers: int = UPLOAD_CONCURRENCY) -> JobScheduler:
+    """获取任务调度器（首次调用时创建）"""
+    global _scheduler
+    if _scheduler is None:
+        def run_download(job: Job, on_progress: Callable[[int], None]) -> str:
+            return download(job.video_id, on_progress, should_abort=job.cancel_event.is_set)
+
+        def on_uploaded(local_path: str, result: dict):
+            if result.get('status') == 'success':
+                # 已上传的文件可在暂存空间不足时被淘汰
+                get_staging_area().mark_uploaded(local_path)
+
+        def run_upload(job: Job) -> dict:
+            # 首次上传时才按需建立远程索引，不在启动时访问网盘
+            ensure_remote_index(BAIDU_ACCESS_TOKEN)
+            result = handle_upload(job.video_id, job.local_path, BAIDU_ACCESS_TOKEN,
+                                   cancel_event=job.cancel_event)
+            on_uploaded(job.local_path, result)
+            return result
+
+        def run_upload_batch(jobs: List[Job], on_result: Callable[[Job, dict], None],
+                             on_start: Callable[[Job], None]):
+            def report(index: int, result: dict):
+                on_uploaded(jobs[index].local_path, result)
+                on_result(jobs[index], result)
+
+            ensure_remote_index(BAIDU_ACCESS_TOKEN)
+            handle_upload_batch([{'videoId': job.video_id, 'localPath': job.local_path} for job in jobs],
+                                BAIDU_ACCESS_TOKEN,
+                                cancel_events=[job.cancel_event for job in jobs],
+                                on_result=report,
+                                on_start=lambda index: on_start(jobs[index]))
+
+        _scheduler = JobScheduler(run_download, run_upload, send_json,
+                                  download_workers=download_workers,
+                                  upload_workers=upload_workers,
+                                  upload_batch_fn=run_upload_batch)
+    return _scheduler
+
+def already_synced(video_id: str) -> Optional[dict]:
+    """视频已在网盘上时返回应答，不再下载或上传"""
+    entry = get_remote_index().get(video_id)
+    if entry is None:
+        return None
+    return {'status': 'exists', 'videoId': video_id, 'path': entry['path'], 'fs_id': entry['fs_id']}
+
+def start_info_lookup(video_ids: List[str]):
+    """后台并发查询视频信息，每查完一个就发送一条消息（结果写入信息缓存，随后的下载直接复用）"""
+    def run():
+        count = 0
+        for result in get_video_downloader().get_video_info_batch(video_ids):
+            if result['status'] == 'ok':
+                result = {'status': 'info', 'videoId': result['videoId'], 'info': result['info']}
+            send_json(result)
+            count += 1
+        send_json({'status': 'info_done', 'count': count})
+
+    threading.Thread(target=run, name='info-lookup', daemon=True).start()
+
+def start_playlist_expand(url: str, flat: bool = True):
+    """后台展开播放列表或频道，完成后发送视频条目列表"""
+    def run():
+        try:
+            entries = get_video_downloader().expand_playlist(url, flat=flat)
+            send_json({'status': 'playlist', 'url': url, 'entries': entries})
+        except Exception as e:
+            log(f'Playlist error: {e}')
+            send_json({'status': 'error', 'url': url, 'message': str(e)})
+
+    threading.Thread(target=run, name='playlist-expand', daemon=True).start()
+
+def handle_upload_files(files: List[dict], force: bool = False) -> dict:
+    """
+    批量上传命令：不存在或已同步的文件立即给出结果，其余文件作为一批提交
+
+    Returns:
+        {'status': 'queued', 'jobs': [{'jobId', 'videoId'}...], 'results': [不入队的文件的结果...]}
+    """
+    batch, results = [], []
+    for item in files:
+        video_id, local_path = item.get('videoId'), item.get('localPath')
+        if not local_path or not os.path.exists(local_path):
+            results.append({'status': 'error', 'message': f'文件不存在: {local_path}', 'videoId': video_id})
+            continue
+        synced = None if force else already_synced(video_id)
+        if synced is not None:
+            results.append(synced)
+            continue
+        batch.append({'videoId': video_id, 'localPath': local_path})
+
+    jobs = get_scheduler().submit_upload_batch(batch) if batch else []
+    return {
+        'status': 'queued',
+        'jobs': [{'jobId': job.job_id, 'videoId': job.video_id} for job in jobs],
+        'results': results
+    }
+
+def handle_request(req: dict) -> Optional[dict]:
+    """处理一条消息，耗时操作交给调度器，立即返回应答"""
+    cmd = req.get('cmd')
+    if cmd == 'ping':
+        return handle_ping()
+    elif cmd == 'enqueue':
+        # 已同步的视频只需查一次索引（force为真时强制重新同步）
+        synced = None if req.get('force') else already_synced(req['videoId'])
+        if synced is not None:
+            return synced
+        job = get_scheduler().submit_download(req['videoId'], req.get('title', ''),
+                                              upload=bool(req.get('upload', False)))
+        return {'status': 'queued', 'jobId': job.job_id, 'videoId': job.video_id}
+    elif cmd == 'info':
+        # 结果按查询完成的先后逐条发送
+        video_ids = req.get('videoIds') or [req['videoId']]
+        start_info_lookup(video_ids)
+        return {'status': 'looking_up', 'count': len(video_ids)}
+    elif cmd == 'playlist':
+        start_playlist_expand(req['url'], flat=req.get('flat', True))
+        return {'status': 'expanding', 'url': req['url']}
+    elif cmd == 'upload' and 'files' in req:
+        return handle_upload_files(req['files'], force=bool(req.get('force')))
+    elif cmd == 'upload':
+        local_path = req['localPath']
+        if not os.path.exists(local_path):
+            return {'status': 'error', 'message': f'文件不存在: {local_path}', 'videoId': req.get('videoId')}
+        synced = None if req.get('force') else already_synced(req['videoId'])
+        if synced is not None:
+            return synced
+        job = get_scheduler().submit_upload(req['videoId'], local_path)
+        return {'status': 'queued', 'jobId': job.job_id, 'videoId': job.video_id}
+    elif cmd == 'set_limits':
+        # 带宽限额（字节/秒），null或0表示不限速，未给出的方向保持不变
+        limits = {d: req[d] for d in ('download', 'upload') if d in req}
+        get_bandwidth_scheduler().set_limits(**limits)
+        return {'status': 'ok', 'limits': get_bandwidth_scheduler().limits()}
+    elif cmd == 'sync_index':
+        # 结果直接作为本命令的应答返回，不另发消息
+        try:
+            count = sync_remote_index(BAIDU_ACCESS_TOKEN)
+        except Exception as e:
+            log(f'Index sync error: {e}')
+            return {'status': 'error', 'message': f'同步远程索引失败: {e}'}
+        return {'status': 'index_synced', 'count': count}
+    elif cmd == 'status':
+        return get_scheduler().status(req.get('jobId'))
+    elif cmd == 'stats':
+        # 各阶段耗时分位数、字节数、重试次数及最近任务的明细
+        return {'status': 'ok', **get_metrics().stats()}
+    elif cmd == 'cancel':
+        return get_scheduler().cancel(req['jobId'])
+    return {'status': 'unknown_cmd'}
+
+def loop_once() -> bool:
+    """读取并处理一条消息，输入流关闭时返回False"""
     try:
         req = read_json()
         if req is None:
-            return
-        if req.get('cmd') == 'ping':
-            send_json(handle_ping())
-        elif req.get('cmd') == 'enqueue':
-            handle_enqueue(req['videoId'], req.get('title', ''))
+            return False
+        resp = handle_request(req)
+        if resp is not None:
+            send_json(resp)
     except Exception as e:
         log(f'Error in loop_once: {e}')
         send_json({'status': 'error', 'message': str(e)})
+    return True
 
 
-def download(video_id: str, on_progress: Callable[[int], None]) -> str:
-    # 获取项目根目录下的tmp文件夹
+def get_download_options() -> dict:
+    """本地消息主机覆盖的下载选项（输出模板由下载器按暂存目录生成）"""
     project_root = os.path.dirname(os.path.abspath(__file__))  # 项目根目录
-    tmp_dir = os.path.join(project_root, 'tmp')
-
-    # 如果tmp目录不存在，则创建它
-    os.makedirs(tmp_dir, exist_ok=True)
-
-    out_tmpl = os.path.join(tmp_dir, f'%(title)s [{video_id}].%(ext)s')
-
-    def progress_hook(d):
-        if d['status'] == 'downloading':
-            pct = d.get('downloaded_bytes', 0) / (d.get('total_bytes') or 1) * 100
-            on_progress(int(pct))
-        elif d['status'] == 'finished':
-            on_progress(100)
     cookiesFile = os.path.join(project_root, 'cookies.txt')
-    print(f"cookies: {cookiesFile}")
-    ydl_opts = {
-        'outtmpl': out_tmpl,
+    return {
         'format': 'bestvideo+bestaudio/best',
-        'progress_hooks': [progress_hook],
         # 'quiet': True,
         # 'no_warnings': True,
         # 'proxy': 'http://127.0.0.1:7890',  # Replace with your proxy
@@ -98,10 +264,25 @@ def download(video_id: str, on_progress: Callable[[int], None]) -> str:
         # 'user_agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/118.0.0.0 Safari/537.36',
     }
 
-    url = f'https://www.youtube.com/watch?v={video_id}'
-    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-        info = ydl.extract_info(url, download=True)
-        return ydl.prepare_filename(info)
+def get_video_downloader() -> VideoDownloader:
+    """获取下载器（首次调用时创建）：下载到暂存区，复用全局实例池、视频信息缓存和带宽调度器"""
+    global _downloader
+    if _downloader is None:
+        _downloader = VideoDownloader(
+            staging=get_staging_area(),
+            bandwidth=get_bandwidth_scheduler(),
+            ydl_options=get_download_options(),
+            # 边下载边计算的指纹按上传器的规则选择分片大小，上传时直接命中缓存
+            block_size_for=lambda size: choose_chunk_size(size, cached_max_chunk_size(BAIDU_ACCESS_TOKEN))
+        )
+    return _downloader
+
+def download(video_id: str, on_progress: Callable[[int], None],
+             should_abort: Optional[Callable[[], bool]] = None) -> str:
+    # 提取、下载、合并各阶段的耗时和下载字节数记入本任务的指标
+    with get_metrics().job('download', video_id):
+        result = get_video_downloader().download_video(video_id, on_progress, should_abort)
+    return result['localPath']
 
 def handle_enqueue(video_id: str, title: str):
     def on_progress(pct: int):
@@ -117,9 +298,13 @@ def handle_enqueue(video_id: str, title: str):
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument('--once', action='store_true', help='单条模式（行测试）')
+    parser.add_argument('--download-workers', type=int, default=DOWNLOAD_CONCURRENCY, help='同时下载的任务数')
+    parser.add_argument('--upload-workers', type=int, default=UPLOAD_CONCURRENCY, help='同时上传的任务数')
+    parser.add_argument('--progress-interval', type=float, default=PROGRESS_INTERVAL, help='进度消息最小间隔（秒）')
     args = parser.parse_args()
 
     if args.once:
+        init_package()
         raw = sys.stdin.readline().strip()
         # raw = '{"cmd":"upload","videoId":"1k5hLBdQU5E","localPath":"C:/Users/IGR/Desktop/yt-baidu-sync/yt-baidu-sync-helper/tmp/BTC仍下跌！一路向下不回頭？反彈是否有可能？ [1k5hLBdQU5E].mp4"}'
         if raw:
@@ -133,6 +318,8 @@ def main():
                     def on_progress(pct): print(f"Progress: {pct}%")
                     local_path = download(req['videoId'], on_progress)
                     resp = {'status': 'completed', 'localPath': local_path}
+                elif req.get('cmd') == 'upload' and 'files' in req:
+                    resp = handle_upload_batch(req['files'], BAIDU_ACCESS_TOKEN)
                 elif req.get('cmd') == 'upload':
                     print("指令识别为：upload")
                     localPath = req['localPath']
@@ -147,8 +334,22 @@ def main():
                 log(f'error: {e}')
                 print(json.dumps({'status': 'error', 'message': str(e)}))
     else:
-        while True:
-            loop_once()
+        get_writer().progress_interval = args.progress_interval
+        # stdout专用于消息帧，其余输出（print、yt-dlp屏幕输出）改写到stderr
+        sys.stdout = sys.stderr
+        init_package()
+        get_scheduler(args.download_workers, args.upload_workers)
+        warmed = False
+        while loop_once():
+            if not warmed:
+                # 第一条消息处理完后再在后台加载yt_dlp并预热实例，不影响首个应答的延迟
+                threading.Thread(target=get_ydl_pool().warm, args=(get_video_downloader().get_ydl_options(),),
+                                 name='ydl-warm', daemon=True).start()
+                warmed = True
+        # 浏览器断开连接后没有人接收消息，取消剩余任务
+        get_scheduler().shutdown(cancel_running=True)
+        get_ydl_pool().close()
+        get_writer().close()
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
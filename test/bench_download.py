@@ -0,0 +1,327 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+离线下载基准：本地HTTP服务器提供合成媒体，yt-dlp 通过通用提取器下载，不访问YouTube
+
+按格式选择分别测量：
+    ytdlp        裸 YoutubeDL（只有计时用的钩子），作为基线
+    ytdlp+hooks  加上 VideoDownloader 的进度钩子和边下载边计算指纹的钩子，统计钩子调用次数和耗时
+    downloader   VideoDownloader.download_video 端到端（实例池、指纹缓存）
+
+指标：元数据提取耗时、下载吞吐量、进度钩子开销、下载完成后的重命名/合并耗时。
+安装了 ffmpeg 时用 ffmpeg 生成真实的音视频并测量合并；否则使用随机数据，跳过需要合并的格式选择。
+
+用法: python test/bench_download.py [--size-mb 64] [--repeat 3] [--json]
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import argparse
+import tempfile
+import statistics
+import subprocess
+import threading
+import functools
+from contextlib import redirect_stdout
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core import download as download_module
+from core.download import VideoDownloader
+from core.fingerprint import FingerprintCache, StreamingFingerprinter
+from core.ydlpool import YoutubeDLPool
+
+# (名称, 媒体路径, 格式选择, 是否需要合并)
+SELECTIONS = (
+    ('direct:best', 'av.mp4', 'best', False),
+    ('dash:bestvideo', 'manifest.mpd', 'bestvideo', False),
+    ('dash:bestaudio', 'manifest.mpd', 'bestaudio', False),
+    ('dash:bestvideo+bestaudio', 'manifest.mpd', 'bestvideo+bestaudio', True),
+)
+MODES = ('ytdlp', 'ytdlp+hooks', 'downloader')
+
+MANIFEST = """<?xml version="1.0" encoding="UTF-8"?>
+<MPD xmlns="urn:mpeg:dash:schema:mpd:2011" type="static" mediaPresentationDuration="PT{duration}S"
+     minBufferTime="PT2S" profiles="urn:mpeg:dash:profile:isoff-on-demand:2011">
+ <Period>
+  <AdaptationSet mimeType="video/mp4" contentType="video">
+   <Representation id="video" codecs="avc1.4d401f" bandwidth="{video_bandwidth}" width="1280" height="720">
+    <BaseURL>video.mp4</BaseURL>
+   </Representation>
+  </AdaptationSet>
+  <AdaptationSet mimeType="audio/mp4" contentType="audio" lang="en">
+   <Representation id="audio" codecs="mp4a.40.2" bandwidth="{audio_bandwidth}" audioSamplingRate="44100">
+    <BaseURL>audio.m4a</BaseURL>
+   </Representation>
+  </AdaptationSet>
+ </Period>
+</MPD>
+"""
+
+
+def make_media(media_dir, size_mb, duration, use_ffmpeg):
+    """生成 video.mp4（仅视频）、audio.m4a（仅音频）、av.mp4（音视频）和DASH清单"""
+    video_bytes = size_mb * 1024 * 1024
+    audio_bytes = max(64 * 1024, video_bytes // 8)
+    video, audio, av = (os.path.join(media_dir, name) for name in ('video.mp4', 'audio.m4a', 'av.mp4'))
+    if use_ffmpeg:
+        run = functools.partial(subprocess.run, check=True, capture_output=True)
+        run(['ffmpeg', '-y', '-f', 'lavfi', '-i', 'testsrc2=size=1280x720:rate=30', '-t', str(duration),
+             '-c:v', 'libx264', '-preset', 'ultrafast', '-b:v', str(video_bytes * 8 // duration), '-an', video])
+        run(['ffmpeg', '-y', '-f', 'lavfi', '-i', f'sine=frequency=440:duration={duration}',
+             '-c:a', 'aac', '-b:a', str(min(320000, audio_bytes * 8 // duration)), audio])
+        run(['ffmpeg', '-y', '-i', video, '-i', audio, '-c', 'copy', av])
+    else:
+        for path, size in ((video, video_bytes), (audio, audio_bytes), (av, video_bytes + audio_bytes)):
+            with open(path, 'wb') as f:
+                for offset in range(0, size, 4 * 1024 * 1024):
+                    f.write(os.urandom(min(4 * 1024 * 1024, size - offset)))
+    with open(os.path.join(media_dir, 'manifest.mpd'), 'w') as f:
+        f.write(MANIFEST.format(duration=duration,
+                                video_bandwidth=os.path.getsize(video) * 8 // duration,
+                                audio_bandwidth=os.path.getsize(audio) * 8 // duration))
+
+
+class MediaServer:
+    """在后台线程中提供媒体目录的HTTP服务器"""
+
+    def __init__(self, media_dir):
+        class Handler(SimpleHTTPRequestHandler):
+            extensions_map = dict(SimpleHTTPRequestHandler.extensions_map,
+                                  **{'.mp4': 'video/mp4', '.m4a': 'audio/mp4', '.mpd': 'application/dash+xml'})
+
+            def log_message(self, *args):
+                pass
+
+        class Server(ThreadingHTTPServer):
+            def handle_error(self, request, client_address):
+                # 通用提取器探测媒体类型后会提前断开连接，不输出这类错误
+                if not isinstance(sys.exc_info()[1], ConnectionError):
+                    super().handle_error(request, client_address)
+
+        self._httpd = Server(('127.0.0.1', 0), functools.partial(Handler, directory=media_dir))
+        self._httpd.daemon_threads = True
+        threading.Thread(target=self._httpd.serve_forever, name='media-server', daemon=True).start()
+
+    def url(self, path):
+        host, port = self._httpd.server_address[:2]
+        return f'http://{host}:{port}/{path}'
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+
+class _Timeline:
+    """从进度钩子和后处理器钩子记录下载各阶段的时间点"""
+
+    def __init__(self):
+        self.first_progress = None
+        self.last_finished = None
+        self.bytes = 0
+        self.postprocessors = {}
+        self._pp_started = {}
+
+    def progress_hook(self, d):
+        now = time.perf_counter()
+        if self.first_progress is None:
+            self.first_progress = now
+        if d['status'] == 'finished':
+            self.last_finished = now
+            self.bytes += d.get('total_bytes') or d.get('downloaded_bytes') or 0
+
+    def postprocessor_hook(self, d):
+        name = d.get('postprocessor', '')
+        if d['status'] == 'started':
+            self._pp_started[name] = time.perf_counter()
+        elif d['status'] == 'finished' and name in self._pp_started:
+            elapsed = time.perf_counter() - self._pp_started.pop(name)
+            self.postprocessors[name] = self.postprocessors.get(name, 0) + elapsed
+
+
+class _TimedHook:
+    """包装进度钩子，累计调用次数和耗时"""
+
+    def __init__(self, hook):
+        self.hook = hook
+        self.calls = 0
+        self.seconds = 0.0
+
+    def __call__(self, d):
+        start = time.perf_counter()
+        try:
+            self.hook(d)
+        finally:
+            self.seconds += time.perf_counter() - start
+            self.calls += 1
+
+
+class _BenchDownloader(VideoDownloader):
+    """使用指定格式选择的 VideoDownloader"""
+
+    def __init__(self, format_spec, **kwargs):
+        self.format_spec = format_spec
+        super().__init__(**kwargs)
+
+    def get_ydl_options(self, on_progress=None):
+        options = super().get_ydl_options(on_progress)
+        options.update(format=self.format_spec, quiet=True, no_warnings=True, noprogress=True)
+        return options
+
+
+def run_ytdlp(url, format_spec, out_dir, cache, pool, with_hooks):
+    """裸 YoutubeDL 下载一次，返回各阶段耗时"""
+    import yt_dlp
+
+    timeline = _Timeline()
+    hooks = [timeline.progress_hook]
+    timed = []
+    fingerprinter = None
+    if with_hooks:
+        # 与 VideoDownloader.download_video 相同的钩子
+        downloader = VideoDownloader(download_dir=out_dir, ydl_pool=pool)
+        downloader_hook = downloader.get_ydl_options(lambda pct: None)['progress_hooks'][0]
+        fingerprinter = StreamingFingerprinter(cache=cache)
+        timed = [_TimedHook(downloader_hook), _TimedHook(fingerprinter.progress_hook)]
+        hooks.extend(timed)
+
+    options = {
+        'outtmpl': os.path.join(out_dir, '%(title)s [%(id)s].%(ext)s'),
+        'format': format_spec,
+        'quiet': True,
+        'no_warnings': True,
+        'noprogress': True,
+        'progress_hooks': hooks,
+        'postprocessor_hooks': [timeline.postprocessor_hook],
+    }
+    start = time.perf_counter()
+    with yt_dlp.YoutubeDL(options) as ydl:
+        info = ydl.extract_info(url, download=False, process=False)
+        extracted = time.perf_counter()
+        ydl.process_ie_result(info, download=True)
+    end = time.perf_counter()
+    if fingerprinter is not None:
+        fingerprinter.close()
+
+    download_seconds = (timeline.last_finished or end) - extracted
+    return {
+        'extract_ms': (extracted - start) * 1000,
+        'total_s': end - start,
+        'download_mb_per_s': timeline.bytes / (1024 * 1024) / download_seconds if download_seconds > 0 else 0,
+        'post_ms': (end - (timeline.last_finished or end)) * 1000,
+        'postprocessors_ms': {name: seconds * 1000 for name, seconds in timeline.postprocessors.items()},
+        'hook_calls': sum(hook.calls for hook in timed),
+        'hook_ms': sum(hook.seconds for hook in timed) * 1000,
+    }
+
+
+def run_downloader(url, format_spec, out_dir, pool):
+    """VideoDownloader.download_video 端到端下载一次"""
+    progress_calls = []
+    downloader = _BenchDownloader(format_spec, download_dir=out_dir, ydl_pool=pool)
+    start = time.perf_counter()
+    result = downloader.download_video(url, on_progress=progress_calls.append)
+    end = time.perf_counter()
+    download_seconds = result['timings']['download']
+    return {
+        'extract_ms': result['timings']['extract'] * 1000,
+        'total_s': end - start,
+        'download_mb_per_s': result['filesize'] / (1024 * 1024) / download_seconds if download_seconds > 0 else 0,
+        'hook_calls': len(progress_calls),
+    }
+
+
+def _median(runs):
+    """逐项取多次运行的中位数"""
+    summary = {}
+    for key, value in runs[0].items():
+        if isinstance(value, dict):
+            names = {name for run in runs for name in run[key]}
+            summary[key] = {name: round(statistics.median(run[key].get(name, 0) for run in runs), 1)
+                            for name in names}
+        else:
+            summary[key] = round(statistics.median(run[key] for run in runs), 3)
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description='离线下载基准')
+    parser.add_argument('--size-mb', type=int, default=64, help='视频流大小（MB），音频约为其1/8')
+    parser.add_argument('--duration', type=int, default=10, help='合成媒体的时长（秒）')
+    parser.add_argument('--repeat', type=int, default=3, help='每项重复次数，结果取中位数')
+    parser.add_argument('--modes', default=','.join(MODES), help='要运行的方式，逗号分隔')
+    parser.add_argument('--no-ffmpeg', action='store_true', help='即使安装了ffmpeg也使用随机数据')
+    parser.add_argument('--json', action='store_true', help='输出JSON结果')
+    args = parser.parse_args()
+
+    import yt_dlp
+
+    logging.disable(logging.CRITICAL)
+    use_ffmpeg = not args.no_ffmpeg and shutil.which('ffmpeg') is not None
+    workdir = tempfile.mkdtemp(prefix='bench_download_')
+    media_dir = os.path.join(workdir, 'media')
+    out_dir = os.path.join(workdir, 'out')
+    os.makedirs(media_dir)
+    # 指纹缓存写入临时目录，不影响项目的缓存文件
+    cache = FingerprintCache(cache_path=os.path.join(workdir, 'fingerprint_cache.json'))
+    download_module.get_fingerprint_cache = lambda: cache
+    pool = YoutubeDLPool()
+
+    results = []
+    server = None
+    try:
+        make_media(media_dir, args.size_mb, args.duration, use_ffmpeg)
+        server = MediaServer(media_dir)
+        # yt-dlp 和下载器的屏幕输出改写到stderr，stdout只输出结果
+        with redirect_stdout(sys.stderr):
+            for name, path, format_spec, needs_merge in SELECTIONS:
+                for mode in args.modes.split(','):
+                    if needs_merge and not use_ffmpeg:
+                        results.append({'selection': name, 'mode': mode, 'skipped': '未安装ffmpeg，无法合并'})
+                        continue
+                    runs = []
+                    # 第一次运行作为预热（导入提取器、实例池建实例），不计入结果
+                    for _ in range(args.repeat + 1):
+                        shutil.rmtree(out_dir, ignore_errors=True)
+                        os.makedirs(out_dir)
+                        if mode == 'downloader':
+                            runs.append(run_downloader(server.url(path), format_spec, out_dir, pool))
+                        else:
+                            runs.append(run_ytdlp(server.url(path), format_spec, out_dir, cache, pool,
+                                                  with_hooks=(mode == 'ytdlp+hooks')))
+                    results.append(dict(_median(runs[1:]), selection=name, mode=mode))
+    finally:
+        if server is not None:
+            server.stop()
+        pool.close()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        'yt_dlp': yt_dlp.version.__version__,
+        'ffmpeg': use_ffmpeg,
+        'size_mb': args.size_mb,
+        'repeat': args.repeat,
+        'results': results,
+    }
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False))
+        return
+    print(f"yt-dlp {report['yt_dlp']}, ffmpeg: {'有' if use_ffmpeg else '无'}, 视频流 {args.size_mb}MB")
+    print(f"{'格式选择':<28}{'方式':<14}{'提取(ms)':>10}{'MB/s':>10}{'总耗时(s)':>11}{'钩子调用':>10}"
+          f"{'钩子(ms)':>10}{'后处理(ms)':>12}")
+    for r in results:
+        if 'skipped' in r:
+            print(f"{r['selection']:<28}{r['mode']:<14}  跳过: {r['skipped']}")
+            continue
+        print(f"{r['selection']:<28}{r['mode']:<14}{r['extract_ms']:>10.1f}{r['download_mb_per_s']:>10.1f}"
+              f"{r['total_s']:>11.3f}{r['hook_calls']:>10.0f}{r.get('hook_ms', 0):>10.1f}"
+              f"{r.get('post_ms', 0):>12.1f}")
+
+
+if __name__ == '__main__':
+    main()
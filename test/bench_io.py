@@ -0,0 +1,167 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+文件读取基准：比较逐分片 f.read、复用缓冲区 readinto 与并行分片MD5在哈希和分片上传路径上的吞吐量和峰值内存
+
+每种方式在独立的子进程中运行，峰值内存取子进程的 ru_maxrss。
+上传路径只组装multipart请求体，不发送网络请求。
+
+用法: python test/bench_io.py [--size-mb 2048] [--file 已有文件] [--json]
+"""
+
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+import resource
+import subprocess
+
+from urllib3 import encode_multipart_formdata
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+
+BLOCK_SIZE = 4 * 1024 * 1024
+MODES = ('md5-8k', 'fingerprint-read', 'fingerprint-readinto', 'fingerprint-parallel', 'parts-read', 'parts-readinto')
+
+
+def _md5_8k(path):
+    """旧版 _get_file_md5：8KB 循环"""
+    md5 = hashlib.md5()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(8192), b""):
+            md5.update(chunk)
+    return md5.hexdigest()
+
+
+def _fingerprint_read(path):
+    """旧版 compute_fingerprint：每个分片一个新的bytes对象"""
+    content_md5 = hashlib.md5()
+    block_list = []
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(BLOCK_SIZE)
+            if not chunk:
+                break
+            content_md5.update(chunk)
+            block_list.append(hashlib.md5(chunk).hexdigest())
+    return content_md5.hexdigest()
+
+
+def _fingerprint_readinto(path):
+    from core.fingerprint import compute_fingerprint
+    return compute_fingerprint(path, BLOCK_SIZE).content_md5
+
+
+def _fingerprint_parallel(path):
+    from core.fingerprint import DEFAULT_HASH_WORKERS, compute_fingerprint
+    return compute_fingerprint(path, BLOCK_SIZE, workers=max(2, DEFAULT_HASH_WORKERS)).content_md5
+
+
+def _parts(path, read_part):
+    """按分片读取并组装superfile2请求体"""
+    part_count = (os.path.getsize(path) + BLOCK_SIZE - 1) // BLOCK_SIZE
+    for partseq in range(part_count):
+        chunk = read_part(partseq)
+        encode_multipart_formdata({'file': (f'part{partseq}', chunk)})
+
+
+def _parts_read(path):
+    def read_part(partseq):
+        with open(path, 'rb') as f:
+            f.seek(partseq * BLOCK_SIZE)
+            return f.read(BLOCK_SIZE)
+    _parts(path, read_part)
+
+
+def _parts_readinto(path):
+    from core.baidupan import BaiduPanUploader
+    uploader = BaiduPanUploader('token', chunk_size=BLOCK_SIZE)
+    _parts(path, lambda partseq: uploader._read_part(path, partseq, BLOCK_SIZE))
+
+
+RUNNERS = {
+    'md5-8k': _md5_8k,
+    'fingerprint-read': _fingerprint_read,
+    'fingerprint-readinto': _fingerprint_readinto,
+    'fingerprint-parallel': _fingerprint_parallel,
+    'parts-read': _parts_read,
+    'parts-readinto': _parts_readinto,
+}
+
+
+def run_child(mode, path):
+    """子进程入口：运行一种方式并输出结果"""
+    runner = RUNNERS[mode]
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    runner(path)
+    elapsed = time.perf_counter() - start
+    rss_peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    size_mb = os.path.getsize(path) / (1024 * 1024)
+    print(json.dumps({
+        'mode': mode,
+        'seconds': round(elapsed, 3),
+        'mb_per_s': round(size_mb / elapsed, 1),
+        'peak_rss_mb': round(rss_peak / 1024, 1),
+        'rss_growth_mb': round((rss_peak - rss_before) / 1024, 1),
+    }))
+
+
+def make_file(path, size_mb):
+    """生成随机内容的测试文件"""
+    block = os.urandom(BLOCK_SIZE)
+    with open(path, 'wb') as f:
+        for i in range(size_mb // 4):
+            # 每个分片内容不同，避免存储层去重
+            f.write(i.to_bytes(8, 'little') + block[8:])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='文件读取基准')
+    parser.add_argument('--size-mb', type=int, default=2048, help='生成的测试文件大小（MB）')
+    parser.add_argument('--file', help='使用已有文件，不生成测试文件')
+    parser.add_argument('--modes', default=','.join(MODES), help='要运行的方式，逗号分隔')
+    parser.add_argument('--json', action='store_true', help='输出JSON结果')
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child, args.file)
+        return
+
+    path = args.file
+    generated = False
+    if path is None:
+        path = os.path.join(PROJECT_ROOT, 'tmp', f'bench_io_{args.size_mb}mb.bin')
+        if not os.path.exists(path) or os.path.getsize(path) != args.size_mb * 1024 * 1024:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            make_file(path, args.size_mb)
+            generated = True
+
+    size_mb = round(os.path.getsize(path) / (1024 * 1024))
+    results = []
+    try:
+        # 预读一次，各方式都从页缓存读取，比较的是CPU和内存开销
+        subprocess.run([sys.executable, __file__, '--child', 'md5-8k', '--file', path],
+                       capture_output=True, check=True)
+        for mode in args.modes.split(','):
+            out = subprocess.run([sys.executable, __file__, '--child', mode, '--file', path],
+                                 capture_output=True, text=True, check=True)
+            results.append(json.loads(out.stdout))
+    finally:
+        if generated:
+            os.remove(path)
+
+    if args.json:
+        print(json.dumps({'file': path, 'size_mb': size_mb, 'results': results}))
+        return
+    print(f"{'方式':<22}{'耗时(s)':>10}{'MB/s':>10}{'峰值RSS(MB)':>14}{'RSS增长(MB)':>14}")
+    for r in results:
+        print(f"{r['mode']:<22}{r['seconds']:>10}{r['mb_per_s']:>10}{r['peak_rss_mb']:>14}{r['rss_growth_mb']:>14}")
+
+
+if __name__ == '__main__':
+    main()
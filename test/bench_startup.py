@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+本地消息主机启动基准：测量从启动进程到收到第一个pong的耗时
+
+用法: python test/bench_startup.py [--runs 10] [--json]
+
+主机在临时目录下运行（HOME、TMPDIR、指标文件），使用假的访问令牌，不访问网盘也不写入工作区；
+导入helper时加载了重量级模块或主机未正常应答时退出码非0
+"""
+
+import os
+import sys
+import json
+import time
+import struct
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HELPER = os.path.join(PROJECT_ROOT, 'helper.py')
+HEAVY_MODULES = ('yt_dlp', 'requests', 'tqdm', 'asyncio')
+
+
+def encode_frame(obj):
+    body = json.dumps(obj).encode('utf-8')
+    return struct.pack('<I', len(body)) + body
+
+
+def read_frame(stream):
+    header = stream.read(4)
+    if len(header) < 4:
+        raise RuntimeError("主机在应答前退出")
+    length = struct.unpack('<I', header)[0]
+    return json.loads(stream.read(length).decode('utf-8'))
+
+
+def host_env(work_dir: str) -> dict:
+    """主机进程的环境变量：可写路径都指向work_dir，访问令牌无效"""
+    env = dict(os.environ)
+    env.update({
+        'HOME': work_dir,
+        'TMPDIR': work_dir,
+        'YT_METRICS_FILE': os.path.join(work_dir, 'metrics.jsonl'),
+        'BAIDU_ACCESS_TOKEN': 'bench-startup',
+    })
+    return env
+
+
+def time_to_first_pong(env: dict) -> float:
+    """启动一次主机，返回收到pong的耗时（秒）"""
+    start = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, HELPER],
+        stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+        cwd=PROJECT_ROOT, env=env
+    )
+    try:
+        proc.stdin.write(encode_frame({'cmd': 'ping'}))
+        proc.stdin.flush()
+        resp = read_frame(proc.stdout)
+        elapsed = time.perf_counter() - start
+        if resp.get('status') != 'pong':
+            raise RuntimeError(f"意外的应答: {resp}")
+        return elapsed
+    finally:
+        proc.stdin.close()
+        proc.wait(timeout=30)
+
+
+def heavy_modules_on_import(env: dict):
+    """导入helper后已加载的重量级模块（应为空）"""
+    code = (
+        "import sys; sys.path.insert(0, %r); import helper; "
+        "print(','.join(m for m in %r if m in sys.modules))" % (PROJECT_ROOT, HEAVY_MODULES)
+    )
+    out = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True,
+                         cwd=PROJECT_ROOT, env=env)
+    if out.returncode != 0:
+        raise RuntimeError(f"导入helper失败: {out.stderr.strip()}")
+    return [m for m in out.stdout.strip().split(',') if m]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='本地消息主机启动基准')
+    parser.add_argument('--runs', type=int, default=10, help='重复次数')
+    parser.add_argument('--json', action='store_true', help='输出JSON结果')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix='bench-startup-') as work_dir:
+        env = host_env(work_dir)
+        # 预跑一次，排除首次编译字节码的影响
+        time_to_first_pong(env)
+        samples = [time_to_first_pong(env) for _ in range(max(1, args.runs))]
+        result = {
+            'runs': len(samples),
+            'median_ms': round(statistics.median(samples) * 1000, 1),
+            'min_ms': round(min(samples) * 1000, 1),
+            'max_ms': round(max(samples) * 1000, 1),
+            'heavy_modules_on_import': heavy_modules_on_import(env),
+        }
+
+    if args.json:
+        print(json.dumps(result))
+    else:
+        print(f"time-to-first-pong: 中位数 {result['median_ms']}ms, "
+              f"最小 {result['min_ms']}ms, 最大 {result['max_ms']}ms（{result['runs']} 次）")
+        print(f"导入时加载的重量级模块: {result['heavy_modules_on_import'] or '无'}")
+    # 启动路径重新加载了重量级模块视为回归
+    return 1 if result['heavy_modules_on_import'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+上传端到端基准：BaiduPanUploader.upload_file 对本地接口替身上传，按文件大小统计
+吞吐量、每个文件的接口调用次数、文件和请求的尾延迟
+
+每种文件大小使用独立的替身服务器，文件内容随机，不会命中秒传。
+
+用法: python test/bench_upload.py [--sizes-mb 1,16,64] [--files 4] [--latency 0.02]
+                                  [--bandwidth-mb 50] [--error-rate 0.05] [--json]
+"""
+
+import os
+import sys
+import json
+import math
+import time
+import shutil
+import logging
+import argparse
+import tempfile
+import threading
+from contextlib import redirect_stdout
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mock_baidu import MockBaiduServer
+from core import baidupan
+from core.baidupan import BaiduPanUploader
+from core.cache import PersistentLRUCache
+from core.retry import RetryPolicy
+
+
+def percentile(values, pct):
+    """最近秩百分位数，空列表返回0"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def _latency_summary(values):
+    return {
+        'p50_ms': round(percentile(values, 50) * 1000, 1),
+        'p95_ms': round(percentile(values, 95) * 1000, 1),
+        'p99_ms': round(percentile(values, 99) * 1000, 1),
+        'max_ms': round(max(values, default=0) * 1000, 1),
+    }
+
+
+def bench_size(size_mb, args, workdir):
+    """上传args.files个size_mb大小的文件，返回统计结果"""
+    paths = []
+    for i in range(args.files):
+        path = os.path.join(workdir, f'{size_mb}mb_{i} [bench{i}].mp4')
+        with open(path, 'wb') as f:
+            f.write(os.urandom(int(size_mb * 1024 * 1024)))
+        paths.append(path)
+
+    server = MockBaiduServer(latency=args.latency, vip_type=args.vip_type,
+                             bandwidth=args.bandwidth_mb * 1024 * 1024 if args.bandwidth_mb else None,
+                             error_rate=args.error_rate, seed=args.seed)
+    with server:
+        uploader = server.configure(BaiduPanUploader(
+            'bench-token', upload_workers=args.workers,
+            retry_policy=RetryPolicy(max_attempts=args.max_attempts, base_delay=args.retry_delay)))
+
+        # 在客户端记录每个请求的耗时（含重试的每一次尝试）
+        request_times = {}
+        lock = threading.Lock()
+        send = uploader.session.request
+
+        def timed_request(method, url, params=None, **kwargs):
+            start = time.perf_counter()
+            try:
+                return send(method, url, params=params, **kwargs)
+            finally:
+                with lock:
+                    request_times.setdefault((params or {}).get('method', ''), []).append(
+                        time.perf_counter() - start)
+
+        uploader.session.request = timed_request
+
+        file_times = []
+        failed = 0
+        for path in paths:
+            start = time.perf_counter()
+            result = uploader.upload_file(path)
+            file_times.append(time.perf_counter() - start)
+            if not result or result.get('errno') != 0:
+                failed += 1
+        total_seconds = sum(file_times)
+        requests = dict(server.requests)
+
+    for path in paths:
+        os.remove(path)
+
+    calls = sum(requests.values())
+    return {
+        'size_mb': size_mb,
+        'files': args.files,
+        'failed': failed,
+        'mb_per_s': round(size_mb * args.files / total_seconds, 1),
+        'api_calls_per_file': round(calls / args.files, 1),
+        'calls_by_method': requests,
+        'faults_injected': server.faults_served,
+        'file_latency': _latency_summary(file_times),
+        'part_latency': _latency_summary(request_times.get('upload', [])),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='上传端到端基准')
+    parser.add_argument('--sizes-mb', default='1,16,64', help='文件大小列表（MB），逗号分隔')
+    parser.add_argument('--files', type=int, default=4, help='每种大小上传的文件数')
+    parser.add_argument('--workers', type=int, default=4, help='并发上传的分片数')
+    parser.add_argument('--latency', type=float, default=0.02, help='每个请求的模拟往返延迟（秒）')
+    parser.add_argument('--bandwidth-mb', type=float, default=None, help='模拟上行带宽（MB/s），默认不限速')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='分片请求随机失败的比例')
+    parser.add_argument('--vip-type', type=int, default=0, help='模拟账号的会员等级（决定最大分片大小）')
+    parser.add_argument('--max-attempts', type=int, default=5, help='单次调用的最大尝试次数')
+    parser.add_argument('--retry-delay', type=float, default=0.05, help='第一次重试前的最大等待时间（秒）')
+    parser.add_argument('--seed', type=int, default=1, help='随机错误的种子')
+    parser.add_argument('--json', action='store_true', help='输出JSON结果')
+    args = parser.parse_args()
+
+    # 上传器的日志和进度条不混入结果
+    logging.disable(logging.CRITICAL)
+    # 账号等级只保存在内存中，不写入项目的缓存文件
+    baidupan._account_cache = PersistentLRUCache()
+
+    workdir = tempfile.mkdtemp(prefix='bench_upload_')
+    try:
+        # 上传器的print输出改写到stderr，stdout只输出结果
+        with redirect_stdout(sys.stderr):
+            results = [bench_size(float(size), args, workdir) for size in args.sizes_mb.split(',')]
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.json:
+        print(json.dumps({
+            'latency': args.latency, 'bandwidth_mb': args.bandwidth_mb, 'error_rate': args.error_rate,
+            'workers': args.workers, 'results': results
+        }))
+        return
+    print(f"{'大小(MB)':>10}{'MB/s':>10}{'调用/文件':>12}{'注入错误':>10}{'文件p50(ms)':>14}"
+          f"{'文件p95(ms)':>14}{'分片p99(ms)':>14}{'失败':>6}")
+    for r in results:
+        print(f"{r['size_mb']:>10}{r['mb_per_s']:>10}{r['api_calls_per_file']:>12}{r['faults_injected']:>10}"
+              f"{r['file_latency']['p50_ms']:>14}{r['file_latency']['p95_ms']:>14}"
+              f"{r['part_latency']['p99_ms']:>14}{r['failed']:>6}")
+
+
+if __name__ == '__main__':
+    main()
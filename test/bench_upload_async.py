@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+上传吞吐量基准：同步上传器（逐个文件、线程并发分片）与异步上传器（一个事件循环驱动所有文件）
+
+对本地接口替身上传，--latency 模拟每个请求的网络往返。每种方式使用独立的替身服务器，
+避免后一种方式命中秒传。
+
+用法: python test/bench_upload_async.py [--files 8] [--size-mb 16] [--latency 0.05] [--json]
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import asyncio
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mock_baidu import MockBaiduServer
+from core.baidupan import MIN_CHUNK_SIZE, BaiduPanUploader
+
+
+def run_sync(paths, latency, workers):
+    with MockBaiduServer(latency=latency) as server:
+        uploader = server.configure(BaiduPanUploader('token', upload_workers=workers, chunk_size=MIN_CHUNK_SIZE))
+        start = time.perf_counter()
+        results = [uploader.upload_file(path) for path in paths]
+        return time.perf_counter() - start, results
+
+
+def run_async(paths, latency, workers):
+    from core.async_uploader import AsyncBaiduPanUploader
+
+    async def upload():
+        async with AsyncBaiduPanUploader('token', upload_workers=workers, chunk_size=MIN_CHUNK_SIZE) as uploader:
+            server.configure(uploader)
+            return await uploader.upload_files(paths, max_files=len(paths))
+
+    with MockBaiduServer(latency=latency) as server:
+        start = time.perf_counter()
+        results = asyncio.run(upload())
+        return time.perf_counter() - start, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='同步/异步上传吞吐量基准')
+    parser.add_argument('--files', type=int, default=8, help='文件数')
+    parser.add_argument('--size-mb', type=int, default=16, help='每个文件的大小（MB）')
+    parser.add_argument('--latency', type=float, default=0.05, help='每个请求的模拟往返延迟（秒）')
+    parser.add_argument('--workers', type=int, default=8, help='同时上传的分片数')
+    parser.add_argument('--json', action='store_true', help='输出JSON结果')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='bench_upload_')
+    try:
+        paths = []
+        for i in range(args.files):
+            path = os.path.join(workdir, f'video{i} [bench{i}].mp4')
+            with open(path, 'wb') as f:
+                f.write(os.urandom(args.size_mb * 1024 * 1024))
+            paths.append(path)
+
+        total_mb = args.files * args.size_mb
+        results = []
+        for mode, runner in (('sync', run_sync), ('async', run_async)):
+            seconds, uploaded = runner(paths, args.latency, args.workers)
+            results.append({
+                'mode': mode,
+                'seconds': round(seconds, 3),
+                'mb_per_s': round(total_mb / seconds, 1),
+                'files_ok': sum(1 for r in uploaded if r and r.get('errno') == 0),
+            })
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.json:
+        print(json.dumps({'files': args.files, 'size_mb': args.size_mb, 'latency': args.latency,
+                          'workers': args.workers, 'results': results}))
+        return
+    print(f"{'方式':<10}{'耗时(s)':>10}{'MB/s':>10}{'成功文件':>10}")
+    for r in results:
+        print(f"{r['mode']:<10}{r['seconds']:>10}{r['mb_per_s']:>10}{r['files_ok']:>10}")
+
+
+if __name__ == '__main__':
+    main()
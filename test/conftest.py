@@ -0,0 +1,21 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+测试公共配置：全局指标记录器写入每个测试自己的临时目录，而不是仓库下的 tmp/metrics.jsonl
+"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core import metrics
+
+
+@pytest.fixture(autouse=True)
+def isolated_metrics(tmp_path, monkeypatch):
+    monkeypatch.setenv('YT_METRICS_FILE', str(tmp_path / 'metrics.jsonl'))
+    # 丢弃其他测试创建的单例，下次 get_metrics() 按上面的路径重新创建
+    monkeypatch.setattr(metrics, '_default_metrics', None)
@@ -0,0 +1,274 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+本地百度网盘接口替身：实现 rapidupload、precreate、superfile2、create、list、uinfo，
+用于上传器的测试和基准，不访问真实网盘
+
+可模拟网络往返延迟、上行带宽，并按次数或比例注入错误（HTTP错误、errno、断开连接）。
+
+用法:
+    server = MockBaiduServer(latency=0.02, bandwidth=20 * 1024 * 1024).start()
+    server.inject('upload', count=2, status=503)
+    uploader = BaiduPanUploader('token')
+    server.configure(uploader)
+    ...
+    server.stop()
+"""
+
+import os
+import sys
+import json
+import time
+import uuid
+import random
+import hashlib
+import threading
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Deque, Dict, Iterable, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.bandwidth import TokenBucket
+
+
+def parse_multipart(body: bytes, content_type: str) -> Dict[str, bytes]:
+    """解析multipart/form-data请求体，返回 字段名 -> 内容"""
+    boundary = content_type.split('boundary=', 1)[1].strip().strip('"').encode()
+    fields = {}
+    for part in body.split(b'--' + boundary):
+        if b'\r\n\r\n' not in part:
+            continue
+        headers, _, content = part.partition(b'\r\n\r\n')
+        name = headers.split(b'name="', 1)[1].split(b'"', 1)[0].decode()
+        fields[name] = content[:-2] if content.endswith(b'\r\n') else content
+    return fields
+
+
+class Fault:
+    """一次注入的错误：status为HTTP状态码，errno非空时在响应体中返回该错误码，drop为真时直接断开连接"""
+
+    def __init__(self, status: int = 503, errno: Optional[int] = None, drop: bool = False):
+        self.status = status
+        self.errno = errno
+        self.drop = drop
+
+    def payload(self) -> Dict[str, Any]:
+        errno = self.errno if self.errno is not None else self.status
+        return {'errno': errno, 'error_code': errno, 'errmsg': 'injected fault'}
+
+
+class MockBaiduServer:
+    """百度网盘接口替身服务器（线程安全）"""
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        vip_type: int = 0,
+        bandwidth: Optional[float] = None,
+        error_rate: float = 0.0,
+        error_methods: Iterable[str] = ('upload',),
+        seed: Optional[int] = None
+    ):
+        """
+        初始化替身服务器
+
+        Args:
+            latency: 每个请求的附加延迟（秒），模拟网络往返
+            vip_type: uinfo 返回的会员等级
+            bandwidth: 所有连接共享的上行带宽（字节/秒），None则不限速
+            error_rate: error_methods 中的接口随机返回HTTP 503的比例
+            error_methods: 随机注入错误的接口（method参数，superfile2为'upload'）
+            seed: 随机错误的种子，便于复现
+        """
+        self.latency = latency
+        self.vip_type = vip_type
+        self.error_rate = error_rate
+        self.error_methods = set(error_methods)
+        self._rng = random.Random(seed)
+        self._bucket = TokenBucket(bandwidth, burst=0.1) if bandwidth else None
+        # 按次数注入的错误：method -> 依次返回的错误
+        self._faults: Dict[str, Deque[Fault]] = {}
+        # 已返回的注入错误数（含随机错误）
+        self.faults_served = 0
+        self.lock = threading.Lock()
+        # 网盘中的文件：路径 -> 文件信息
+        self.files: Dict[str, Dict[str, Any]] = {}
+        # 进行中的分片上传：uploadid -> 会话
+        self.uploads: Dict[str, Dict[str, Any]] = {}
+        # 各接口的请求次数
+        self.requests: Dict[str, int] = {}
+        self._next_fs_id = 1000
+        self._httpd: Optional[ThreadingHTTPServer] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/rest/2.0"
+
+    def configure(self, uploader):
+        """把上传器的接口地址指向本服务器"""
+        uploader.base_url = self.base_url
+        uploader.pcs_url = f"{self.base_url}/pcs"
+        return uploader
+
+    def inject(self, method: str, count: int = 1, status: int = 503, errno: Optional[int] = None,
+               drop: bool = False):
+        """让接下来count次对method的请求失败（method为接口的method参数，superfile2为'upload'）"""
+        with self.lock:
+            queue = self._faults.setdefault(method, deque())
+            queue.extend(Fault(status, errno, drop) for _ in range(count))
+
+    def _next_fault(self, method: str) -> Optional[Fault]:
+        with self.lock:
+            queue = self._faults.get(method)
+            if queue:
+                fault = queue.popleft()
+            elif self.error_rate and method in self.error_methods and self._rng.random() < self.error_rate:
+                fault = Fault(503)
+            else:
+                return None
+            self.faults_served += 1
+            return fault
+
+    def start(self) -> 'MockBaiduServer':
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                self._dispatch(b'')
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                body = self.rfile.read(length)
+                if server._bucket is not None:
+                    server._bucket.consume(len(body))
+                self._dispatch(body)
+
+            def _dispatch(self, body: bytes):
+                url = urlparse(self.path)
+                query = {k: v[0] for k, v in parse_qs(url.query).items()}
+                if server.latency:
+                    time.sleep(server.latency)
+                method = query.get('method', '')
+                with server.lock:
+                    server.requests[method] = server.requests.get(method, 0) + 1
+                fault = server._next_fault(method)
+                if fault is not None and fault.drop:
+                    # 不返回响应直接断开，客户端看到连接错误
+                    self.close_connection = True
+                    return
+                if fault is not None:
+                    status, payload = fault.status, fault.payload()
+                else:
+                    status, payload = server.handle(url.path, query, body, self.headers.get('Content-Type', ''))
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        self._httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self._httpd.daemon_threads = True
+        threading.Thread(target=self._httpd.serve_forever, name='mock-baidu', daemon=True).start()
+        return self
+
+    def stop(self):
+        if self._httpd is not None:
+            self._httpd.shutdown()
+            self._httpd.server_close()
+            self._httpd = None
+
+    def __enter__(self) -> 'MockBaiduServer':
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    # ---- 接口实现 ----
+
+    def handle(self, path: str, query: Dict[str, str], body: bytes, content_type: str) -> Tuple[int, Dict]:
+        method = query.get('method', '')
+        if path.endswith('/pcs/superfile2'):
+            return self._superfile2(query, parse_multipart(body, content_type))
+        form = {k: v[0] for k, v in parse_qs(body.decode()).items()} if body else {}
+        handler = getattr(self, f'_{method}', None)
+        if handler is None:
+            return 400, {'errno': 2, 'errmsg': f'unknown method {method}'}
+        return handler(query, form)
+
+    def _uinfo(self, query, form):
+        return 200, {'errno': 0, 'vip_type': self.vip_type, 'baidu_name': 'mock'}
+
+    def _add_file(self, path: str, size: int, md5: str) -> Dict[str, Any]:
+        """保存文件（需持有锁），同名文件按 rtype=1 重命名"""
+        base, dot, ext = path.rpartition('.')
+        n = 1
+        while path in self.files:
+            path = f"{base}({n}){dot}{ext}" if dot else f"{path}({n})"
+            n += 1
+        self._next_fs_id += 1
+        info = {'path': path, 'server_filename': path.rsplit('/', 1)[-1], 'fs_id': self._next_fs_id,
+                'md5': md5, 'size': size, 'isdir': 0, 'category': 1}
+        self.files[path] = info
+        return info
+
+    def _rapidupload(self, query, form):
+        with self.lock:
+            for info in self.files.values():
+                if info['md5'] == form.get('content-md5') and info['size'] == int(form.get('content-length', -1)):
+                    new = self._add_file(form['path'], info['size'], info['md5'])
+                    return 200, {'errno': 0, 'info': new}
+        return 200, {'errno': 404, 'errmsg': 'file not found'}
+
+    def _precreate(self, query, form):
+        uploadid = uuid.uuid4().hex
+        with self.lock:
+            self.uploads[uploadid] = {
+                'path': form['path'],
+                'size': int(form['size']),
+                'block_list': json.loads(form['block_list']),
+                'parts': {},
+            }
+        return 200, {'errno': 0, 'uploadid': uploadid, 'return_type': 1, 'block_list': []}
+
+    def _superfile2(self, query, fields):
+        data = fields.get('file', b'')
+        with self.lock:
+            session = self.uploads.get(query.get('uploadid'))
+            if session is None:
+                return 400, {'error_code': 31363, 'error_msg': 'uploadid not found'}
+            session['parts'][int(query['partseq'])] = data
+        return 200, {'md5': hashlib.md5(data).hexdigest(), 'partseq': query['partseq']}
+
+    def _create(self, query, form):
+        with self.lock:
+            session = self.uploads.get(form.get('uploadid'))
+            if session is None:
+                return 200, {'errno': 31363, 'errmsg': 'uploadid not found'}
+            block_list = json.loads(form['block_list'])
+            parts = session['parts']
+            uploaded = [hashlib.md5(parts[i]).hexdigest() if i in parts else None for i in range(len(block_list))]
+            if uploaded != block_list:
+                return 200, {'errno': 31352, 'errmsg': 'block list mismatch'}
+            content = b''.join(parts[i] for i in range(len(block_list)))
+            if len(content) != int(form['size']):
+                return 200, {'errno': 31355, 'errmsg': 'size mismatch'}
+            del self.uploads[form['uploadid']]
+            info = self._add_file(form['path'], len(content), hashlib.md5(content).hexdigest())
+        return 200, dict(info, errno=0)
+
+    def _list(self, query, form):
+        directory = query.get('dir', '/').rstrip('/') + '/'
+        start, limit = int(query.get('start', 0)), int(query.get('limit', 1000))
+        with self.lock:
+            entries = sorted((info for path, info in self.files.items() if path.startswith(directory)),
+                             key=lambda info: info['path'])
+        return 200, {'errno': 0, 'list': entries[start:start + limit]}
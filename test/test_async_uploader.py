@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+异步上传器测试：对本地接口替身上传，结果与同步上传器一致
+"""
+
+import os
+import sys
+import asyncio
+import hashlib
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+pytest.importorskip('httpx')
+
+from mock_baidu import MockBaiduServer
+from core.async_uploader import AsyncBaiduPanUploader
+from core.baidupan import MIN_CHUNK_SIZE, BaiduPanUploader
+
+
+def _upload_files(server, paths, **kwargs):
+    async def run():
+        async with server.configure(AsyncBaiduPanUploader('token', chunk_size=MIN_CHUNK_SIZE, **kwargs)) as uploader:
+            return await uploader.upload_files(paths, remote_dir='/apps/test')
+    return asyncio.run(run())
+
+
+def test_async_upload_many_files(tmp_path):
+    paths = []
+    for i, size in enumerate([2 * MIN_CHUNK_SIZE + 100, 1000, MIN_CHUNK_SIZE]):
+        path = tmp_path / f'video{i} [id{i}].mp4'
+        path.write_bytes(os.urandom(size))
+        paths.append(str(path))
+
+    with MockBaiduServer() as server:
+        results = _upload_files(server, paths, upload_workers=4)
+        assert all(result and result['errno'] == 0 for result in results)
+        for path, result in zip(paths, results):
+            with open(path, 'rb') as f:
+                assert result['md5'] == hashlib.md5(f.read()).hexdigest()
+            assert result['path'] == f'/apps/test/{os.path.basename(path)}'
+        assert server.requests['upload'] == 5
+        assert server.requests['create'] == 3
+
+        # 内容相同的文件再次上传走秒传，不再预创建
+        results = _upload_files(server, paths[:1])
+        assert results[0]['errno'] == 0 and 'info' in results[0]
+        assert server.requests['precreate'] == 3
+
+
+def test_async_and_sync_produce_same_remote_file(tmp_path):
+    path = tmp_path / 'video.mp4'
+    path.write_bytes(os.urandom(MIN_CHUNK_SIZE + 1))
+
+    with MockBaiduServer() as sync_server, MockBaiduServer() as async_server:
+        sync_result = sync_server.configure(BaiduPanUploader('token', chunk_size=MIN_CHUNK_SIZE)).upload_file(str(path))
+        async_result, = _upload_files(async_server, [str(path)])
+    assert async_result['md5'] == sync_result['md5']
+    assert async_result['size'] == sync_result['size']
+
+
+def test_async_upload_reports_failed_file(tmp_path):
+    path = tmp_path / 'video.mp4'
+    path.write_bytes(os.urandom(100))
+    with MockBaiduServer() as server:
+        results = _upload_files(server, [str(tmp_path / 'missing.mp4'), str(path)])
+    assert results[0] is None
+    assert results[1]['errno'] == 0
@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+带宽调度测试
+"""
+
+import os
+import sys
+import time
+from types import SimpleNamespace
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.bandwidth import BandwidthScheduler, TokenBucket
+
+
+def test_token_bucket_limits_average_rate():
+    bucket = TokenBucket(rate=1000, burst=0.1)
+    start = time.monotonic()
+    for _ in range(5):
+        bucket.consume(100)
+    # 桶中初始有100个令牌，其余400字节按1000字节/秒限速
+    assert 0.35 <= time.monotonic() - start < 1.0
+
+    unlimited = TokenBucket()
+    start = time.monotonic()
+    unlimited.consume(10 ** 9)
+    assert time.monotonic() - start < 0.05
+
+
+def test_token_bucket_abort():
+    bucket = TokenBucket(rate=10)
+    with pytest.raises(RuntimeError):
+        bucket.consume(1000, should_abort=lambda: True)
+
+
+def test_shares_are_rebalanced_between_jobs():
+    scheduler = BandwidthScheduler(upload_limit=1000)
+    with scheduler.share('upload') as first:
+        assert first.rate == 1000
+        with scheduler.share('upload') as second:
+            assert first.rate == second.rate == 500
+            scheduler.set_limits(upload=3000)
+            assert first.rate == 1500
+            with scheduler.share('download') as download:
+                assert download.rate is None
+        assert first.rate == 3000
+        scheduler.set_limits(upload=None)
+        assert first.rate is None
+    assert scheduler.limits()['active'] == {'download': 0, 'upload': 0}
+
+    with pytest.raises(ValueError):
+        scheduler.set_limits(sideways=1)
+
+
+def test_limit_ydl_sets_and_restores_ratelimit():
+    scheduler = BandwidthScheduler(download_limit=2000)
+    first = SimpleNamespace(params={'ratelimit': None})
+    second = SimpleNamespace(params={'ratelimit': 800})
+    with scheduler.limit_ydl(first):
+        assert first.params['ratelimit'] == 2000
+        with scheduler.limit_ydl(second):
+            # 份额与实例原有的限速取较小值
+            assert first.params['ratelimit'] == 1000
+            assert second.params['ratelimit'] == 800
+        assert first.params['ratelimit'] == 2000
+    assert first.params['ratelimit'] is None
+    assert second.params['ratelimit'] == 800
@@ -0,0 +1,41 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+通用缓存与视频信息缓存测试
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.cache import PersistentLRUCache
+from core.download import VideoDownloader, VideoInfoCache
+
+
+def test_ttl_expiry_and_persistence(tmp_path):
+    cache_path = str(tmp_path / 'cache.json')
+    cache = PersistentLRUCache(max_entries=4, cache_path=cache_path, ttl=0.05)
+    cache.put('a', {'x': 1})
+    assert cache.get('a') == {'x': 1}
+    assert PersistentLRUCache(cache_path=cache_path, ttl=60).get('a') == {'x': 1}
+
+    time.sleep(0.1)
+    assert cache.get('a') is None
+    assert PersistentLRUCache(cache_path=cache_path, ttl=0.05).get('a') is None
+
+
+def test_video_info_cache_raw_is_consumed_once():
+    cache = VideoInfoCache(ttl=60)
+    cache.put('dQw4w9WgXcQ', {'id': 'dQw4w9WgXcQ'}, raw={'id': 'dQw4w9WgXcQ', 'formats': []})
+    assert cache.pop_raw('dQw4w9WgXcQ') == {'id': 'dQw4w9WgXcQ', 'formats': []}
+    assert cache.pop_raw('dQw4w9WgXcQ') is None
+    assert cache.get('dQw4w9WgXcQ') == {'id': 'dQw4w9WgXcQ'}
+
+
+def test_video_key_normalizes_youtube_urls():
+    assert VideoDownloader._video_key('https://www.youtube.com/watch?v=dQw4w9WgXcQ') == 'dQw4w9WgXcQ'
+    assert VideoDownloader._video_key('https://youtu.be/dQw4w9WgXcQ') == 'dQw4w9WgXcQ'
+    assert VideoDownloader._video_key('dQw4w9WgXcQ') == 'dQw4w9WgXcQ'
+    assert VideoDownloader._video_key('http://example.com/a.mp4') == 'http://example.com/a.mp4'
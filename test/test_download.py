@@ -0,0 +1,343 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+下载器测试：使用替身YoutubeDL，验证每次下载只提取一次、复用视频信息缓存，
+批量查询按完成先后返回，播放列表默认平面展开；
+从本地服务器真实下载的文件上传时直接命中下载期间计算的指纹
+"""
+
+import os
+import sys
+import functools
+import threading
+from contextlib import contextmanager
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mock_baidu import MockBaiduServer
+from core import baidupan, download, fingerprint
+from core.baidupan import MIN_CHUNK_SIZE, BaiduPanUploader, choose_chunk_size
+from core.download import VideoDownloader
+from core.fingerprint import FingerprintCache
+from core.ydlpool import YoutubeDLPool
+
+
+class StubYDL:
+    """记录调用的YoutubeDL替身：提取返回固定信息，下载写出一个小文件"""
+
+    def __init__(self, download_dir):
+        self.download_dir = download_dir
+        self.extractions = []
+        self.processed = []
+        self.format_id = '18'
+
+    def extract_info(self, url, download=True, process=True):
+        self.extractions.append((url, process))
+        video_id = url.rsplit('=', 1)[-1]
+        return {'id': video_id, 'title': f'title {video_id}', 'formats': [{'format_id': '18', 'ext': 'mp4'}]}
+
+    def process_ie_result(self, info, download=True):
+        # 与yt-dlp相同，格式选择结果直接写入传入的info
+        info['requested_formats'] = [{'format_id': self.format_id}]
+        if not download:
+            return info
+        self.processed.append(dict(info))
+        path = os.path.join(self.download_dir, f"{info['title']} [{info['id']}].mp4")
+        with open(path, 'wb') as f:
+            f.write(b'video')
+        return dict(info, requested_downloads=[{'filepath': path}])
+
+    def prepare_filename(self, info):
+        return os.path.join(self.download_dir, 'unused.webm')
+
+
+class StubPool:
+    """每次租用都返回同一个替身实例"""
+
+    def __init__(self, ydl):
+        self.ydl = ydl
+        self.leases = []
+
+    @contextmanager
+    def acquire(self, options, progress_hooks=None, before_download=None, after_download=None):
+        self.leases.append(options)
+        yield self.ydl
+
+
+def _make_downloader(tmp_path, **kwargs):
+    ydl = StubYDL(str(tmp_path))
+    downloader = VideoDownloader(download_dir=str(tmp_path), stream_fingerprint=False,
+                                 ydl_pool=StubPool(ydl), **kwargs)
+    return downloader, ydl
+
+
+def test_download_reuses_info_from_lookup(tmp_path):
+    downloader, ydl = _make_downloader(tmp_path, ydl_options={'format': 'bestvideo+bestaudio/best'})
+    ydl.format_id = 'lookup'
+    info = downloader.get_video_info('abc')
+    assert info['title'] == 'title abc'
+
+    ydl.format_id = 'download'
+    result = downloader.download_video('abc')
+    # 查询时的提取结果直接用于下载，不再访问视频页；下载重新做格式选择，不沿用查询时的结果
+    assert ydl.extractions == [('abc', False)]
+    assert ydl.processed[0]['requested_formats'] == [{'format_id': 'download'}]
+    assert result['localPath'].endswith('title abc [abc].mp4')
+    assert downloader.get_ydl_options()['format'] == 'bestvideo+bestaudio/best'
+
+    # 缓存的提取结果只使用一次
+    downloader.download_video('abc')
+    assert ydl.extractions == [('abc', False), ('https://www.youtube.com/watch?v=abc', False)]
+
+
+def test_download_extracts_once(tmp_path):
+    downloader, ydl = _make_downloader(tmp_path)
+    result = downloader.download_video('xyz')
+
+    # 只做一次不含格式处理的提取，格式选择和下载由 process_ie_result 完成
+    assert ydl.extractions == [('https://www.youtube.com/watch?v=xyz', False)]
+    assert [info['id'] for info in ydl.processed] == ['xyz']
+    # 最终文件路径取自 requested_downloads，而不是按输出模板推算
+    assert result['localPath'] == os.path.join(str(tmp_path), 'title xyz [xyz].mp4')
+    assert result['filesize'] == len(b'video')
+    # 提取结果写入信息缓存，之后的查询不再提取
+    assert downloader.get_video_info('xyz')['title'] == 'title xyz'
+    assert len(ydl.extractions) == 1
+
+
+class LookupYDL(StubYDL):
+    """'slow'的提取等待放行，'bad'的提取失败，带list参数的地址返回播放列表"""
+
+    def __init__(self, download_dir):
+        super().__init__(download_dir)
+        self.release = threading.Event()
+
+    def extract_info(self, url, download=True, process=True):
+        if url == 'slow':
+            assert self.release.wait(5)
+        if url == 'bad':
+            raise RuntimeError('Video unavailable')
+        if 'list=' in url:
+            return {'title': 'playlist', 'entries': [
+                {'id': 'v1', 'title': 'one', 'url': 'https://www.youtube.com/watch?v=v1', 'duration': 10},
+                None,
+                {'id': 'v2', 'title': 'two', 'url': 'https://www.youtube.com/watch?v=v2'},
+            ]}
+        return super().extract_info(url, download, process)
+
+
+def test_info_batch_yields_as_completed(tmp_path):
+    ydl = LookupYDL(str(tmp_path))
+    downloader = VideoDownloader(download_dir=str(tmp_path), ydl_pool=StubPool(ydl))
+    downloader.get_video_info('cached')
+
+    results = downloader.get_video_info_batch(['slow', 'cached', 'bad', 'fast', 'fast'], max_workers=3)
+    # 缓存命中的结果最先返回，其余按完成先后返回，不等待较慢的提取
+    assert next(results) == {'videoId': 'cached', 'status': 'ok', 'info': downloader.get_video_info('cached')}
+    first_two = [next(results), next(results)]
+    assert {r['videoId'] for r in first_two} == {'bad', 'fast'}
+    error, = [r for r in first_two if r['status'] == 'error']
+    assert error['videoId'] == 'bad' and 'Video unavailable' in error['message']
+    ydl.release.set()
+    assert next(results)['videoId'] == 'slow'
+    assert list(results) == []
+    # 重复的ID只查询一次
+    assert [url for url, _ in ydl.extractions].count('fast') == 1
+
+
+def test_expand_playlist_is_flat_by_default(tmp_path):
+    ydl = LookupYDL(str(tmp_path))
+    pool = StubPool(ydl)
+    downloader = VideoDownloader(download_dir=str(tmp_path), ydl_pool=pool)
+
+    entries = downloader.expand_playlist('https://www.youtube.com/playlist?list=PL1')
+    assert pool.leases[-1]['extract_flat'] == 'in_playlist'
+    assert entries == [
+        {'id': 'v1', 'title': 'one', 'url': 'https://www.youtube.com/watch?v=v1', 'duration': 10},
+        {'id': 'v2', 'title': 'two', 'url': 'https://www.youtube.com/watch?v=v2', 'duration': 0},
+    ]
+
+    downloader.expand_playlist('https://www.youtube.com/playlist?list=PL1', flat=False)
+    assert pool.leases[-1]['extract_flat'] is False
+    # 完整提取的条目写入信息缓存
+    assert downloader.info_cache.get('v1')['title'] == 'one'
+
+
+def test_host_info_and_playlist_commands(tmp_path, monkeypatch):
+    import helper
+
+    ydl = LookupYDL(str(tmp_path))
+    monkeypatch.setattr(helper, '_downloader', VideoDownloader(download_dir=str(tmp_path), ydl_pool=StubPool(ydl)))
+    messages = []
+    done = threading.Event()
+
+    def send_json(obj):
+        messages.append(obj)
+        if obj['status'] in ('info_done', 'playlist'):
+            done.set()
+
+    monkeypatch.setattr(helper, 'send_json', send_json)
+
+    assert helper.handle_request({'cmd': 'info', 'videoIds': ['a', 'bad']}) == {'status': 'looking_up', 'count': 2}
+    assert done.wait(5)
+    assert sorted((m['status'], m.get('videoId')) for m in messages) == [
+        ('error', 'bad'), ('info', 'a'), ('info_done', None)]
+    assert messages[-1] == {'status': 'info_done', 'count': 2}
+
+    messages.clear()
+    done.clear()
+    url = 'https://www.youtube.com/playlist?list=PL1'
+    assert helper.handle_request({'cmd': 'playlist', 'url': url})['status'] == 'expanding'
+    assert done.wait(5)
+    assert [entry['id'] for entry in messages[0]['entries']] == ['v1', 'v2']
+
+
+class _QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+def test_upload_hits_fingerprint_of_downloaded_file(tmp_path, monkeypatch):
+    pytest.importorskip('yt_dlp')
+    media_dir = tmp_path / 'media'
+    media_dir.mkdir()
+    (media_dir / 'clip.mp4').write_bytes(os.urandom(MIN_CHUNK_SIZE + 12345))
+    cache = FingerprintCache(cache_path=str(tmp_path / 'cache.json'))
+    monkeypatch.setattr(download, 'get_fingerprint_cache', lambda: cache)
+
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), functools.partial(_QuietHandler, directory=str(media_dir)))
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    pool = YoutubeDLPool()
+    try:
+        # 与本地消息主机相同：流式指纹按上传器的规则选择分片大小
+        downloader = VideoDownloader(
+            download_dir=str(tmp_path / 'out'), ydl_pool=pool,
+            ydl_options={'format': 'best', 'quiet': True, 'noprogress': True},
+            block_size_for=lambda size: choose_chunk_size(size, MIN_CHUNK_SIZE))
+        result = downloader.download_video(f'http://127.0.0.1:{httpd.server_address[1]}/clip.mp4')
+    finally:
+        pool.close()
+        httpd.shutdown()
+        httpd.server_close()
+
+    local_path = result['localPath']
+    assert cache.get(local_path, MIN_CHUNK_SIZE) is not None
+
+    # 上传时不再读取文件计算摘要或分片MD5
+    def no_hashing(*args, **kwargs):
+        raise AssertionError('fingerprint should come from the cache')
+
+    for module in (baidupan, fingerprint):
+        monkeypatch.setattr(module, 'compute_content_digest', no_hashing)
+        monkeypatch.setattr(module, 'compute_fingerprint', no_hashing)
+    with MockBaiduServer() as server:
+        uploader = server.configure(BaiduPanUploader('token', chunk_size=MIN_CHUNK_SIZE, fingerprint_cache=cache))
+        uploaded = uploader.upload_file(local_path)
+    assert uploaded and uploaded['errno'] == 0
+    assert uploaded['size'] == os.path.getsize(local_path)
+
+
+@contextmanager
+def _fake_site(tmp_path, monkeypatch, lookup_format=None):
+    """
+    本地HTTP服务器上的假视频站点：视频流v、音频流a、单文件18，
+    yt_dlp.YoutubeDL 替换为只认识该站点的子类；lookup_format 为未指定格式的实例（查询）的默认格式
+    """
+    yt_dlp = pytest.importorskip('yt_dlp')
+    from yt_dlp.extractor.common import InfoExtractor
+
+    media_dir = tmp_path / 'media'
+    media_dir.mkdir()
+    for name in ('v.mp4', 'a.m4a', '18.mp4'):
+        (media_dir / name).write_bytes(os.urandom(MIN_CHUNK_SIZE + 100))
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), functools.partial(_QuietHandler, directory=str(media_dir)))
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    base = f'http://127.0.0.1:{httpd.server_address[1]}'
+
+    class FakeIE(InfoExtractor):
+        _VALID_URL = r'https?://fake\.test/(?P<id>\w+)'
+
+        def _real_extract(self, url):
+            video_id = self._match_id(url)
+            return {'id': video_id, 'title': 'fake', 'formats': [
+                {'format_id': 'v', 'url': f'{base}/v.mp4', 'ext': 'mp4', 'vcodec': 'avc1', 'acodec': 'none'},
+                {'format_id': 'a', 'url': f'{base}/a.m4a', 'ext': 'm4a', 'vcodec': 'none', 'acodec': 'mp4a'},
+                {'format_id': '18', 'url': f'{base}/18.mp4', 'ext': 'mp4', 'vcodec': 'avc1', 'acodec': 'mp4a'},
+            ]}
+
+    class FakeSiteYDL(yt_dlp.YoutubeDL):
+        def __init__(self, params=None):
+            params = dict(params or {})
+            if lookup_format:
+                params.setdefault('format', lookup_format)
+            super().__init__(params, auto_init=False)
+            self.add_info_extractor(FakeIE())
+
+    monkeypatch.setattr(yt_dlp, 'YoutubeDL', FakeSiteYDL)
+    pool = YoutubeDLPool()
+    try:
+        yield pool, media_dir
+    finally:
+        pool.close()
+        httpd.shutdown()
+        httpd.server_close()
+
+
+def test_download_reselects_formats_after_lookup(tmp_path, monkeypatch):
+    cache = FingerprintCache(cache_path=str(tmp_path / 'cache.json'))
+    monkeypatch.setattr(download, 'get_fingerprint_cache', lambda: cache)
+    # 查询实例使用需要合并的格式（相当于装有ffmpeg时的默认格式）
+    with _fake_site(tmp_path, monkeypatch, lookup_format='v+a') as (pool, media_dir):
+        downloader = VideoDownloader(
+            download_dir=str(tmp_path / 'out'), ydl_pool=pool,
+            ydl_options={'format': 'best[ext=mp4]/best', 'quiet': True, 'noprogress': True},
+            block_size_for=lambda size: MIN_CHUNK_SIZE)
+        downloader.get_video_info('http://fake.test/abc')
+        result = downloader.download_video('http://fake.test/abc')
+
+    # 下载按自己的格式配置只取单一文件，不沿用查询时选出的 v+a
+    with open(result['localPath'], 'rb') as f:
+        assert f.read() == (media_dir / '18.mp4').read_bytes()
+    # 没有合并，边下载边计算的指纹仍然生效
+    assert cache.get(result['localPath'], MIN_CHUNK_SIZE) is not None
+
+
+def test_merged_download_with_host_options_is_fingerprinted(tmp_path, monkeypatch):
+    import helper
+    from yt_dlp.postprocessor.common import PostProcessor
+
+    class ConcatMerger(PostProcessor):
+        """代替ffmpeg的合并器：按顺序拼接各个分流文件"""
+        available = True
+
+        def can_merge(self):
+            return True
+
+        def run(self, info):
+            with open(info['filepath'], 'wb') as out:
+                for path in info['__files_to_merge']:
+                    with open(path, 'rb') as f:
+                        out.write(f.read())
+            return info['__files_to_merge'], info
+
+    monkeypatch.setitem(sys.modules['yt_dlp.YoutubeDL'].__dict__, 'FFmpegMergerPP', ConcatMerger)
+    cache = FingerprintCache(cache_path=str(tmp_path / 'cache.json'))
+    monkeypatch.setattr(download, 'get_fingerprint_cache', lambda: cache)
+    # 本地消息主机的下载选项（默认格式 bestvideo+bestaudio/best 需要合并），cookie文件不写入工作区
+    options = dict(helper.get_download_options(), cookiefile=str(tmp_path / 'cookies.txt'),
+                   verbose=False, quiet=True, noprogress=True)
+    assert '+' in options['format']
+    with _fake_site(tmp_path, monkeypatch) as (pool, media_dir):
+        downloader = VideoDownloader(download_dir=str(tmp_path / 'out'), ydl_pool=pool, ydl_options=options,
+                                     block_size_for=lambda size: choose_chunk_size(size, MIN_CHUNK_SIZE))
+        result = downloader.download_video('http://fake.test/abc')
+
+    local_path = result['localPath']
+    with open(local_path, 'rb') as f:
+        assert f.read() == (media_dir / 'v.mp4').read_bytes() + (media_dir / 'a.m4a').read_bytes()
+    # 合并完成后对最终文件计算了指纹，上传时直接命中
+    assert cache.get(local_path, choose_chunk_size(os.path.getsize(local_path), MIN_CHUNK_SIZE)) is not None
@@ -0,0 +1,266 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+文件指纹测试：单次读取的结果必须与逐项计算的旧实现一致
+"""
+
+import os
+import sys
+import hashlib
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core import baidupan
+from core.baidupan import MIN_CHUNK_SIZE, BaiduPanUploader, choose_chunk_size
+from core.cache import PersistentLRUCache
+from core.fingerprint import (
+    DEFAULT_BLOCK_SIZE, FileFingerprint, FingerprintCache, StreamingFingerprinter, compute_content_digest,
+    compute_fingerprint
+)
+
+
+def _legacy_block_list(file_path, block_size):
+    block_list = []
+    with open(file_path, 'rb') as f:
+        while True:
+            chunk = f.read(block_size)
+            if not chunk:
+                break
+            block_list.append(hashlib.md5(chunk).hexdigest())
+    return block_list
+
+
+def test_fingerprint_matches_legacy(tmp_path):
+    file_path = str(tmp_path / 'video.bin')
+    with open(file_path, 'wb') as f:
+        f.write(os.urandom(9 * 1024 * 1024 + 123))
+
+    uploader = BaiduPanUploader('token', chunk_size=MIN_CHUNK_SIZE)
+    fingerprint = compute_fingerprint(file_path, uploader.chunk_size)
+
+    slice_md5, content_md5_slice = uploader._get_file_slice_md5(file_path)
+    assert fingerprint.size == os.path.getsize(file_path)
+    assert fingerprint.content_md5 == uploader._get_file_md5(file_path)
+    assert fingerprint.slice_md5 == slice_md5
+    assert fingerprint.content_md5_slice == content_md5_slice
+    assert fingerprint.block_list == _legacy_block_list(file_path, uploader.chunk_size)
+    assert len(fingerprint.block_list) == 3
+
+
+def test_fingerprint_small_and_empty_file(tmp_path):
+    small = tmp_path / 'small.bin'
+    small.write_bytes(b'hello')
+    fingerprint = compute_fingerprint(str(small))
+    assert fingerprint.slice_md5 == hashlib.md5(b'hello').hexdigest()
+    assert fingerprint.block_list == [hashlib.md5(b'hello').hexdigest()]
+
+    empty = tmp_path / 'empty.bin'
+    empty.write_bytes(b'')
+    fingerprint = compute_fingerprint(str(empty))
+    assert fingerprint.size == 0
+    assert fingerprint.block_list == []
+
+
+def test_fingerprint_roundtrip(tmp_path):
+    file_path = tmp_path / 'a.bin'
+    file_path.write_bytes(b'x' * 1000)
+    fingerprint = compute_fingerprint(str(file_path))
+    restored = FileFingerprint.from_dict(fingerprint.to_dict())
+    assert restored.to_dict() == fingerprint.to_dict()
+
+
+def test_fingerprint_cache_persists_and_invalidates(tmp_path):
+    file_path = tmp_path / 'video.bin'
+    file_path.write_bytes(os.urandom(5000))
+    cache_path = str(tmp_path / 'cache.json')
+
+    cache = FingerprintCache(cache_path=cache_path)
+    fingerprint = cache.get_or_compute(str(file_path))
+    assert len(cache) == 1
+
+    # 重启后仍能命中
+    restored = FingerprintCache(cache_path=cache_path)
+    assert restored.get(str(file_path)).to_dict() == fingerprint.to_dict()
+    # 分片大小不同则不命中
+    assert restored.get(str(file_path), 8 * 1024 * 1024) is None
+
+    file_path.write_bytes(os.urandom(5001))
+    assert restored.get(str(file_path)) is None
+
+
+def test_fingerprint_cache_lru_eviction(tmp_path):
+    cache = FingerprintCache(max_entries=2, cache_path=str(tmp_path / 'cache.json'))
+    paths = []
+    for i in range(3):
+        path = tmp_path / f'{i}.bin'
+        path.write_bytes(bytes([i]) * 10)
+        paths.append(str(path))
+
+    cache.get_or_compute(paths[0])
+    cache.get_or_compute(paths[1])
+    cache.get(paths[0])
+    cache.get_or_compute(paths[2])
+
+    assert cache.get(paths[0]) is not None
+    assert cache.get(paths[1]) is None
+    assert len(cache) == 2
+
+
+def test_streaming_fingerprint_matches_full_pass(tmp_path):
+    final_path = tmp_path / 'video.mp4'
+    part_path = str(final_path) + '.part'
+    data = os.urandom(2 * 1024 * 1024 + 999)
+    cache = FingerprintCache(cache_path=str(tmp_path / 'cache.json'))
+    fingerprinter = StreamingFingerprinter(block_size=512 * 1024, cache=cache)
+
+    # 模拟yt-dlp边写边回调进度
+    with open(part_path, 'wb') as f:
+        for offset in range(0, len(data), 300 * 1024):
+            f.write(data[offset:offset + 300 * 1024])
+            f.flush()
+            fingerprinter.progress_hook({
+                'status': 'downloading',
+                'tmpfilename': part_path,
+                'filename': str(final_path),
+                'downloaded_bytes': min(offset + 300 * 1024, len(data))
+            })
+    os.replace(part_path, final_path)
+    fingerprinter.progress_hook({'status': 'finished', 'filename': str(final_path)})
+    fingerprinter.close()
+
+    expected = compute_fingerprint(str(final_path), 512 * 1024)
+    assert fingerprinter.results[str(final_path)].to_dict() == expected.to_dict()
+    assert cache.get(str(final_path), 512 * 1024).to_dict() == expected.to_dict()
+
+
+def test_choose_chunk_size_respects_account_limit():
+    mb = 1024 * 1024
+    assert choose_chunk_size(100 * mb) == 4 * mb
+    assert choose_chunk_size(4 * 1024 * mb) == 4 * mb
+    assert choose_chunk_size(200 * mb, 32 * mb) == 4 * mb
+    assert choose_chunk_size(1024 * mb, 16 * mb) == 16 * mb
+    assert choose_chunk_size(8 * 1024 * mb, 32 * mb) == 32 * mb
+
+
+def test_uploader_queries_uinfo_once(monkeypatch):
+    monkeypatch.setattr(baidupan, '_account_cache', PersistentLRUCache())
+    calls = []
+
+    class FakeResponse:
+        status_code = 200
+
+        def json(self):
+            return {'errno': 0, 'vip_type': 2}
+
+    uploader = BaiduPanUploader('token')
+    monkeypatch.setattr(uploader.session, 'request', lambda *args, **kwargs: calls.append(kwargs) or FakeResponse())
+    assert uploader.get_chunk_size(8 * 1024 ** 3) == 32 * 1024 * 1024
+    assert BaiduPanUploader('token').get_max_chunk_size() == 32 * 1024 * 1024
+    assert baidupan.cached_max_chunk_size('token') == 32 * 1024 * 1024
+    assert len(calls) == 1
+
+
+def test_streaming_fingerprint_uses_size_dependent_block_size(tmp_path):
+    path = tmp_path / 'video.mp4'
+    data = os.urandom(3 * 1024 * 1024)
+    path.write_bytes(data)
+
+    def block_size_for(size):
+        return 512 * 1024 if size < 2 * 1024 * 1024 else 1024 * 1024
+
+    fingerprinter = StreamingFingerprinter(block_size_for=block_size_for)
+    # 预计大小偏小，完成时按实际大小对应的分片大小重新计算
+    fingerprinter.progress_hook({'status': 'downloading', 'tmpfilename': str(path),
+                                 'downloaded_bytes': len(data), 'total_bytes_estimate': 1024 * 1024})
+    fingerprinter.progress_hook({'status': 'finished', 'filename': str(path)})
+    fingerprinter.close()
+
+    result = fingerprinter.results[str(path)]
+    assert result.block_size == 1024 * 1024
+    assert result.to_dict() == compute_fingerprint(str(path), 1024 * 1024).to_dict()
+
+
+def test_parallel_fingerprint_matches_serial(tmp_path):
+    path = tmp_path / 'video.bin'
+    path.write_bytes(os.urandom(5 * 512 * 1024 + 77))
+    serial = compute_fingerprint(str(path), 512 * 1024)
+    parallel = compute_fingerprint(str(path), 512 * 1024, workers=4)
+    assert parallel.to_dict() == serial.to_dict()
+    assert parallel.content_md5 == hashlib.md5(path.read_bytes()).hexdigest()
+
+    empty = tmp_path / 'empty.bin'
+    empty.write_bytes(b'')
+    assert compute_fingerprint(str(empty), workers=4).to_dict() == compute_fingerprint(str(empty)).to_dict()
+
+
+def test_rapid_upload_probe_skips_block_hashing(tmp_path, monkeypatch):
+    path = tmp_path / 'video.mp4'
+    path.write_bytes(os.urandom(3 * MIN_CHUNK_SIZE))
+    cache = FingerprintCache(cache_path=str(tmp_path / 'cache.json'))
+    block_passes = []
+    real_compute = baidupan.compute_fingerprint
+    monkeypatch.setattr(baidupan, 'compute_fingerprint',
+                        lambda *args, **kwargs: block_passes.append(args) or real_compute(*args, **kwargs))
+
+    class FakeResponse:
+        status_code = 200
+
+        def __init__(self, payload):
+            self.payload = payload
+
+        def json(self):
+            return self.payload
+
+    methods = []
+
+    def request(method, url, params=None, data=None, **kwargs):
+        methods.append(params['method'])
+        if params['method'] == 'rapidupload':
+            return FakeResponse({'errno': 0} if rapid_hit else {'errno': 404})
+        if params['method'] == 'precreate':
+            return FakeResponse({'errno': 0, 'uploadid': 'uid'})
+        return FakeResponse({'errno': 0, 'md5': 'x'})
+
+    uploader = BaiduPanUploader('token', chunk_size=MIN_CHUNK_SIZE, fingerprint_cache=cache)
+    uploader.session.request = request
+
+    # 秒传成功：只计算摘要，不计算分片MD5列表
+    rapid_hit = True
+    assert uploader.upload_file(str(path)) == {'errno': 0}
+    assert block_passes == []
+    assert cache.get_digest(str(path)).content_md5 == hashlib.md5(path.read_bytes()).hexdigest()
+
+    # 秒传失败：复用摘要，只补算分片MD5列表
+    rapid_hit = False
+    assert uploader.upload_file(str(path))
+    assert len(block_passes) == 1
+    assert methods[-1] == 'create'
+    assert cache.get(str(path), MIN_CHUNK_SIZE).to_dict() == compute_fingerprint(str(path), MIN_CHUNK_SIZE).to_dict()
+
+
+def test_single_block_fingerprint_from_digest(tmp_path):
+    path = tmp_path / 'small.bin'
+    path.write_bytes(os.urandom(1000))
+    digest = compute_content_digest(str(path))
+    fingerprint = FileFingerprint.from_digest(digest, DEFAULT_BLOCK_SIZE)
+    assert fingerprint.to_dict() == compute_fingerprint(str(path)).to_dict()
+    assert FileFingerprint.from_digest(digest, 512) is None
+
+
+def test_streaming_fingerprint_skips_merged_formats(tmp_path):
+    path = tmp_path / 'video.f137.mp4'
+    path.write_bytes(os.urandom(600 * 1024))
+    fingerprinter = StreamingFingerprinter(block_size=512 * 1024)
+
+    # 视频流和音频流分别下载后合并，分流文件的指纹不会被上传用到
+    fingerprinter.before_download({'id': 'x', 'requested_formats': [{'format_id': '137'}, {'format_id': '140'}]})
+    fingerprinter.progress_hook({'status': 'downloading', 'filename': str(path), 'downloaded_bytes': 600 * 1024})
+    fingerprinter.progress_hook({'status': 'finished', 'filename': str(path)})
+
+    # 下一个单文件格式的下载重新启用
+    single = tmp_path / 'video.mp4'
+    single.write_bytes(os.urandom(1000))
+    fingerprinter.before_download({'id': 'y', 'format_id': '18'})
+    fingerprinter.progress_hook({'status': 'finished', 'filename': str(single)})
+    fingerprinter.close()
+    assert list(fingerprinter.results) == [str(single)]
@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+任务调度测试：消息带jobId，下载完成后转入上传，排队和运行中的任务都能取消
+"""
+
+import os
+import sys
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.jobs import JobScheduler
+
+
+def _make_scheduler(download_fn, upload_fn=None, download_workers=1):
+    messages = []
+    lock = threading.Lock()
+
+    def emit(obj):
+        with lock:
+            messages.append(obj)
+
+    upload_fn = upload_fn or (lambda job: {'status': 'success', 'fs_id': 1, 'path': '/apps/x'})
+    scheduler = JobScheduler(download_fn, upload_fn, emit, download_workers=download_workers)
+    return scheduler, messages
+
+
+def test_download_then_upload_tags_job_id():
+    def download_fn(job, on_progress):
+        on_progress(50)
+        on_progress(100)
+        return f'/tmp/{job.video_id}.mp4'
+
+    scheduler, messages = _make_scheduler(download_fn)
+    job = scheduler.submit_download('abc', upload=True)
+    scheduler.shutdown()
+
+    assert job.status == 'completed'
+    assert all(m['jobId'] == job.job_id for m in messages)
+    assert [m.get('percent') for m in messages if 'percent' in m] == [50, 100]
+    assert messages[-1]['status'] == 'completed'
+    assert messages[-1]['fs_id'] == 1
+    assert scheduler.status(job.job_id)['job']['localPath'] == '/tmp/abc.mp4'
+
+
+def test_cancel_running_and_queued_jobs():
+    started = threading.Event()
+
+    def download_fn(job, on_progress):
+        started.set()
+        while True:
+            on_progress(1)
+            job.cancel_event.wait(0.01)
+
+    scheduler, messages = _make_scheduler(download_fn)
+    running = scheduler.submit_download('a')
+    queued = scheduler.submit_download('b')
+    started.wait(5)
+
+    assert scheduler.cancel(queued.job_id)['status'] == 'cancelling'
+    assert scheduler.cancel(running.job_id)['status'] == 'cancelling'
+    scheduler.shutdown()
+
+    assert running.status == 'cancelled'
+    assert queued.status == 'cancelled'
+    assert scheduler.cancel('missing')['status'] == 'error'
+
+
+def test_finished_jobs_are_evicted():
+    messages = []
+    scheduler = JobScheduler(lambda job, on_progress: f'/tmp/{job.video_id}.mp4', lambda job: {},
+                             messages.append, max_finished=2)
+    jobs = [scheduler.submit_download(v) for v in 'abc']
+    scheduler.shutdown()
+
+    # 只保留最近结束的两个任务
+    assert [job.status for job in jobs] == ['completed'] * 3
+    assert scheduler.get(jobs[0].job_id) is None
+    assert [j['videoId'] for j in scheduler.status()['jobs']] == ['b', 'c']
+
+    # 超过保留时间的任务同样被淘汰
+    scheduler.finished_ttl = 0
+    assert scheduler.status()['jobs'] == []
@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+上传会话日志测试：重启后能恢复已确认的分片，文件变化后会话失效，
+上传中断后续传只补传未确认的分片，会话失效后重新预创建
+"""
+
+import os
+import sys
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mock_baidu import MockBaiduServer
+from core.baidupan import MIN_CHUNK_SIZE, BaiduPanUploader
+from core.fingerprint import compute_fingerprint
+from core.journal import UploadJournal
+from core.retry import RetryPolicy
+
+
+def test_journal_replay_and_finish(tmp_path):
+    file_path = tmp_path / 'video.bin'
+    file_path.write_bytes(os.urandom(1000))
+    journal_path = str(tmp_path / 'journal.jsonl')
+    fingerprint = compute_fingerprint(str(file_path))
+
+    journal = UploadJournal(journal_path)
+    journal.begin(str(file_path), '/apps/x', 'U1', fingerprint)
+    journal.mark_part(str(file_path), 'U1', 0)
+    journal.mark_part(str(file_path), 'U1', 2)
+    # 其他uploadid的分片不会被记入
+    journal.mark_part(str(file_path), 'U2', 1)
+
+    restored = UploadJournal(journal_path)
+    session = restored.find(str(file_path), '/apps/x', fingerprint.block_size)
+    assert session.uploadid == 'U1'
+    assert session.done_parts == {0, 2}
+    assert session.fingerprint.to_dict() == fingerprint.to_dict()
+
+    restored.finish(str(file_path))
+    assert UploadJournal(journal_path).find(str(file_path), '/apps/x', fingerprint.block_size) is None
+
+
+def test_journal_invalidates_changed_file(tmp_path):
+    file_path = tmp_path / 'video.bin'
+    file_path.write_bytes(b'a' * 100)
+    journal = UploadJournal(str(tmp_path / 'journal.jsonl'))
+    fingerprint = compute_fingerprint(str(file_path))
+    journal.begin(str(file_path), '/apps/x', 'U1', fingerprint)
+
+    assert journal.find(str(file_path), '/apps/y', fingerprint.block_size) is None
+
+    journal.begin(str(file_path), '/apps/x', 'U1', fingerprint)
+    file_path.write_bytes(b'b' * 101)
+    assert journal.find(str(file_path), '/apps/x', fingerprint.block_size) is None
+
+
+def _failing_part(uploader, partseq):
+    """让指定分片的请求出现连接错误（可重试的临时错误，但只尝试一次）"""
+    send = uploader.session.request
+
+    def request(method, url, params=None, **kwargs):
+        if (params or {}).get('partseq') == partseq:
+            raise requests.ConnectionError('connection reset')
+        return send(method, url, params=params, **kwargs)
+
+    uploader.session.request = request
+    return send
+
+
+def test_upload_resumes_acknowledged_parts(tmp_path):
+    path = tmp_path / 'video.mp4'
+    path.write_bytes(os.urandom(3 * MIN_CHUNK_SIZE))
+    journal = UploadJournal(str(tmp_path / 'journal.jsonl'))
+
+    with MockBaiduServer() as server:
+        uploader = server.configure(BaiduPanUploader(
+            'token', upload_workers=1, journal=journal, chunk_size=MIN_CHUNK_SIZE,
+            retry_policy=RetryPolicy(max_attempts=1)))
+        send = _failing_part(uploader, 1)
+        assert uploader.upload_file(str(path)) is None
+
+        session = journal.find(str(path), f'/apps/yt-download/{path.name}', MIN_CHUNK_SIZE)
+        assert 0 in session.done_parts and 1 not in session.done_parts
+        acknowledged = len(session.done_parts)
+        sent = server.requests['upload']
+
+        uploader.session.request = send
+        result = uploader.upload_file(str(path))
+        assert result and result['errno'] == 0
+        # 续传沿用原uploadid，只补传未确认的分片
+        assert server.requests['precreate'] == 1
+        assert server.requests['upload'] - sent == 3 - acknowledged
+        assert journal.find(str(path), result['path'], MIN_CHUNK_SIZE) is None
+
+
+def test_upload_drops_dead_session(tmp_path):
+    path = tmp_path / 'video.mp4'
+    path.write_bytes(os.urandom(2 * MIN_CHUNK_SIZE))
+    journal = UploadJournal(str(tmp_path / 'journal.jsonl'))
+    remote_path = f'/apps/yt-download/{path.name}'
+
+    with MockBaiduServer() as server:
+        uploader = server.configure(BaiduPanUploader(
+            'token', upload_workers=1, journal=journal, chunk_size=MIN_CHUNK_SIZE,
+            retry_policy=RetryPolicy(max_attempts=1)))
+        send = _failing_part(uploader, 1)
+        assert uploader.upload_file(str(path)) is None
+        uploader.session.request = send
+
+        # uploadid 在服务端已失效：续传的分片返回31363，会话被丢弃
+        server.uploads.clear()
+        assert uploader.upload_file(str(path)) is None
+        assert journal.find(str(path), remote_path, MIN_CHUNK_SIZE) is None
+
+        # 创建文件返回不可重试的错误时同样丢弃会话
+        server.inject('create', status=200, errno=31352)
+        assert uploader.upload_file(str(path)) is None
+        assert server.requests['precreate'] == 2
+        assert journal.find(str(path), remote_path, MIN_CHUNK_SIZE) is None
+
+        result = uploader.upload_file(str(path))
+        assert result and result['errno'] == 0
+        assert server.requests['precreate'] == 3
+
+
+def test_journal_skips_malformed_records(tmp_path):
+    file_path = tmp_path / 'video.bin'
+    file_path.write_bytes(os.urandom(1000))
+    journal_path = str(tmp_path / 'journal.jsonl')
+    fingerprint = compute_fingerprint(str(file_path))
+
+    journal = UploadJournal(journal_path)
+    journal.begin(str(file_path), '/apps/x', 'U1', fingerprint)
+    journal.mark_part(str(file_path), 'U1', 0)
+    key = os.path.abspath(str(file_path))
+    with open(journal_path, 'a', encoding='utf-8') as f:
+        # 合法JSON但不是对象、缺少字段、字段类型不对的记录，以及不完整的最后一行
+        f.write('[1, 2]\n42\n{"op": "begin"}\n')
+        f.write('{"op": "begin", "local_path": "/other.bin", "remote_path": "/apps/y"}\n')
+        f.write('{"op": "part", "local_path": "%s", "uploadid": "U1", "partseq": [1]}\n' % key)
+        f.write('{"op": "part", "local_path": "%s", "uploadid": "U1", "partseq": 2}\n' % key)
+        f.write('{"op": "part", "local_pa')
+
+    # 损坏的记录被跳过，上传器仍可正常创建
+    restored = UploadJournal(journal_path)
+    BaiduPanUploader('token', journal=restored)
+    session = restored.find(str(file_path), '/apps/x', fingerprint.block_size)
+    assert session.done_parts == {0, 2}
+    assert restored.find('/other.bin', '/apps/y', fingerprint.block_size) is None
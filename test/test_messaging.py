@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+消息写出器测试：帧完整、进度按任务合并、重复百分比被丢弃
+"""
+
+import io
+import os
+import sys
+import json
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.messaging import MessageWriter
+
+
+def _decode_frames(data: bytes):
+    messages = []
+    offset = 0
+    while offset < len(data):
+        length = int.from_bytes(data[offset:offset + 4], 'little')
+        messages.append(json.loads(data[offset + 4:offset + 4 + length].decode('utf-8')))
+        offset += 4 + length
+    return messages
+
+
+def test_concurrent_frames_are_not_interleaved():
+    stream = io.BytesIO()
+    writer = MessageWriter(stream)
+
+    def worker(n):
+        for i in range(200):
+            writer.send({'status': 'log', 'jobId': f'job{n}', 'seq': i, 'text': '进度' * 50})
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    writer.close()
+
+    messages = _decode_frames(stream.getvalue())
+    assert len(messages) == 800
+    for n in range(4):
+        assert [m['seq'] for m in messages if m['jobId'] == f'job{n}'] == list(range(200))
+
+
+def test_progress_is_coalesced_and_deduplicated():
+    stream = io.BytesIO()
+    writer = MessageWriter(stream, progress_interval=60)
+    for pct in (1, 1, 2, 3, 3, 4):
+        writer.send({'jobId': 'a', 'percent': pct})
+    writer.send({'jobId': 'b', 'percent': 10})
+    writer.send({'jobId': 'b', 'percent': 10})
+    writer.send({'status': 'completed', 'jobId': 'a'})
+    writer.close()
+
+    messages = _decode_frames(stream.getvalue())
+    a_messages = [m for m in messages if m['jobId'] == 'a']
+    # 间隔内的进度合并为最新值，并先于结束消息写出
+    assert a_messages[-1] == {'status': 'completed', 'jobId': 'a'}
+    assert a_messages[-2] == {'jobId': 'a', 'percent': 4}
+    assert len(a_messages) <= 3
+    assert [m for m in messages if m['jobId'] == 'b'] == [{'jobId': 'b', 'percent': 10}]
+
+
+def test_messages_are_dropped_after_write_failure():
+    class BrokenPipe(io.BytesIO):
+        def write(self, data):
+            raise BrokenPipeError('pipe closed')
+
+    writer = MessageWriter(BrokenPipe())
+    writer.send({'status': 'log', 'jobId': 'a'})
+    writer._thread.join(5)
+    assert writer.failed
+
+    # 写线程已退出，之后的消息不再排队，也不抛出异常
+    writer.send({'status': 'completed', 'jobId': 'a'})
+    writer.send({'jobId': 'a', 'percent': 50})
+    assert writer.dropped == 3
+    assert not writer._queue and not writer._pending
+    writer.close()
+
+
+def test_send_after_close_is_dropped():
+    stream = io.BytesIO()
+    writer = MessageWriter(stream)
+    writer.send({'status': 'completed', 'jobId': 'a'})
+    writer.close()
+
+    # 退出时仍在运行的后台线程发送的消息被丢弃，不抛出异常
+    writer.send({'status': 'info_done', 'count': 1})
+    assert writer.dropped == 1
+    assert _decode_frames(stream.getvalue()) == [{'status': 'completed', 'jobId': 'a'}]
+
+
+def test_late_progress_after_final_is_dropped():
+    stream = io.BytesIO()
+    writer = MessageWriter(stream, progress_interval=60)
+    writer.send({'jobId': 'a', 'videoId': 'v', 'percent': 50})
+    writer.send({'status': 'completed', 'jobId': 'a', 'videoId': 'v'})
+    # 进度回调与结束消息来自不同线程，结束后仍可能有进度到达
+    writer.send({'jobId': 'a', 'videoId': 'v', 'percent': 99})
+    # 同一视频的新任务不受影响
+    writer.send({'jobId': 'b', 'videoId': 'v', 'percent': 10})
+    writer.close()
+
+    messages = _decode_frames(stream.getvalue())
+    assert [m for m in messages if m['jobId'] == 'a'] == [
+        {'jobId': 'a', 'videoId': 'v', 'percent': 50},
+        {'status': 'completed', 'jobId': 'a', 'videoId': 'v'},
+    ]
+    assert {'jobId': 'b', 'videoId': 'v', 'percent': 10} in messages
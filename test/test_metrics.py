@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+指标测试：任务范围内记录阶段耗时和计数，结束时写入JSON Lines并汇总
+"""
+
+import os
+import sys
+import json
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mock_baidu import MockBaiduServer
+from core import baidupan
+from core.baidupan import MIN_CHUNK_SIZE, BaiduPanUploader
+from core.metrics import MetricsRecorder, current_metrics
+from core.remote_index import RemoteIndex
+from core.retry import RetryPolicy
+
+
+def test_job_scope_writes_line_and_stats(tmp_path):
+    recorder = MetricsRecorder(str(tmp_path / 'metrics.jsonl'))
+    for seconds in (0.1, 0.2, 0.3, 0.4):
+        with recorder.job('download', 'abc') as metrics:
+            assert current_metrics() is metrics
+            metrics.add_phase('extract', seconds)
+            metrics.add('bytes_downloaded', 100)
+    with pytest.raises(ValueError):
+        with recorder.job('download', 'bad'):
+            raise ValueError('boom')
+
+    # 范围外的记录被丢弃
+    current_metrics().add('bytes_downloaded', 1)
+
+    lines = [json.loads(line) for line in (tmp_path / 'metrics.jsonl').read_text().splitlines()]
+    assert [line['status'] for line in lines] == ['ok'] * 4 + ['error']
+    assert lines[0]['phases']['extract'] == {'count': 1, 'total_s': 0.1}
+
+    stats = recorder.stats()
+    assert stats['jobs'] == {'download:ok': 4, 'download:error': 1}
+    assert stats['counters'] == {'bytes_downloaded': 400}
+    extract = stats['phases']['extract']
+    assert extract['count'] == 4
+    assert (extract['p50_ms'], extract['p95_ms'], extract['max_ms']) == (200.0, 400.0, 400.0)
+
+
+def test_upload_records_phases_and_retries(tmp_path, monkeypatch):
+    recorder = MetricsRecorder(str(tmp_path / 'metrics.jsonl'))
+    monkeypatch.setattr(baidupan, 'get_metrics', lambda: recorder)
+    monkeypatch.setattr(baidupan, 'get_remote_index', lambda: RemoteIndex(str(tmp_path / 'index.json')))
+
+    path = tmp_path / 'video [id0].mp4'
+    path.write_bytes(os.urandom(2 * MIN_CHUNK_SIZE))
+    with MockBaiduServer() as server:
+        uploader = server.configure(BaiduPanUploader('token', chunk_size=MIN_CHUNK_SIZE,
+                                                     retry_policy=RetryPolicy(base_delay=0)))
+        server.inject('upload', status=503)
+        response = baidupan._upload_one(uploader, 'id0', str(path))
+        api_calls = sum(server.requests.values())
+
+    assert response['status'] == 'success'
+    entry, = recorder.stats()['recent']
+    assert entry['kind'] == 'upload' and entry['status'] == 'success'
+    assert {'hash', 'rapid_upload', 'precreate', 'upload_part', 'create'} <= set(entry['phases'])
+    assert entry['phases']['upload_part']['count'] == 2
+    assert entry['counters']['retries'] == 1
+    assert entry['counters']['bytes_uploaded'] == 2 * MIN_CHUNK_SIZE
+    assert entry['counters']['api_calls'] == api_calls
+
+
+def test_default_recorder_respects_metrics_file_env(tmp_path):
+    from core.metrics import get_metrics
+
+    # conftest 将 YT_METRICS_FILE 指向本测试的临时目录
+    with get_metrics().job('upload', 'env'):
+        current_metrics().add('bytes_uploaded', 1)
+    assert os.path.exists(tmp_path / 'metrics.jsonl')
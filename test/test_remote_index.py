@@ -0,0 +1,147 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+远程索引测试：记录上传结果和本地内容MD5，按网盘目录列表重建
+"""
+
+import os
+import sys
+import hashlib
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mock_baidu import MockBaiduServer
+from core import baidupan
+from core.baidupan import MIN_CHUNK_SIZE, BaiduPanUploader
+from core.fingerprint import FingerprintCache
+from core.metrics import MetricsRecorder
+from core.remote_index import RemoteIndex, video_id_from_filename
+from core.retry import RetryPolicy
+
+
+class FakeResponse:
+    status_code = 200
+
+    def __init__(self, payload):
+        self.payload = payload
+
+    def json(self):
+        return self.payload
+
+
+def test_video_id_from_filename():
+    assert video_id_from_filename('标题 [part 1] [dQw4w9WgXcQ].mp4') == 'dQw4w9WgXcQ'
+    assert video_id_from_filename('/apps/yt-download/a [Esk-pbgFaBI].webm') == 'Esk-pbgFaBI'
+    assert video_id_from_filename('notes.txt') is None
+
+
+def test_record_persists(tmp_path):
+    index_path = str(tmp_path / 'index.json')
+    index = RemoteIndex(index_path)
+    index.record('abc', {'path': '/apps/yt-download/x [abc].mp4', 'fs_id': 1, 'md5': 'm', 'size': 3})
+    index.record('ignored', {'errno': 0})
+    restored = RemoteIndex(index_path)
+    assert restored.get('abc')['fs_id'] == 1
+    assert 'ignored' not in restored
+
+
+def test_rebuild_from_paginated_listing(tmp_path):
+    uploader = BaiduPanUploader('token', retry_policy=RetryPolicy(max_attempts=1))
+    files = [{'path': f'/apps/yt-download/v{i} [id{i}].mp4', 'server_filename': f'v{i} [id{i}].mp4',
+              'fs_id': i, 'md5': f'md5{i}', 'size': i, 'isdir': 0} for i in range(5)]
+    files.append({'path': '/apps/yt-download/sub', 'server_filename': 'sub', 'isdir': 1})
+    starts = []
+
+    def request(method, url, params=None, **kwargs):
+        starts.append(params['start'])
+        page = files[params['start']:params['start'] + params['limit']]
+        return FakeResponse({'errno': 0, 'list': page})
+
+    uploader.session.request = request
+
+    index = RemoteIndex(str(tmp_path / 'index.json'))
+    index.record('gone', {'path': '/apps/yt-download/deleted [gone].mp4'})
+    index.record('other', {'path': '/apps/other/kept [other].mp4'})
+    assert index.rebuild('/apps/yt-download', uploader.list_files('/apps/yt-download', page_size=2)) == 5
+    assert starts == [0, 2, 4, 6]
+    assert index.get('id3')['path'] == '/apps/yt-download/v3 [id3].mp4'
+    assert 'gone' not in index
+    assert 'other' in index
+
+
+def test_upload_records_local_content_md5(tmp_path, monkeypatch):
+    index = RemoteIndex(str(tmp_path / 'index.json'))
+    monkeypatch.setattr(baidupan, 'get_remote_index', lambda: index)
+    monkeypatch.setattr(baidupan, 'get_metrics', lambda: MetricsRecorder(str(tmp_path / 'metrics.jsonl')))
+    path = tmp_path / 'video [abc].mp4'
+    path.write_bytes(os.urandom(3000))
+
+    with MockBaiduServer() as server:
+        cache = FingerprintCache(cache_path=str(tmp_path / 'cache.json'))
+        uploader = server.configure(BaiduPanUploader('token', chunk_size=MIN_CHUNK_SIZE, fingerprint_cache=cache))
+        assert baidupan._upload_one(uploader, 'abc', str(path))['status'] == 'success'
+        files = list(uploader.list_files())
+
+    entry = index.get('abc')
+    assert entry['content_md5'] == hashlib.md5(path.read_bytes()).hexdigest()
+    assert 'md5' not in entry
+
+    # 目录列表没有本地内容MD5，重建时沿用同一文件已记录的值
+    index.rebuild('/apps/yt-download', files)
+    assert index.get('abc')['content_md5'] == entry['content_md5']
+
+
+def test_ensure_remote_index_records_failure(tmp_path, monkeypatch):
+    index_path = str(tmp_path / 'index.json')
+    calls = []
+
+    def failing_sync(access_token, remote_dir, remote_index):
+        calls.append(access_token)
+        raise OSError('network down')
+
+    monkeypatch.setattr(baidupan, 'sync_remote_index', failing_sync)
+    assert baidupan.ensure_remote_index('token', remote_index=RemoteIndex(index_path)) is False
+    # 新进程读到失败记录，不再自动重试
+    assert baidupan.ensure_remote_index('token', remote_index=RemoteIndex(index_path)) is False
+    assert calls == ['token']
+    assert not os.path.exists(index_path)
+
+    # 显式同步成功后清除失败记录
+    index = RemoteIndex(index_path)
+    index.rebuild('/apps/yt-download', [])
+    assert not os.path.exists(index.sync_failure_path)
+    assert not index.needs_sync()
+
+
+def test_ensure_remote_index_syncs_once(tmp_path, monkeypatch):
+    calls = []
+
+    def sync(access_token, remote_dir, remote_index):
+        calls.append(remote_dir)
+        return remote_index.rebuild(remote_dir, [{'path': f'{remote_dir}/a [id1].mp4', 'size': 1, 'fs_id': 1}])
+
+    monkeypatch.setattr(baidupan, 'sync_remote_index', sync)
+    index = RemoteIndex(str(tmp_path / 'index.json'))
+    assert baidupan.ensure_remote_index('token', remote_index=index)
+    assert baidupan.ensure_remote_index('token', remote_index=index)
+    assert calls == ['/apps/yt-download']
+    assert index.get('id1')['fs_id'] == 1
+
+
+def test_sync_index_command_replies_directly(monkeypatch):
+    import helper
+
+    sent = []
+    monkeypatch.setattr(helper, 'send_json', sent.append)
+    monkeypatch.setattr(helper, 'sync_remote_index', lambda access_token: 3)
+    assert helper.handle_request({'cmd': 'sync_index'}) == {'status': 'index_synced', 'count': 3}
+
+    def failing_sync(access_token):
+        raise OSError('network down')
+
+    monkeypatch.setattr(helper, 'sync_remote_index', failing_sync)
+    reply = helper.handle_request({'cmd': 'sync_index'})
+    assert reply['status'] == 'error' and 'network down' in reply['message']
+    # 结果只作为应答返回，不另发不属于任何任务的消息
+    assert sent == []
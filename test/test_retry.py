@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+接口重试测试
+"""
+
+import os
+import sys
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.baidupan import MIN_CHUNK_SIZE, BaiduPanUploader
+from core.retry import BaiduApiError, RetryBudget, RetryPolicy
+
+NO_WAIT = RetryPolicy(max_attempts=3, base_delay=0)
+
+
+class FakeResponse:
+    def __init__(self, status_code, payload):
+        self.status_code = status_code
+        self.payload = payload
+
+    def json(self):
+        if self.payload is None:
+            raise ValueError('not json')
+        return self.payload
+
+
+def test_errno_classification():
+    assert BaiduApiError('x', errno=31034).retryable
+    assert BaiduApiError('x', status_code=502).retryable
+    assert not BaiduApiError('x', errno=-6).retryable
+    assert not BaiduApiError('x', errno=111, status_code=500).retryable
+    assert not BaiduApiError('x', errno=-10).retryable
+    assert not BaiduApiError('x', errno=2, status_code=400).retryable
+
+
+def test_policy_retries_transient_and_fails_fast_on_auth():
+    calls = []
+
+    def flaky():
+        calls.append(1)
+        if len(calls) < 3:
+            raise ConnectionError('reset')
+        return 'ok'
+
+    assert NO_WAIT.call(flaky) == 'ok'
+    assert len(calls) == 3
+
+    calls.clear()
+
+    def unauthorized():
+        calls.append(1)
+        raise BaiduApiError('token expired', errno=111)
+
+    with pytest.raises(BaiduApiError):
+        NO_WAIT.call(unauthorized)
+    assert len(calls) == 1
+
+
+def test_shared_budget_limits_total_retries():
+    budget = RetryBudget(1)
+    calls = []
+
+    def failing():
+        calls.append(1)
+        raise BaiduApiError('busy', errno=42000)
+
+    with pytest.raises(BaiduApiError):
+        NO_WAIT.call(failing, budget=budget)
+    with pytest.raises(BaiduApiError):
+        NO_WAIT.call(failing, budget=budget)
+    # 第一次调用用掉唯一的重试机会，第二次调用不再重试
+    assert len(calls) == 3
+
+
+def test_upload_slices_retries_single_failed_part(tmp_path):
+    file_path = tmp_path / 'video.bin'
+    file_path.write_bytes(os.urandom(3 * MIN_CHUNK_SIZE))
+    uploader = BaiduPanUploader('token', upload_workers=2, chunk_size=MIN_CHUNK_SIZE, retry_policy=NO_WAIT)
+    lock = threading.Lock()
+    attempts = {}
+
+    def request(method, url, params=None, **kwargs):
+        with lock:
+            partseq = params['partseq']
+            attempts[partseq] = attempts.get(partseq, 0) + 1
+            if partseq == 1 and attempts[partseq] == 1:
+                return FakeResponse(502, None)
+            return FakeResponse(200, {'md5': 'x', 'partseq': str(partseq)})
+
+    uploader.session.request = request
+    done = []
+    assert uploader.upload_slices(str(file_path), 'uid', '/apps/x', on_part_done=done.append)
+    assert sorted(done) == [0, 1, 2]
+    assert attempts == {0: 1, 1: 2, 2: 1}
+
+
+def test_upload_survives_injected_faults(tmp_path):
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    from mock_baidu import MockBaiduServer
+
+    path = tmp_path / 'video.mp4'
+    path.write_bytes(os.urandom(2 * MIN_CHUNK_SIZE))
+    with MockBaiduServer() as server:
+        uploader = server.configure(BaiduPanUploader('token', chunk_size=MIN_CHUNK_SIZE, retry_policy=NO_WAIT))
+        server.inject('upload', status=503)
+        server.inject('upload', drop=True)
+        server.inject('create', status=200, errno=31034)
+        result = uploader.upload_file(str(path))
+        assert result and result['errno'] == 0
+        assert server.requests['upload'] == 4
+        assert server.requests['create'] == 2
+        assert server.faults_served == 3
+
+        # 鉴权错误不重试
+        path.write_bytes(os.urandom(100))
+        server.inject('precreate', status=200, errno=-6)
+        assert uploader.upload_file(str(path)) is None
+        assert server.requests['precreate'] == 2
@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+下载暂存区测试
+"""
+
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.staging import StagingArea, StagingError
+
+
+def _write(path, size):
+    with open(path, 'wb') as f:
+        f.write(b'\0' * size)
+    return str(path)
+
+
+def _staging(tmp_path, budget):
+    return StagingArea(str(tmp_path), byte_budget=budget, min_free_bytes=0, poll_interval=0.05)
+
+
+def test_expected_size_counts_merge_overhead():
+    assert StagingArea.expected_size({'filesize': 100}) == 100
+    assert StagingArea.expected_size({'filesize_approx': 50.5}) == 50
+    info = {'requested_formats': [{'filesize': 100}, {'filesize_approx': 20}]}
+    assert StagingArea.expected_size(info) == 240
+    assert StagingArea.expected_size({}) == 0
+
+
+def test_evicts_uploaded_files_oldest_first(tmp_path):
+    staging = _staging(tmp_path, budget=10000)
+    old = _write(tmp_path / 'old.mp4', 4000)
+    new = _write(tmp_path / 'new.mp4', 4000)
+    pending = _write(tmp_path / 'pending.mp4', 1000)
+    staging.mark_uploaded(old)
+    time.sleep(0.01)
+    staging.mark_uploaded(new)
+
+    reservation = staging.reserve(3000)
+    assert not os.path.exists(old)
+    assert os.path.exists(new) and os.path.exists(pending)
+    reservation.release()
+
+    # 索引持久化：重启后仍可淘汰
+    restarted = _staging(tmp_path, budget=10000)
+    restarted.reserve(8000).release()
+    assert not os.path.exists(new)
+    assert os.path.exists(pending)
+
+
+def test_admission_waits_for_release(tmp_path):
+    staging = _staging(tmp_path, budget=10000)
+    first = staging.reserve(7000)
+    with pytest.raises(StagingError):
+        staging.reserve(5000, timeout=0.1)
+
+    admitted = threading.Event()
+
+    def second():
+        staging.reserve(5000)
+        admitted.set()
+
+    threading.Thread(target=second, daemon=True).start()
+    assert not admitted.wait(0.1)
+    first.release()
+    assert admitted.wait(2)
+
+
+def test_written_bytes_are_not_counted_twice(tmp_path):
+    staging = _staging(tmp_path, budget=10000)
+    reservation = staging.reserve(6000)
+    _write(tmp_path / 'video.mp4.part', 6000)
+    reservation.progress_hook({'status': 'downloading', 'tmpfilename': 'video.mp4.part',
+                               'downloaded_bytes': 6000})
+    assert reservation.outstanding == 0
+    staging.reserve(3000, timeout=0.1).release()
+
+
+def test_rejects_files_larger_than_budget(tmp_path):
+    staging = _staging(tmp_path, budget=1000)
+    with pytest.raises(StagingError):
+        staging.reserve(2000)
+    aborted = staging.admission(should_abort=lambda: True)
+    staging.track(_write(tmp_path / 'big.mp4', 900))
+    with pytest.raises(StagingError):
+        aborted.before_download({'filesize': 500})
+
+
+def test_only_tracked_media_counts_against_budget(tmp_path):
+    staging = _staging(tmp_path, budget=10000)
+    # 同目录下的缓存、索引文件不计入预算
+    _write(tmp_path / 'fingerprint_cache.json', 50000)
+    _write(tmp_path / 'remote_index.json', 50000)
+    staging.reserve(9000, timeout=0.1).release()
+
+    admission = staging.admission()
+    admission.before_download({'filesize': 4000})
+    video = _write(tmp_path / 'video [abc].mp4', 4000)
+    admission.after_download({'filepath': video})
+    admission.release()
+    assert staging.disk_usage() == 4000
+
+    # 记录的文件在重启后仍计入占用
+    restarted = _staging(tmp_path, budget=10000)
+    assert restarted.disk_usage() == 4000
+    with pytest.raises(StagingError):
+        restarted.reserve(7000, timeout=0.1)
+
+
+def test_reserve_times_out_by_default(tmp_path):
+    staging = StagingArea(str(tmp_path), byte_budget=1000, min_free_bytes=0,
+                          poll_interval=0.05, reserve_timeout=0.2)
+    staging.track(_write(tmp_path / 'pending.mp4', 900))
+    admission = staging.admission()
+    start = time.monotonic()
+    # 没有可淘汰的文件时不会一直阻塞下载线程
+    with pytest.raises(StagingError, match='超时'):
+        admission.before_download({'filesize': 500})
+    assert time.monotonic() - start < 2
@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+批量上传测试：共用一个上传器，逐个文件给出结果，下一个文件的秒传摘要在上传前已算好
+"""
+
+import os
+import sys
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mock_baidu import MockBaiduServer
+from core import baidupan
+from core.baidupan import MIN_CHUNK_SIZE, BaiduPanUploader, handle_upload_batch
+from core.fingerprint import FingerprintCache
+from core.jobs import JobScheduler
+from core.metrics import MetricsRecorder
+from core.remote_index import RemoteIndex
+
+
+def test_upload_batch_reports_each_file(tmp_path, monkeypatch):
+    index = RemoteIndex(str(tmp_path / 'index.json'))
+    monkeypatch.setattr(baidupan, 'get_remote_index', lambda: index)
+    metrics = MetricsRecorder(str(tmp_path / 'metrics.jsonl'))
+    monkeypatch.setattr(baidupan, 'get_metrics', lambda: metrics)
+    cache = FingerprintCache(cache_path=str(tmp_path / 'cache.json'))
+
+    files = []
+    for i, size in enumerate([MIN_CHUNK_SIZE + 10, 2000, 3000]):
+        path = tmp_path / f'video{i} [id{i}].mp4'
+        path.write_bytes(os.urandom(size))
+        files.append({'videoId': f'id{i}', 'localPath': str(path)})
+    files.insert(1, {'videoId': 'missing', 'localPath': str(tmp_path / 'missing.mp4')})
+    cancelled = threading.Event()
+    cancelled.set()
+
+    with MockBaiduServer() as server:
+        uploader = server.configure(BaiduPanUploader('token', chunk_size=MIN_CHUNK_SIZE, fingerprint_cache=cache))
+        monkeypatch.setattr(baidupan, '_uploaders', {'token': uploader})
+        # 开始上传每个文件时，其秒传摘要已在上一个文件上传期间算好，分片MD5列表则留到秒传未命中后再算
+        prefetched = []
+        upload_file = uploader.upload_file
+
+        def tracking_upload_file(local_path, **kwargs):
+            prefetched.append((cache.get_digest(local_path) is not None,
+                               cache.get(local_path, MIN_CHUNK_SIZE) is not None))
+            return upload_file(local_path, **kwargs)
+
+        uploader.upload_file = tracking_upload_file
+        reported = []
+        started = []
+        summary = handle_upload_batch(files, 'token', cancel_events=[None, None, None, cancelled],
+                                      on_result=lambda i, result: reported.append((i, result['status'])),
+                                      on_start=started.append)
+
+    assert reported == [(0, 'success'), (1, 'error'), (2, 'success'), (3, 'cancelled')]
+    # 缺失和已取消的文件没有开始上传
+    assert started == [0, 2]
+    assert summary['status'] == 'partial'
+    assert (summary['succeeded'], summary['failed']) == (2, 2)
+    assert prefetched == [(True, False), (True, False)]
+    assert index.get('id0') and index.get('id1') and index.get('id2') is None
+
+
+def test_scheduler_runs_upload_batch_in_one_call():
+    messages = []
+    batches = []
+
+    statuses = []
+
+    def upload_batch_fn(jobs, on_result, on_start):
+        batches.append([job.video_id for job in jobs])
+        for job in jobs:
+            on_start(job)
+            # 开始上传的文件为上传中，批内其余文件仍在排队
+            statuses.append([j.status for j in jobs])
+            on_result(job, {'status': 'success', 'fs_id': 1, 'path': f'/apps/{job.video_id}'})
+
+    scheduler = JobScheduler(lambda job, on_progress: '', lambda job: {}, messages.append,
+                             upload_batch_fn=upload_batch_fn)
+    jobs = scheduler.submit_upload_batch([{'videoId': v, 'localPath': f'/tmp/{v}.mp4'} for v in 'abc'])
+    scheduler.shutdown()
+
+    assert batches == [['a', 'b', 'c']]
+    assert statuses == [
+        ['uploading', 'queued', 'queued'],
+        ['completed', 'uploading', 'queued'],
+        ['completed', 'completed', 'uploading'],
+    ]
+    assert [job.status for job in jobs] == ['completed'] * 3
+    assert {m['jobId'] for m in messages} == {job.job_id for job in jobs}
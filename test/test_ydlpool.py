@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+YoutubeDL实例池测试：同配置复用实例、不同配置分开，租用互斥，钩子只在租用期间生效
+"""
+
+import os
+import sys
+import time
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+yt_dlp = pytest.importorskip('yt_dlp')
+
+from core.ydlpool import YoutubeDLPool
+
+
+class StubYDL:
+    """YoutubeDL替身：保存选项和下载前后的后处理器，可模拟下载过程"""
+
+    def __init__(self, params):
+        self.params = params
+        self.pps = {'before_dl': [], 'after_move': []}
+        self.closed = False
+
+    def add_post_processor(self, pp, when='post_process'):
+        self.pps[when].append(pp)
+
+    def simulate_download(self, info):
+        for pp in self.pps['before_dl']:
+            pp.run(info)
+        for hook in self.params['progress_hooks']:
+            hook({'status': 'finished', 'filename': info['id']})
+        for pp in self.pps['after_move']:
+            pp.run(dict(info, filepath=info['id']))
+
+    def close(self):
+        self.closed = True
+
+    # 后处理器报告进度时调用
+    def evaluate_outtmpl(self, tmpl, info):
+        return ''
+
+    def to_console_title(self, *args, **kwargs):
+        pass
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    monkeypatch.setattr(yt_dlp, 'YoutubeDL', StubYDL)
+    pool = YoutubeDLPool(max_per_profile=2)
+    yield pool
+    pool.close()
+
+
+def test_same_profile_reuses_instance(pool):
+    with pool.acquire({'format': 'best'}) as first:
+        pass
+    # 进度钩子不属于配置档
+    with pool.acquire({'format': 'best', 'progress_hooks': [print]}) as second:
+        pass
+    with pool.acquire({'format': 'bestaudio'}) as other:
+        pass
+
+    assert second is first
+    assert other is not first
+    assert other.params['format'] == 'bestaudio'
+
+
+def test_leases_are_exclusive(pool):
+    in_use = set()
+    instances = set()
+    lock = threading.Lock()
+    errors = []
+
+    def worker():
+        for _ in range(5):
+            with pool.acquire({'format': 'best'}) as ydl:
+                with lock:
+                    if id(ydl) in in_use:
+                        errors.append('instance leased twice')
+                    in_use.add(id(ydl))
+                    instances.add(id(ydl))
+                time.sleep(0.002)
+                with lock:
+                    in_use.discard(id(ydl))
+
+    threads = [threading.Thread(target=worker) for _ in range(6)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert errors == []
+    # 超过上限的租用者等待归还，而不是新建实例
+    assert len(instances) == 2
+
+
+def test_hooks_only_apply_during_lease(pool):
+    calls = []
+    with pool.acquire({'format': 'best'}, [lambda d: calls.append(('progress1', d['filename']))],
+                      [lambda info: calls.append(('before1', info['id']))],
+                      [lambda info: calls.append(('after1', info['filepath']))]) as ydl:
+        ydl.simulate_download({'id': 'a'})
+    assert calls == [('before1', 'a'), ('progress1', 'a'), ('after1', 'a')]
+
+    # 归还后钩子已解绑
+    calls.clear()
+    ydl.simulate_download({'id': 'b'})
+    assert calls == []
+
+    # 下一个租用者只看到自己的钩子
+    with pool.acquire({'format': 'best'}, [lambda d: calls.append(('progress2', d['filename']))]) as again:
+        assert again is ydl
+        again.simulate_download({'id': 'c'})
+    assert calls == [('progress2', 'c')]
+
+
+def test_close_releases_instances(pool):
+    with pool.acquire({'format': 'best'}) as leased:
+        with pool.acquire({'format': 'best'}) as idle:
+            pass
+        pool.close()
+        assert idle.closed and not leased.closed
+    # 关闭时租用中的实例在归还时关闭
+    assert leased.closed
+    with pytest.raises(RuntimeError):
+        with pool.acquire({'format': 'best'}):
+            pass